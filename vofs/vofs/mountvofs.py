@@ -42,6 +42,10 @@ def mountvofs():
     parser.add_option("--max_flush_threads", action="store", type=int,
                       help="upper limit on number of flush (upload) threads",
                       default=10)
+    parser.add_option("--nstreams", action="store", type=int, default=1,
+                      help="number of segments of a large file uploaded in parallel by each flush thread")
+    parser.add_option("--content_encoding", action="store", default=None,
+                      help="compress flushes on the wire with gzip or zstd where the service allows it")
     parser.add_option("--secure_get", action="store_true", default=False,
                       help="Ensure HTTPS instead of HTTP is used to retrieve data (slower)")
     parser.add_option("--nothreads", help="Only run in a single thread, causes some blocking.", action="store_true")
@@ -102,7 +106,8 @@ def mountvofs():
         fuse = MyFuse(VOFS(root, opt.cache_dir, opt, conn=conn,
                          cache_limit=opt.cache_limit, cache_nodes=opt.cache_nodes,
                          cache_max_flush_threads=opt.max_flush_threads,
-                         secure_get=opt.secure_get),
+                         secure_get=opt.secure_get, nstreams=opt.nstreams,
+                         content_encoding=opt.content_encoding),
                     mount,
                     fsname=root,
                     volname=root,
@@ -119,7 +124,8 @@ def mountvofs():
         fuse = MyFuse(VOFS(root, opt.cache_dir, opt, conn=conn,
                          cache_limit=opt.cache_limit, cache_nodes=opt.cache_nodes,
                          cache_max_flush_threads=opt.max_flush_threads,
-                         secure_get=opt.secure_get),
+                         secure_get=opt.secure_get, nstreams=opt.nstreams,
+                         content_encoding=opt.content_encoding),
                     mount,
                     fsname=root,
                     nothreads=opt.nothreads,
@@ -357,23 +357,20 @@ class TestVOFS(unittest.TestCase):
         testfs = vofs.VOFS(self.testMountPoint, self.testCacheDir, opt)
 
         # Get the attributes from vospace.
-        node = Object()
         testfs.cache.getAttr = Mock(return_value=None)
-        node.attr = "attributes"
-        testfs.getNode = Mock(return_value=node)
+        testfs.client = Object()
+        testfs.client.get_attr = Mock(return_value="attributes")
         self.assertEqual(testfs.getattr("vos:/a/file/path"), "attributes")
-        testfs.getNode.assert_called_once_with(
-            "vos:/a/file/path", limit=0, force=False)
+        testfs.client.get_attr.assert_called_once_with("vos:/a/file/path")
         testfs.cache.getAttr.assert_called_once_with("vos:/a/file/path")
 
         # Get attributes from a file modified in the cache.
         testfs.cache.getAttr.reset_mock()
-        testfs.getNode.reset_mock()
-        self.assertFalse(testfs.getNode.called)
+        testfs.client.get_attr.reset_mock()
         testfs.cache.getAttr = Mock(return_value="different")
         self.assertEqual(testfs.getattr("vos:/a/file/path2"), "different")
         testfs.cache.getAttr.assert_called_once_with("vos:/a/file/path2")
-        self.assertFalse(testfs.getNode.called)
+        self.assertFalse(testfs.client.get_attr.called)
 
     @unittest.skipIf(skipTests, "Individual tests")
     def test_unlink(self):
@@ -469,31 +466,23 @@ class TestVOFS(unittest.TestCase):
         path = "/a/file/path"
         testfs = vofs.VOFS(self.testMountPoint, self.testCacheDir, opt)
         testfs.client = Object()
-        node = Object()
-        node.node_list = []
-        node.name = "testNode"
-        testfs.client.get_node = Mock(return_value=node)
-        self.assertEqual(testfs.readdir(path, None), ['.', '..'])
-
-        # Try again with a timeout
-        # TODO how to cause a thread read timeout?
-        # testfs.condition.wait = Mock(side_effect=CacheRetry("test"))
-        # foo = testfs.readdir(path, None)
-        # with self.assertRaises(FuseOSError) as e:
-        #     testfs.readdir(path, None)
-        # self.assertEqual(e.exception.errno, EAGAIN)
-
-    @unittest.skipIf(skipTests, "Individual tests")
-    def test_loaddir(self):
-        path = "/a/file/path"
-        testfs = vofs.VOFS(self.testMountPoint, self.testCacheDir, opt)
-        testfs.client = Object()
-        node = Object()
-        node.node_list = Mock(return_value=())
-        testfs.condition.notify_all = Mock(wraps=testfs.condition.notify_all)
-        testfs.client.get_node = Mock(return_value=node)
-        testfs.load_dir(path)
-        testfs.condition.notify_all.assert_called_once_with()
+        testfs.client.nodeCache = NodeCache()
+        testfs.client.scandir = Mock(return_value=iter([]))
+        self.assertEqual(list(testfs.readdir(path, None)), ['.', '..'])
+        testfs.client.scandir.assert_called_once_with(path)
+
+        entry1 = Object()
+        entry1.name = "child1"
+        entry1.uri = "vos:/a/file/path/child1"
+        entry2 = Object()
+        entry2.name = "child2"
+        entry2.uri = "vos:/a/file/path/child2"
+        testfs.client.scandir = Mock(return_value=iter([entry1, entry2]))
+        entries = testfs.readdir(path, None)
+        self.assertEqual(next(entries), '.')
+        self.assertEqual(list(entries), ['..', 'child1', 'child2'])
+        # the entries are kept for getattr
+        self.assertIs(entry2, testfs.client.nodeCache[entry2.uri])
 
     @unittest.skipIf(skipTests, "Individual tests")
     def test_chmod(self):
@@ -885,6 +874,8 @@ class TestMyIOProxy(unittest.TestCase):
             client.copy = Mock(return_value=12345)
             vofsObj = Mock()
             vofsObj.client = client
+            vofsObj.nstreams = 1
+            vofsObj.content_encoding = 'gzip'
             node = Object
             node.uri = "vos:/dir1/dir2/file"
             node.props = {"MD5": 12345}
@@ -895,7 +886,8 @@ class TestMyIOProxy(unittest.TestCase):
                 testProxy.cacheFile = testFileHandle
                 self.assertEqual(testProxy.writeToBacking(), 12345)
             client.copy.assert_called_once_with(
-                testCache.dataDir + "/dir1/dir2/file", node.uri, send_md5=True)
+                testCache.dataDir + "/dir1/dir2/file", node.uri, send_md5=True, nstreams=1,
+                content_encoding='gzip')
 
     # @unittest.skipIf(skipTests, "Individual tests")
     def testReadFromBacking(self):
@@ -917,6 +909,7 @@ class TestMyIOProxy(unittest.TestCase):
             vos_VOFILE.read = Mock(side_effect=mock_read)
             vos_VOFILE.close = Mock()
             client.open = Mock(return_value=vos_VOFILE)
+            client.scheduler = Mock()
             path = "/dir1/dir2/file"
             myVofs = Mock()
             myVofs.cacheFile = Mock()
@@ -1022,6 +1015,7 @@ class TestMyIOProxy(unittest.TestCase):
         vos_VOFILE.read = MagicMock(side_effect=side_effect)
         vos_VOFILE.close = Mock()
         client.open = Mock(return_value=vos_VOFILE)
+        client.scheduler = Mock()
         myVofs = Mock()
         myVofs.client = client
         testProxy = vofs.MyIOProxy(myVofs, None)
@@ -14,6 +14,9 @@ from os import O_RDONLY, O_WRONLY, O_RDWR, O_APPEND
 from .CadcCache import Cache, CacheCondition, CacheRetry, CacheAborted, \
     IOProxy, FlushNodeQueue, CacheError
 from vos.logExceptions import logExceptions
+from vos.chunking import ChunkSizer, iter_content
+from vos.pool import POOL_SIZE
+from vos.scheduler import DOWNLOAD, INTERACTIVE
 import logging
 
 logger = logging.getLogger('vofs')
@@ -23,6 +26,10 @@ if sys.version_info[1] > 6:
 
 __all__ = ['VOFS', 'HandleWrapper', 'MyIOProxy']
 
+# largest chunk written to the cache at once, readers waiting on a block are woken after each chunk
+MAX_READ_CHUNK = 2 ** 20
+READ_CONNECTIONS = 10  # connections kept for the files read at once, besides those of the flushes
+
 def flag2mode(flags):
     md = {O_RDONLY: 'r', O_WRONLY: 'w', O_RDWR: 'w+'}
     m = md[flags & (O_RDONLY | O_WRONLY | O_RDWR)]
@@ -48,6 +55,8 @@ class MyIOProxy(IOProxy):
         self.md5 = None
         self.path = path
         self.condition = CacheCondition(None)
+        # sizes the chunks read into the cache, kept from one read of the file to the next
+        self.sizer = ChunkSizer(Cache.IO_BLOCK_SIZE, minimum=Cache.IO_BLOCK_SIZE, maximum=MAX_READ_CHUNK)
 
     def __str__(self):
         return "Path:{0}  Size:{1}  MD5:{2}  condition:{3}".format(self.path,
@@ -63,7 +72,9 @@ class MyIOProxy(IOProxy):
         logger.debug("PUSHING %s to VOSpace @ %s" % (self.cacheFile.cacheDataFile, self.cacheFile.path))
         logger.debug("opening a new vo file for {0}".format(self.cacheFile.path))
         dest_uri = self.vofs.get_node(self.cacheFile.path).uri
-        foo = self.vofs.client.copy(self.cacheFile.cacheDataFile, dest_uri, send_md5=True)
+        foo = self.vofs.client.copy(self.cacheFile.cacheDataFile, dest_uri, send_md5=True,
+                                    nstreams=self.vofs.nstreams, content_encoding=self.vofs.content_encoding)
+        logger.debug("PUSHED {0}: {1}".format(self.cacheFile.path, getattr(self.vofs.client, 'transfer_stats', None)))
         return foo
         # return self.vofs.client.copy(self.cacheFile.cacheDataFile, dest_uri, send_md5=True)
 
@@ -104,6 +115,7 @@ class MyIOProxy(IOProxy):
                 # and it failed, so now we can try the full URL
                 # list. If it still fails let the error propagate
                 # to client
+                self.vofs.client.invalidate_node_url(self.cacheFile.path)
                 self.lastVOFile = self.vofs.client.open(
                     self.cacheFile.path, mode=os.O_RDONLY, view="data",
                     size=size, byte_range=byte_range, full_negotiation=True, possible_partial_read=True)
@@ -114,7 +126,12 @@ class MyIOProxy(IOProxy):
                 logger.debug("Got info: {0}".format(info))
                 self.cacheFile.setHeader(info[0], info[1])
 
-            for buff in resp.iter_content(block_size):
+            if block_size != self.sizer.minimum:
+                # chunks must stay multiples of the block size of the cache
+                self.sizer = ChunkSizer(block_size, minimum=block_size, maximum=max(block_size, MAX_READ_CHUNK))
+            for buff in iter_content(resp, self.sizer):
+                # somebody is waiting on these bytes, they go ahead of the flushes of the rate limited transfers
+                self.vofs.client.scheduler.acquire(len(buff), DOWNLOAD, INTERACTIVE)
                 try:
                     self.writeToCache(buff, offset)
                 except CacheAborted as ca:
@@ -129,7 +146,8 @@ class MyIOProxy(IOProxy):
             self.lastVOFile.close()
             self.lastVOFile = None
 
-        logger.debug("Wrote: %d bytes to cache for %s" % (offset, self.cacheFile.path))
+        logger.debug("Wrote: %d bytes to cache for %s in chunks of %d bytes" % (offset, self.cacheFile.path,
+                                                                               self.sizer.size))
 
     def get_md5(self):
         if self.md5 is None:
@@ -213,19 +231,19 @@ class VOFS(Operations):
 
     def __init__(self, root, cache_dir, options, conn=None,
                  cache_limit=1024, cache_nodes=False,
-                 cache_max_flush_threads=10, secure_get=False):
+                 cache_max_flush_threads=10, secure_get=False, nstreams=1, content_encoding=None):
         """Initialize the VOFS.
 
         cache_limit is in MB.
+        nstreams is the number of segments of a large file pushed to VOSpace at once.
+        content_encoding compresses the flushes on the wire ('gzip' or 'zstd'), None uses the vos configuration.
         The style here is to use dictionaries to contain information
         about the Node.  The full VOSpace path is used as the Key for
         most of these dictionaries."""
 
         self.cache_nodes = cache_nodes
-
-        # Standard attributes of the Node
-        # Where in the file system this Node is currently located
-        self.loading_dir = {}
+        self.nstreams = nstreams
+        self.content_encoding = content_encoding
 
         # Command line options.
         self.opt = options
@@ -247,6 +265,9 @@ class VOFS(Operations):
             e.filename = root
             e.strerror = getattr(e, 'strerror', 'failed while making mount')
             raise e
+        # every flush thread sends nstreams segments at once
+        self.client.conn.set_pool_size(max(POOL_SIZE,
+                                           cache_max_flush_threads * max(1, nstreams) + READ_CONNECTIONS))
 
         # Create a condition variable to get rid of those nasty sleeps
         self.condition = CacheCondition(lock=None, timeout=VOFS.cacheTimeout)
@@ -408,7 +429,7 @@ class VOFS(Operations):
         # Try to get the attributes from the cache first. This will only return
         # a result if the files has been modified and not flushed to vospace.
         attr = self.cache.getAttr(path)
-        return attr is not None and attr or self.getNode(path, limit=0, force=False).attr
+        return attr is not None and attr or self.client.get_attr(path)
 
     def init(self, path):
         """Called on filesystem initialization. (Path is always /)
@@ -566,36 +587,18 @@ class VOFS(Operations):
 
     @logExceptions()
     def readdir(self, path, file_id):
-        """Send a list of entries in this directory"""
-        logger.debug("Getting directory list for {0}".format(path))
-        # reading from VOSpace can be slow, we'll do this in a thread
-        from six.moves import _thread
-        with self.condition:
-            if not self.loading_dir.get(path, False):
-                self.loading_dir[path] = True
-                _thread.start_new_thread(self.load_dir, (path, ))
-
-            while self.loading_dir.get(path, False):
-                logger.debug("Waiting ... ")
-                self.condition.wait()
-        return ['.', '..'] + [e.name for e in self.getNode(path,
-                                                           force=False,
-                                                           limit=None).node_list]
+        """Send a list of entries in this directory
 
-    @logExceptions()
-    def load_dir(self, path):
-        """Load the dirlist from VOSpace.
-
-        This should always be run in a thread."""
-        try:
-            logger.debug("Starting getNodeList thread")
-            node_list = self.getNode(path, force=True, limit=None).node_list
-            logger.debug("Got listing {0} for {1}".format(node_list, path))
-        finally:
-            self.loading_dir[path] = False
-            with self.condition:
-                self.condition.notify_all()
-        return
+        The entries are handed over as the listing is read from VOSpace, a large directory starts to show
+        before all of it has arrived.  They are cached for getattr, as compact entries rather than Nodes.
+        """
+        logger.debug("Getting directory list for {0}".format(path))
+        yield '.'
+        yield '..'
+        for entry in self.client.scandir(path):
+            with self.client.nodeCache.watch(entry.uri) as watch:
+                watch.insert(entry)
+            yield entry.name
 
     @logExceptions()
     def flush(self, path, file_id):
@@ -668,7 +671,7 @@ class VOFS(Operations):
         logger.debug("Got properties: {0}".format(node.props))
         sfs = {'f_bsize': block_size, 'f_frsize': block_size, 'f_blocks': int(n_bytes / block_size),
                'f_bfree': int(free / block_size), 'f_bavail': int(free / block_size),
-               'f_files': len(node.node_list), 'f_ffree': 2 * 10, 'f_favail': 2 * 10, 'f_flags': 0,
+               'f_files': node.child_count(), 'f_ffree': 2 * 10, 'f_favail': 2 * 10, 'f_flags': 0,
                'f_namemax': 256}
         return sfs
 
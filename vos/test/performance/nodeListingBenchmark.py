@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Time the construction of the Node of a container listing, per child.
+
+usage:
+    PYTHONPATH=../.. python nodeListingBenchmark.py --children 10000 --children 100000
+"""
+from __future__ import print_function
+
+import optparse
+import time
+from xml.etree import ElementTree
+
+from vos.vos import Node
+
+CONTAINER = ("<vos:node xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance' "
+             "xmlns:vos='http://www.ivoa.net/xml/VOSpace/v2.0' uri='vos://cadc.nrc.ca!vospace/dir' "
+             "xsi:type='vos:ContainerNode'><vos:properties>"
+             "<vos:property uri='ivo://ivoa.net/vospace/core#date'>2017-01-01T00:00:00.000</vos:property>"
+             "<vos:property uri='ivo://ivoa.net/vospace/core#length'>0</vos:property>"
+             "</vos:properties><vos:nodes>{0}</vos:nodes></vos:node>")
+CHILD = ("<vos:node uri='vos://cadc.nrc.ca!vospace/dir/file{0}' xsi:type='vos:DataNode'><vos:properties>"
+         "<vos:property uri='ivo://ivoa.net/vospace/core#date'>2017-01-{1:02d}T00:00:{2:02d}.000</vos:property>"
+         "<vos:property uri='ivo://ivoa.net/vospace/core#length'>{0}</vos:property>"
+         "<vos:property uri='ivo://ivoa.net/vospace/core#MD5'>d41d8cd98f00b204e9800998ecf8427e</vos:property>"
+         "<vos:property uri='ivo://ivoa.net/vospace/core#creator'>CN=someone,OU=cadc,O=hia,C=ca</vos:property>"
+         "</vos:properties></vos:node>")
+
+
+def per_child(seconds, children):
+    return "{0:8.2f} us/child".format(seconds / children * 1e6)
+
+
+def benchmark(children):
+    document = CONTAINER.format(''.join([CHILD.format(i, i % 28 + 1, i % 60) for i in range(children)]))
+    element = ElementTree.fromstring(document)
+
+    start = time.time()
+    node = Node(element)
+    constructed = time.time()
+    names = [child.name for child in node.node_list]
+    listed = time.time()
+    nlink = node.attr['st_nlink']
+    counted = time.time()
+    sizes = [child.attr['st_size'] for child in node.node_list]
+    stated = time.time()
+    assert nlink == children + 2 and len(names) == len(sizes) == children
+
+    print("{0} children".format(children))
+    print("  container Node       {0}".format(per_child(constructed - start, children)))
+    print("  child Nodes          {0}".format(per_child(listed - constructed, children)))
+    print("  container st_nlink   {0}".format(per_child(counted - listed, children)))
+    print("  child attributes     {0}".format(per_child(stated - counted, children)))
+
+
+def main():
+    parser = optparse.OptionParser(description='nodeListingBenchmark.py')
+    parser.add_option("--children", type='int', action='append',
+                      help='Number of children of the container, may be repeated (default 10000 and 100000)')
+    opt, args = parser.parse_args()
+    for children in opt.children or [10000, 100000]:
+        benchmark(children)
+
+
+if __name__ == '__main__':
+    main()
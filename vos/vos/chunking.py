@@ -0,0 +1,149 @@
+"""Pick the size of the chunks a stream is read in from how the stream behaves.
+
+A fixed chunk size is a compromise: small chunks spend their time in per-call overhead (a Python loop
+iteration, a write, a hash update, an fsync in the vofs cache) while large ones hold up whoever waits for the
+first bytes and waste memory on slow links.  A ChunkSizer starts from a given size and after every chunk looks
+at how long it took to read and process:
+
+- a chunk that took longer than SLOW_FACTOR times TARGET_TIME halves the size;
+- a chunk that took less than TARGET_TIME doubles it, unless the throughput measured at the current size is no
+  better than at half of it (the overhead is already amortised) or the doubled size was measured to be slower.
+
+Sizes stay powers of two times the starting size, so callers that need block aligned chunks can rely on it.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import threading
+import time
+
+from requests.packages.urllib3.exceptions import HTTPError
+from requests.packages.urllib3.response import HTTPResponse
+
+MIN_CHUNK = 2 ** 14  # smallest chunk a sizer goes down to (16 KiB)
+MAX_CHUNK = 2 ** 23  # largest chunk a sizer goes up to (8 MiB)
+TARGET_TIME = 0.1  # seconds a chunk should take to read and process
+SLOW_FACTOR = 4  # chunks slower than this many times TARGET_TIME shrink the size
+GAIN = 1.1  # a doubling has to improve the throughput by this factor to be worth it
+SMOOTHING = 0.5  # weight of the newest measurement in the throughput kept for each size
+
+
+class ChunkSizer(object):
+    """The adaptive chunk size of one stream, or of several streams reading the same kind of data.
+
+    usage:
+        sizer = ChunkSizer(2 ** 19)
+        for chunk in iter_content(response, sizer):
+            fout.write(chunk)
+        logger.debug("read {0} chunks, ended at {1} bytes".format(sizer.chunks, sizer.size))
+    """
+
+    def __init__(self, size=MIN_CHUNK, minimum=MIN_CHUNK, maximum=MAX_CHUNK):
+        """
+        :param size: the size of the first chunk.
+        :type size: int
+        :param minimum: the size never goes below this.
+        :type minimum: int
+        :param maximum: the size never goes above this.
+        :type maximum: int
+        """
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.size = min(self.maximum, max(self.minimum, size))
+        self.chunks = 0
+        self.nbytes = 0
+        self.elapsed = 0.0
+        self.largest = self.size
+        self._throughput = {}
+        self._lock = threading.Lock()
+
+    def record(self, nbytes, seconds, requested=None):
+        """Record a chunk of nbytes that took seconds to read and process and adjust the size.
+
+        :param nbytes: the length of the chunk.
+        :param seconds: the time from asking for the chunk to asking for the next one.
+        :param requested: the size the chunk was asked for, defaults to the current size.
+        """
+        with self._lock:
+            self._record(nbytes, seconds, requested is None and self.size or requested)
+
+    def _record(self, nbytes, seconds, requested):
+        self.chunks += 1
+        self.nbytes += nbytes
+        self.elapsed += seconds
+        if nbytes < requested or requested != self.size:
+            # the end of the stream, or a chunk read before the last adjustment, says nothing about the size
+            return
+        rate = nbytes / max(seconds, 1e-6)
+        current = self._throughput.get(self.size)
+        current = current is None and rate or (1 - SMOOTHING) * current + SMOOTHING * rate
+        self._throughput[self.size] = current
+        if seconds > SLOW_FACTOR * TARGET_TIME:
+            self._resize(self.size // 2)
+        elif seconds < TARGET_TIME:
+            smaller = self._throughput.get(self.size // 2)
+            bigger = self._throughput.get(self.size * 2)
+            if (smaller is None or current > GAIN * smaller) and (bigger is None or bigger > current):
+                self._resize(self.size * 2)
+
+    def _resize(self, size):
+        if self.minimum <= size <= self.maximum:
+            self.size = size
+            self.largest = max(self.largest, size)
+
+    @property
+    def mean(self):
+        """The average length of the chunks recorded so far."""
+        return self.chunks and self.nbytes // self.chunks or self.size
+
+
+def iter_content(response, sizer, decode=True):
+    """Iterate over the body of a streamed requests response in chunks sized by sizer.
+
+    Like response.iter_content, but the size is picked again before every read.  A response not backed by a
+    urllib3 stream is iterated with response.iter_content at the current size.  Reading the urllib3 stream
+    directly skips the wrapping requests does, so a dropped or truncated body is raised here as an IOError
+    (EIO) rather than as a urllib3 error.
+
+    :param response: a response returned with stream=True.
+    :param sizer: the ChunkSizer of the stream.
+    :param decode: undo the Content-Encoding (gzip, deflate) of the response, else return the bytes as sent.
+    """
+    raw = getattr(response, 'raw', None)
+    if isinstance(raw, HTTPResponse):
+        chunks = _read_raw(raw, sizer, decode)
+    elif decode:
+        chunks = response.iter_content(chunk_size=sizer.size)
+    else:
+        chunks = iter(lambda: response.raw.read(sizer.size), b'')
+    return _timed(chunks, sizer)
+
+
+def _read_raw(raw, sizer, decode):
+    while True:
+        try:
+            chunk = raw.read(sizer.size, decode_content=decode)
+        except HTTPError as ex:
+            raise IOError(errno.EIO, "Error reading response body: {0}".format(ex))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_file(fileobj, sizer):
+    """Iterate over the rest of an open binary file in chunks sized by sizer."""
+    return _timed(iter(lambda: fileobj.read(sizer.size), b''), sizer)
+
+
+def _timed(chunks, sizer):
+    start = time.time()
+    requested = sizer.size
+    for chunk in chunks:
+        if not chunk:
+            continue
+        yield chunk
+        now = time.time()
+        sizer.record(len(chunk), now - start, requested)
+        start = now
+        requested = sizer.size
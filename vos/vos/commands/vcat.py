@@ -9,17 +9,54 @@ import logging
 from vos.commonparser import CommonParser
 from vos import vos, version
 
+CAT_CHUNK = 2 ** 20  # bytes written to stdout at a time, the reader fetches the next ones meanwhile
 
-def _cat(vospace_uri, cert_filename=None):
-    """Cat out the given uri."""
+
+def _parse_range(value):
+    """Turn a byte range a-b (b included, may be left out) into (start, end) with end excluded or None."""
+    try:
+        first, last = value.split('-', 1)
+        start = int(first)
+        end = last.strip() and int(last) + 1 or None
+    except ValueError:
+        raise ValueError("Invalid byte range {0}, expected a-b".format(value))
+    if start < 0 or (end is not None and end <= start):
+        raise ValueError("Invalid byte range {0}, expected a-b".format(value))
+    return start, end
+
+
+def _cat(vospace_uri, cert_filename=None, start=0, end=None):
+    """Cat out the given uri.
+
+    The file is copied to stdout in CAT_CHUNK blocks.  A VOSpace file is read with a DataReader, which reads the
+    next blocks in the background while one is written, and a byte range is requested with an HTTP Range.
+
+    :param vospace_uri: the VOSpace node or local file to cat.
+    :param cert_filename: the certificate to connect to VOSpace with.
+    :param start: the offset of the first byte to write.
+    :param end: the offset to stop at, None for the end of the file.
+    """
 
     fh = None
     try:
         if vospace_uri[0:4] == "vos:":
-            fh = vos.Client(vospace_certfile=cert_filename).open(vospace_uri, view='data')
+            fh = vos.Client(vospace_certfile=cert_filename).open_reader(vospace_uri, end=end)
         else:
-            fh = open(vospace_uri, 'r')
-        sys.stdout.write(fh.read())
+            fh = open(vospace_uri, 'rb')
+        if start > 0:
+            fh.seek(start)
+        remaining = None
+        if end is not None:
+            remaining = end - start
+        fout = getattr(sys.stdout, 'buffer', sys.stdout)
+        while remaining is None or remaining > 0:
+            buff = fh.read(remaining is None and CAT_CHUNK or min(CAT_CHUNK, remaining))
+            if not buff:
+                break
+            fout.write(buff)
+            if remaining is not None:
+                remaining -= len(buff)
+        fout.flush()
     finally:
         if fh:
             fh.close()
@@ -31,6 +68,9 @@ def vcat():
 
     parser = CommonParser(usage, description=description)
     parser.add_option("-q", help="run quietly, exit on error without message", action="store_true")
+    parser.add_option("--head", type="int", default=None, help="write only the first HEAD bytes")
+    parser.add_option("--range", default=None,
+                      help="write only the bytes a-b (b included, a- for the rest of the file)")
 
     (opt, args) = parser.parse_args()
     parser.process_informational_options()
@@ -38,13 +78,26 @@ def vcat():
     if not len(args) > 0:
         parser.error("no argument given")
 
+    start, end = 0, None
+    if opt.range is not None:
+        if opt.head is not None:
+            parser.error("--head and --range can not be combined")
+        try:
+            start, end = _parse_range(opt.range)
+        except ValueError as ex:
+            parser.error(str(ex))
+    elif opt.head is not None:
+        if opt.head < 0:
+            parser.error("--head needs a positive number of bytes")
+        end = opt.head
+
     logger = logging.getLogger()
 
     exit_code = 0
 
     for uri in args:
         try:
-            _cat(uri, cert_filename=opt.certfile)
+            _cat(uri, cert_filename=opt.certfile, start=start, end=end)
         except Exception as e:
             exit_code = getattr(e, 'errno', -1)
             if not opt.q:
@@ -6,6 +6,8 @@ from __future__ import (absolute_import, division, print_function,
 import traceback
 
 from vos import md5_cache
+from vos import pool
+from vos import tls
 from vos import vos
 from vos.commonparser import CommonParser
 from vos.vos import EndPoints
@@ -26,6 +28,8 @@ import traceback
 import time
 from cadcutils import exceptions
 
+NEGOTIATION_BATCH = 100  # files of a directory whose transfers are negotiated together
+
 
 def signal_handler(signum, frame):
     raise KeyboardInterrupt("SIGINT signal handler. {0} {1}".format(signum, frame))
@@ -37,7 +41,8 @@ def vcp():
 
     parser = CommonParser("%prog filename vos:rootNode/destination",
                           description=("Copy a file or directory (always recursive) to a "
-                                       "VOSpace location.  Try to be UNIX like. "))
+                                       "VOSpace location.  Try to be UNIX like.  A filename of - "
+                                       "uploads what is read from stdin. "))
     parser.add_option("--exclude", default=None, help="exclude files that match pattern")
     parser.add_option("--include", default=None, help="only include files that match pattern (overrides exclude)")
     parser.add_option("-i", "--interrogate", action="store_true", help="Ask before overwriting files")
@@ -52,10 +57,32 @@ def vcp():
                       default=False)
     parser.add_option("--ignore", action="store_true", default=False,
                       help="ignore errors and continue with recursive copy")
+    parser.add_option("--nstreams", type=int, default=1,
+                      help="Number of byte ranges to download, or segments to upload (see segmented_uploads in "
+                           "the configuration), in parallel for large files (default: 1)")
+    parser.add_option("--resume", action="store_true", default=False,
+                      help="Keep a journal of partial downloads and resume them, rather than restarting, on retry")
+    parser.add_option("--content-encoding", dest="content_encoding", default=None,
+                      help="Compress the data on the wire with gzip or zstd where the service allows it, "
+                           "identity to send it as is")
+    parser.add_option("--compressed", default=None,
+                      help="The VOSpace file is stored compressed with gzip or zstd: compress on upload, "
+                           "decompress on download")
+    parser.add_option("--cutouts", default=None,
+                      help="Read more sources, one per line, from this file: hundreds of cutouts of a few "
+                           "files are copied to a local directory faster as a batch")
+    parser.add_option("--cutout-threads", dest="cutout_threads", type=int, default=vos.CUTOUT_THREADS,
+                      help="Number of cutouts copied to a local directory at once (default: %default)")
 
     (opt, args) = parser.parse_args()
     parser.process_informational_options()
 
+    if opt.cutouts is not None:
+        with open(opt.cutouts) as cutouts:
+            dest = args.pop()
+            args.extend([line.strip() for line in cutouts if line.strip()])
+            args.append(dest)
+
     if len(args) < 2:
         parser.error("Must give a source and a destination")
 
@@ -68,6 +95,8 @@ def vcp():
     client = vos.Client(vospace_certfile=opt.certfile,
                         vospace_token=opt.token,
                         transfer_shortcut=opt.quick)
+    # keep a connection per stream, and per cutout fetched at once, alive from one file to the next
+    client.conn.set_pool_size(max(pool.POOL_SIZE, opt.nstreams, opt.cutout_threads))
 
     exit_code = 0
 
@@ -195,6 +224,112 @@ def vcp():
             return glob.glob(pathname)
 
 
+    def negotiate(source_dir, destination_dir, filenames, overwrite=False):
+        """Negotiate the transfers of the files of a directory together, client.copy then reuses the URLs.
+
+        Unless overwriting, files already at the destination are left out as their copy may well be skipped.
+        """
+        if source_dir[0:4] == 'vos:' and destination_dir[0:4] == 'vos:':
+            # copies inside VOSpace are done by the service, or negotiated as they go
+            return
+        if source_dir[0:4] == 'vos:':
+            children = dict([(child.name, child) for child in get_node(source_dir, limit=None).iter_children()])
+            uris = [os.path.join(source_dir, filename) for filename in filenames
+                    if filename in children and children[filename].type == 'vos:DataNode' and
+                    (overwrite or not os.path.exists(os.path.join(destination_dir, filename)))]
+            method = 'GET'
+        elif destination_dir[0:4] == 'vos:':
+            existing = set(not overwrite and listdir(destination_dir) or [])
+            uris = [os.path.join(destination_dir, filename) for filename in filenames
+                    if os.path.isfile(os.path.join(source_dir, filename)) and filename not in existing]
+            method = 'PUT'
+        else:
+            return
+        # a single file gains nothing from being negotiated ahead
+        if len(uris) > 1:
+            client.get_node_urls(uris, method=method)
+
+
+    def wanted(source_name, destination_name, exclude=None, include=None, interrogate=False, overwrite=False):
+        """Check that the file source_name can be copied to destination_name and should be.
+
+        :return: False if the destination is already up to date or excluded
+        :raise e: if the destination exists and the user does not want it overwritten, or its directory is missing
+        """
+        if interrogate:
+            if access(destination_name, os.F_OK):
+                sys.stderr.write("File %s exists.  Overwrite? (y/n): " % destination_name)
+                ans = sys.stdin.readline().strip()
+                if ans != 'y':
+                    raise Exception("File exists")
+
+        if not overwrite and access(destination_name, os.F_OK):
+            ### check if the MD5 of dest and source mathc, if they do then skip
+            if get_md5(destination_name) == get_md5(source_name):
+                logging.info("%s matches %s, skipping" % (source_name, destination_name))
+                return False
+
+        if not access(os.path.dirname(destination_name), os.F_OK):
+            raise OSError(errno.EEXIST, "vcp: ContainerNode %s does not exist" % os.path.dirname(destination_name))
+
+        if not isdir(os.path.dirname(destination_name)) and not islink(os.path.dirname(destination_name)):
+            raise OSError(errno.ENOTDIR,
+                          "vcp: %s is not a ContainerNode or LinkNode" % os.path.dirname(destination_name))
+
+        skip = False
+        if exclude is not None:
+            for thisIgnore in exclude.split(','):
+                if not destination_name.find(thisIgnore) < 0:
+                    skip = True
+                    continue
+
+        if include is not None:
+            skip = True
+            for thisIgnore in include.split(','):
+                if not destination_name.find(thisIgnore) < 0:
+                    skip = False
+                    continue
+
+        if not skip:
+            logging.info("%s -> %s " % (source_name, destination_name))
+        return not skip
+
+    def retry_copy(source_name, destination_name, ignore=False):
+        """Copy the file source_name to destination_name, trying again after I/O errors.
+
+        :raise e: the error of the copy, unless ignore is set and it is given up on
+        """
+        global exit_code
+        niters = 0
+        while True:
+            try:
+                logging.debug("Starting call to copy")
+                client.copy(source_name, destination_name, send_md5=True,
+                            nstreams=opt.nstreams, resume=opt.resume,
+                            content_encoding=opt.content_encoding, compressed=opt.compressed)
+                logging.debug("Call to copy returned")
+                break
+            except Exception as client_exception:
+                logging.debug("{}".format(client_exception))
+                if getattr(client_exception, 'errno', -1) == 104:
+                    # 104 is connection reset by peer.  Try again on this error
+                    logging.warning(str(client_exception))
+                    exit_code = getattr(client_exception, 'errno', -1)
+                elif getattr(client_exception, 'errno', -1) == errno.EIO:
+                    # retry on IO errors
+                    logging.warning("{0}: Retrying".format(client_exception))
+                    pass
+                elif ignore:
+                    if niters > 100:
+                        logging.error("%s (skipping after %d attempts)" % (str(client_exception), niters))
+                        break
+                    else:
+                        logging.error("%s (retrying)" % str(client_exception))
+                        time.sleep(5)
+                        niters += 1
+                else:
+                    raise client_exception
+
     def copy(source_name, destination_name, exclude=None, include=None, interrogate=False, overwrite=False, ignore=False):
         """
 
@@ -204,7 +339,6 @@ def vcp():
         :param include:
         :return: :raise e:
         """
-        global exit_code
         ## determine if this is a directory we are copying so need to be recursive
         try:
             if not opt.follow_links and islink(source_name):
@@ -216,77 +350,16 @@ def vcp():
                 if not isdir(destination_name):
                     mkdir(destination_name)
                 ## for all files in the current source directory copy them to the destination directory
-                for filename in listdir(source_name):
-                    logging.debug("%s -> %s" % (filename, source_name))
-                    copy(os.path.join(source_name, filename), os.path.join(destination_name, filename),
-                         exclude, include, interrogate, overwrite, ignore)
-            else:
-                if interrogate:
-                    if access(destination_name, os.F_OK):
-                        sys.stderr.write("File %s exists.  Overwrite? (y/n): " % destination_name)
-                        ans = sys.stdin.readline().strip()
-                        if ans != 'y':
-                            raise Exception("File exists")
-
-                if not overwrite and access(destination_name, os.F_OK):
-                    ### check if the MD5 of dest and source mathc, if they do then skip
-                    if get_md5(destination_name) == get_md5(source_name):
-                        logging.info("%s matches %s, skipping" % (source_name, destination_name))
-                        return
-
-                if not access(os.path.dirname(destination_name), os.F_OK):
-                    raise OSError(errno.EEXIST, "vcp: ContainerNode %s does not exist" % os.path.dirname(destination_name))
-
-                if not isdir(os.path.dirname(destination_name)) and not islink(os.path.dirname(destination_name)):
-                    raise OSError(errno.ENOTDIR,
-                                  "vcp: %s is not a ContainerNode or LinkNode" % os.path.dirname(destination_name))
-
-                skip = False
-                if exclude is not None:
-                    for thisIgnore in exclude.split(','):
-                        if not destination_name.find(thisIgnore) < 0:
-                            skip = True
-                            continue
-
-                if include is not None:
-                    skip = True
-                    for thisIgnore in include.split(','):
-                        if not destination_name.find(thisIgnore) < 0:
-                            skip = False
-                            continue
-
-                if not skip:
-                    logging.info("%s -> %s " % (source_name, destination_name))
-                niters = 0
-                while not skip:
-                    try:
-                        logging.debug("Starting call to copy")
-                        client.copy(source_name, destination_name, send_md5=True)
-                        logging.debug("Call to copy returned")
-                        break
-                    except Exception as client_exception:
-                        logging.debug("{}".format(client_exception))
-                        if getattr(client_exception, 'errno', -1) == 104:
-                            # 104 is connection reset by peer.  Try again on this error
-                            logging.warning(str(client_exception))
-                            exit_code = getattr(client_exception, 'errno', -1)
-                        elif getattr(client_exception, 'errno', -1) == errno.EIO:
-                            # retry on IO errors
-                            logging.warning("{0}: Retrying".format(client_exception))
-                            pass
-                        elif ignore:
-                            if niters > 100:
-                                logging.error("%s (skipping after %d attempts)" % (str(client_exception), niters))
-                                skip = True
-                            else:
-                                logging.error("%s (retrying)" % str(client_exception))
-                                time.sleep(5)
-                                niters += 1
-                        else:
-                            raise client_exception
-                    except Exception as ex:
-                        logging.debug("{}".format(ex))
-                        raise
+                filenames = listdir(source_name)
+                for start in range(0, len(filenames), NEGOTIATION_BATCH):
+                    batch = filenames[start:start + NEGOTIATION_BATCH]
+                    negotiate(source_name, destination_name, batch, overwrite)
+                    for filename in batch:
+                        logging.debug("%s -> %s" % (filename, source_name))
+                        copy(os.path.join(source_name, filename), os.path.join(destination_name, filename),
+                             exclude, include, interrogate, overwrite, ignore)
+            elif wanted(source_name, destination_name, exclude, include, interrogate, overwrite):
+                retry_copy(source_name, destination_name, ignore)
 
         except OSError as os_exception:
             logging.debug(str(os_exception))
@@ -299,15 +372,25 @@ def vcp():
 
     # main loop
     try:
+        # cutouts copied into a local directory are fetched together once every source is known
+        batch = []
         for source_pattern in args:
+            if source_pattern == '-':
+                # upload what is piped in, the destination must name the node to create
+                if dest[0:4] != 'vos:' or dest[-1] == '/' or isdir(dest):
+                    raise Exception("vcp - needs the name of a VOSpace file to write to, not {0}".format(dest))
+                logging.info("stdin -> {0}".format(dest))
+                client.copy(getattr(sys.stdin, 'buffer', sys.stdin), dest, send_md5=True,
+                            content_encoding=opt.content_encoding, compressed=opt.compressed)
+                continue
             # define this empty cutout string.  Then we strip possible cutout strings off the end of the
             # pattern before matching.  This allows cutouts on the vos service.
             # The shell does pattern matching for local files, so don't run glob on local files.
+            cutout = None
             if source_pattern[0:4] != "vos:":
                 sources = [source_pattern]
             else:
                 cutout_match = cutout_pattern.search(source_pattern)
-                cutout = None
                 if cutout_match is not None:
                     source_pattern = cutout_match.group(1)
                     cutout = cutout_match.group('cutout')
@@ -331,10 +414,6 @@ def vcp():
                     logging.info("{}: Skipping (symbolic link)".format(source))
                     continue
 
-                # copying inside VOSpace not yet implemented
-                if source[0:4] == 'vos:' and dest[0:4] == 'vos:':
-                    raise Exception("Can not (yet) copy from VOSpace to VOSpace.")
-
                 this_destination = dest
                 if isdir(source):
                     if not opt.follow_links and islink(source) :
@@ -355,9 +434,24 @@ def vcp():
                 elif dest[-1] == '/' or isdir(dest):
                     # we're copying into a directory
                     this_destination = os.path.join(dest, os.path.basename(source))
+                    if cutout is not None and dest[0:4] != "vos:":
+                        if wanted(source, this_destination, exclude=opt.exclude, include=opt.include,
+                                  interrogate=opt.interrogate, overwrite=opt.overwrite):
+                            batch.append((source, this_destination))
+                        continue
                 copy(source, this_destination, exclude=opt.exclude, include=opt.include,
                      interrogate=opt.interrogate, overwrite=opt.overwrite, ignore=opt.ignore)
 
+        if len(batch) > 0:
+            logging.info("Copying {0} cutouts to {1}".format(len(batch), dest))
+            results = client.get_cutouts(batch, nthreads=opt.cutout_threads)
+            for source, this_destination in batch:
+                result = results.get(this_destination)
+                if isinstance(result, Exception):
+                    # the failed cutouts are copied again one by one, the way single copies are retried
+                    logging.warning("{0}: {1}, copying it again".format(source, result))
+                    retry_copy(source, this_destination, ignore=opt.ignore)
+
     except KeyboardInterrupt as ke:
         logging.info("Received keyboard interrupt. Execution aborted...\n")
         exit_code = getattr(ke, 'errno', -1)
@@ -376,4 +470,5 @@ def vcp():
             logging.error(message)
         exit_code = getattr(e, 'errno', -1)
 
+    logging.debug("Connections per host: {0}, TLS: {1}".format(client.conn.pool_stats(), tls.SESSIONS.stats()))
     sys.exit(exit_code)
@@ -3,6 +3,7 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import errno
+import itertools
 import logging
 import math
 from vos.commonparser import CommonParser
@@ -128,13 +129,50 @@ def vls():
                'size': size_format,
                'date': date_format}
 
+    def info_list(node):
+        """The (name, info) of the children of node as the listing arrives, or of node if it is not a container.
+
+        The info of the children is only worked out when it is shown or sorted on.
+        """
+        entries = client.scandir(node)
+        try:
+            first = next(entries)
+        except StopIteration:
+            return []
+        except OSError as ex:
+            if ex.errno != errno.ENOTDIR:
+                raise
+            return client.get_info_list(node)
+        detailed = sortKey or opt.long or opt.group
+        return ((entry.name, detailed and entry.get_info() or None) for entry in itertools.chain([first], entries))
+
     for node in args:
 
         try:
             if not node[0:4] == "vos:" :
                 raise OSError(errno.EBADF, "Invalid node name", node)
             logger.debug("getting listing of: %s" % str(node))
-            infoList = client.get_info_list(node)
+            infoList = info_list(node)
+
+            if sortKey:
+                try:
+                    sorted_list = sorted(infoList, key=lambda name: name[1][sortKey], reverse=not opt.reverse)
+                except:
+                    sorted_list = infoList
+                finally:
+                    infoList = sorted_list
+
+            for item in infoList:
+                name_string = item[0]
+                if opt.long or opt.group:
+                    for col in columns:
+                        value = item[1].get(col, None)
+                        value = value is not None and value or ""
+                        if col in formats:
+                            sys.stdout.write(formats[col](value))
+                    if item[1]["permissions"][0] == 'l':
+                        name_string = "%s -> %s" % (name_string, item[1]['target'])
+                sys.stdout.write("%s\n" % name_string)
         except SSLError as error:
             logger.error(str(error))
             sys.exit(errno.EPERM)
@@ -144,23 +182,3 @@ def vls():
             err_no = getattr(e, 'errno', None)
             err_no = err_no is not None and err_no or errno.ENOMSG
             sys.exit(err_no)
-
-        if sortKey:
-            try:
-                sorted_list = sorted(infoList, key=lambda name: name[1][sortKey], reverse=not opt.reverse)
-            except:
-                sorted_list = infoList 
-            finally:
-                infoList = sorted_list
- 
-        for item in infoList:
-            name_string = item[0]
-            if opt.long or opt.group:
-                for col in columns:
-                    value = item[1].get(col, None)
-                    value = value is not None and value or ""
-                    if col in formats:
-                        sys.stdout.write(formats[col](value))
-                if item[1]["permissions"][0] == 'l':
-                    name_string = "%s -> %s" % (name_string, item[1]['target'])
-            sys.stdout.write("%s\n" % name_string)
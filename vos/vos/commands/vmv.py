@@ -17,6 +17,7 @@ def vmv():
     signal.signal(signal.SIGINT, signal_handler)
     usage = """
     vmv vos:/root/node vos:/root/newNode   -- move node to newNode, if newNode is a container then moving node into newNode.
+    vmv vos:/root/node1 vos:/root/node2 vos:/root/container   -- move several nodes into container at once.
 
 Version: %s """ % (version.version)
 
@@ -32,7 +33,7 @@ Version: %s """ % (version.version)
     logger = logging.getLogger()
     logger.setLevel(parser.log_level)
 
-    if len(args) != 2:
+    if len(args) < 2:
         parser.error("You must supply a source and destination")
 
     try:
@@ -42,12 +43,17 @@ Version: %s """ % (version.version)
         logger.error("Connection failed:  %s" % (str(e)))
         sys.exit(e.__getattribute__('errno',-1))
 
-    source = args[0]
-    dest = args[1]
+    sources = args[:-1]
+    dest = args[-1]
 
     try:
-        logger.info("%s -> %s" % ( source, dest))
-        client.move(source, dest)
+        # start every move job, then wait for them together
+        moves = []
+        for source in sources:
+            logger.info("%s -> %s" % (source, dest))
+            moves.append(client.move(source, dest, wait=False))
+        for move in moves:
+            move.result()
     except KeyboardInterrupt:
         logger.error("Received keyboard interrupt. Execution aborted...\n")
         sys.exit(-1)
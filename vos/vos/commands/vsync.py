@@ -4,6 +4,7 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import hashlib
+import math
 import os
 import sys
 from multiprocessing import Process, JoinableQueue
@@ -12,7 +13,10 @@ import errno
 import logging
 import time
 import signal
-from vos import vos, version
+from six.moves.queue import Empty
+from vos import vos, version, scheduler, pool
+
+NEGOTIATION_BATCH = 10  # files taken from the queue, and negotiated together, by a stream at a time, at most
 
 
 def vsync():
@@ -33,6 +37,8 @@ def vsync():
     parser.add_option('--cache_nodes', action='store_true', help='cache node MD5 sum in an sqllite db')
     parser.add_option('--recursive', '-r', help="Do a recursive sync", action="store_true")
     parser.add_option('--nstreams', '-n', type=int, help="Number of streams to run (MAX: 30)", default=1)
+    parser.add_option('--bandwidth', type=float, default=None,
+                      help="Limit the aggregate bandwidth of all the streams to this many MB/s")
     parser.add_option('--exclude', help="ignore directories or files containing this pattern", default=None)
     parser.add_option('--include', help="only include files matching this pattern", default=None)
     parser.add_option('--overwrite', help="overwrite copy on server regardless of modification/size/md5 checks", action="store_true")
@@ -66,6 +72,9 @@ def vsync():
     ## Currently we don't create nodes in sync and we don't sync onto files
     logger.info("Connecting to VOSpace")
     client = vos.Client(vospace_certfile=opt.certfile, vospace_token=opt.token)
+    if opt.bandwidth is not None:
+        rates = client.scheduler.rates
+        client.scheduler.set_rates(opt.bandwidth * scheduler.MB, rates[scheduler.UPLOAD], rates[scheduler.DOWNLOAD])
     logger.info("Confirming Destination is a directory")
     destIsDir = client.isdir(dest)
 
@@ -119,71 +128,103 @@ def vsync():
             self.filesErrored = 0
 
         def run(self):
+            # each stream is a process with its own scheduler, give it its share of the bandwidth
+            self.client.scheduler.split(opt.nstreams)
+            # and its own connections, enough for the negotiations of a batch
+            self.client.conn.set_pool_size(max(pool.POOL_SIZE, vos.NEGOTIATION_THREADS))
             while True:
-                (src, dest) = self.queue.get()
-                requeue = (src, dest)
-                srcMD5 = None
-                stat = os.stat(src)
-                if not opt.ignore_checksum and not opt.overwrite:
-                    srcMD5 = fileMD5(src)
-                if not opt.overwrite:
-                    # Check if the file is the same
-                    try:
-                        nodeInfo = None
-                        if opt.cache_nodes:
-                            nodeInfo = md5Cache.get(dest)
-                        if nodeInfo is None:
-                            logger.debug("Getting node info from VOSpace")
-                            logger.debug(str(nodeDict.keys()))
-                            logger.debug(str(dest))
-                            node = self.client.get_node(dest, limit=None)
-                            destMD5 = node.props.get('MD5', 'd41d8cd98f00b204e9800998ecf8427e')
-                            destLength = node.attr['st_size']
-                            destTime = node.attr['st_ctime']
-                            if opt.cache_nodes:
-                                md5Cache.update(dest, destMD5, destLength, destTime)
-                        else:
-                            destMD5 = nodeInfo[0]
-                            destLength = nodeInfo[1]
-                            destTime = nodeInfo[2]
-                        logger.debug("Dest MD5: %s " % (destMD5))
-                        if (not opt.ignore_checksum and srcMD5 == destMD5) or (opt.ignore_checksum and destTime >= stat.st_mtime and destLength == stat.st_size) :
-                            logger.info("skipping: %s  matches %s" % (src, dest))
-                            self.filesSkipped += 1
-                            self.bytesSkipped += destLength
-                            self.queue.task_done()
-                            continue
-                    except (IOError, OSError) as node_error:
-                        """Ignore the erorr"""
-                        logger.debug(str(node_error))
-                        pass
-                logger.info("%s -> %s" % (src, dest))
+                # take what is waiting in the queue, up to a batch, so the uploads can be negotiated together,
+                # but no more than a share of it: the files taken wait for this stream while the others go idle
+                batch = [self.queue.get()]
                 try:
-                    self.client.copy(src, dest, send_md5=True)
+                    share = int(math.ceil((self.queue.qsize() + 1) / opt.nstreams))
+                except NotImplementedError:
+                    # the size of the queue is unknown on macOS
+                    share = 1
+                while len(batch) < min(NEGOTIATION_BATCH, share):
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except Empty:
+                        break
+                pending = []
+                for (src, dest) in batch:
+                    stat = os.stat(src)
+                    if self.matches(src, dest, stat):
+                        self.queue.task_done()
+                    else:
+                        pending.append((src, dest, stat))
+                if len(pending) > 1:
+                    self.client.get_node_urls([dest for (src, dest, stat) in pending], method='PUT')
+                for (src, dest, stat) in pending:
+                    self.send(src, dest, stat)
+                    self.queue.task_done()
+
+        def matches(self, src, dest, stat):
+            """Check if dest is already a copy of src, in which case it is skipped."""
+            if opt.overwrite:
+                return False
+            srcMD5 = None
+            if not opt.ignore_checksum:
+                srcMD5 = fileMD5(src)
+            # Check if the file is the same
+            try:
+                nodeInfo = None
+                if opt.cache_nodes:
+                    nodeInfo = md5Cache.get(dest)
+                if nodeInfo is None:
+                    logger.debug("Getting node info from VOSpace")
+                    logger.debug(str(nodeDict.keys()))
+                    logger.debug(str(dest))
                     node = self.client.get_node(dest, limit=None)
                     destMD5 = node.props.get('MD5', 'd41d8cd98f00b204e9800998ecf8427e')
                     destLength = node.attr['st_size']
                     destTime = node.attr['st_ctime']
                     if opt.cache_nodes:
-                           md5Cache.update(dest, destMD5, destLength, destTime)
-                    self.filesSent += 1
-                    self.bytesSent += stat.st_size
-                except (IOError, OSError) as e:
-                    logger.error("Error writing %s to server, skipping" % (src))
-                    logger.error(str(e))
-                    import re
-                    if re.search('NodeLocked',str(e)) != None:
-                        logger.error("Use vlock to unlock the node before syncing to %s." % (dest))
-                    try:
-                        if e.errno == 104:
-                            self.queue.put(requeue)
-                    except Exception as e2:
-                        logger.error("Error during requeue")
-                        logger.error(str(e2))
-                        pass
-                    self.filesErrored += 1
+                        md5Cache.update(dest, destMD5, destLength, destTime)
+                else:
+                    destMD5 = nodeInfo[0]
+                    destLength = nodeInfo[1]
+                    destTime = nodeInfo[2]
+                logger.debug("Dest MD5: %s " % (destMD5))
+                if (not opt.ignore_checksum and srcMD5 == destMD5) or (opt.ignore_checksum and destTime >= stat.st_mtime and destLength == stat.st_size) :
+                    logger.info("skipping: %s  matches %s" % (src, dest))
+                    self.filesSkipped += 1
+                    self.bytesSkipped += destLength
+                    return True
+            except (IOError, OSError) as node_error:
+                """Ignore the erorr"""
+                logger.debug(str(node_error))
+                pass
+            return False
+
+        def send(self, src, dest, stat):
+            requeue = (src, dest)
+            logger.info("%s -> %s" % (src, dest))
+            try:
+                self.client.copy(src, dest, send_md5=True)
+                node = self.client.get_node(dest, limit=None)
+                destMD5 = node.props.get('MD5', 'd41d8cd98f00b204e9800998ecf8427e')
+                destLength = node.attr['st_size']
+                destTime = node.attr['st_ctime']
+                if opt.cache_nodes:
+                       md5Cache.update(dest, destMD5, destLength, destTime)
+                self.filesSent += 1
+                self.bytesSent += stat.st_size
+            except (IOError, OSError) as e:
+                logger.error("Error writing %s to server, skipping" % (src))
+                logger.error(str(e))
+                import re
+                if re.search('NodeLocked',str(e)) != None:
+                    logger.error("Use vlock to unlock the node before syncing to %s." % (dest))
+                try:
+                    if e.errno == 104:
+                        self.queue.put(requeue)
+                except Exception as e2:
+                    logger.error("Error during requeue")
+                    logger.error(str(e2))
                     pass
-                self.queue.task_done()
+                self.filesErrored += 1
+                pass
 
 
     def mkdirs(dirs):
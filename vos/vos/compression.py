@@ -0,0 +1,148 @@
+"""Compress the data of a transfer on the fly.
+
+Catalogues and other text products often compress several times over, so sending them compressed saves most
+of the transfer.  There are two ways of doing it:
+
+- a transfer encoding: the bytes are only compressed on the wire.  An upload is sent with a Content-Encoding
+  header that the endpoint decodes before storing the data, a download asks for it with Accept-Encoding and
+  decodes what comes back.  The node keeps the original bytes so MD5s are computed on the decoded data.  An
+  endpoint that can not decode a request body answers 415 (RFC 7694), its host is then remembered in SUPPORT
+  and sent plain bytes from then on.
+- a compressed variant: the node stores the compressed bytes, e.g. a table.csv uploaded as table.csv.gz.  The
+  MD5 of the node is the MD5 of the compressed bytes, so that is what is checked, and a download of the
+  variant writes the decompressed data.
+
+gzip is always available, zstd needs the optional zstandard package.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import logging
+import threading
+import zlib
+
+from .health import host_of
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('vos')
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+IDENTITY = 'identity'
+
+GZIP_LEVEL = 6  # zlib's default trade off between speed and ratio
+ZSTD_LEVEL = 3  # zstandard's default level
+# status codes of an endpoint refusing the Content-Encoding of a request body
+ENCODING_NOT_SUPPORTED = (415,)
+
+
+def available():
+    """The encodings this installation can compress and decompress, the preferred one first."""
+    return zstandard is not None and [ZSTD, GZIP] or [GZIP]
+
+
+def check(encoding):
+    """Return encoding if it can be used, None for no encoding, raise an OSError otherwise.
+
+    :param encoding: 'gzip', 'zstd', 'identity' or None.
+    """
+    if encoding is None or encoding == '' or encoding == IDENTITY:
+        return None
+    if encoding not in available():
+        if encoding == ZSTD:
+            raise OSError(errno.EOPNOTSUPP, "zstd compression needs the zstandard package")
+        raise OSError(errno.EINVAL, "Unknown compression {0}, expected one of {1}".format(encoding, available()))
+    return encoding
+
+
+class Compressor(object):
+    """Compress a stream chunk by chunk."""
+
+    def __init__(self, encoding):
+        if check(encoding) == GZIP:
+            # a gzip header and trailer around the deflate stream
+            self._codec = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            self._codec = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self._codec.compress(bytes(data))
+
+    def flush(self):
+        return self._codec.flush()
+
+
+class Decompressor(object):
+    """Decompress a stream chunk by chunk."""
+
+    def __init__(self, encoding):
+        if check(encoding) == GZIP:
+            self._codec = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._codec = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data):
+        return self._codec.decompress(bytes(data))
+
+    def flush(self):
+        flush = getattr(self._codec, 'flush', None)
+        return flush is not None and flush() or b''
+
+
+def compress_chunks(chunks, encoding):
+    """Iterate over the compressed form of an iterator of chunks."""
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    data = compressor.flush()
+    if data:
+        yield data
+
+
+def decompress_chunks(chunks, encoding):
+    """Iterate over the decompressed form of an iterator of compressed chunks."""
+    decompressor = Decompressor(encoding)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+class EncodingSupport(object):
+    """The hosts known to refuse a Content-Encoding on the bodies of their requests.
+
+    usage:
+        if SUPPORT.accepts(url):
+            response = session.put(url, data=..., headers={'Content-Encoding': GZIP})
+            if response.status_code in ENCODING_NOT_SUPPORTED:
+                SUPPORT.refuse(url)
+    """
+
+    def __init__(self):
+        self.refused = set()
+        self.lock = threading.Lock()
+
+    def accepts(self, url):
+        """May a request body be sent to url with a Content-Encoding? Hosts are assumed to until they refuse."""
+        with self.lock:
+            return host_of(url) not in self.refused
+
+    def refuse(self, url):
+        """Record that the host of url does not decode request bodies."""
+        logger.debug("{0} does not accept encoded uploads".format(host_of(url)))
+        with self.lock:
+            self.refused.add(host_of(url))
+
+
+# the encodings accepted by the hosts, shared by every Client of this process
+SUPPORT = EncodingSupport()
@@ -0,0 +1,147 @@
+"""A local, size capped cache of cutouts.
+
+Analyses are often run again over the same cutouts of the same images, and each run made the service compute
+every cutout again.  The cutouts written by a Client are kept in a directory and reused while the file they
+were cut from is unchanged: an entry is keyed by the node URI, its MD5 property and the normalized cutout, so
+a new version of the file gets new entries.  The least recently used entries are removed once the cache grows
+beyond its size.  The cache is off unless given a size: the MD5 of the key costs a node lookup per cutout.
+
+The directory may be shared by the users of a host, it must then be writable by all of them and the cutouts
+cached by one are read by the others: only share it between users allowed to read the same data.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+
+logger = logging.getLogger('vos')
+
+MB = 1024 * 1024
+DEFAULT_DIR = os.path.join(os.getenv('HOME', '.'), '.cache', 'vos', 'cutouts')
+DEFAULT_SIZE = 0  # bytes of cutouts kept, 0 disables the cache: it is turned on with cutout_cache_size
+
+
+def normalize(cutout):
+    """The canonical form of a cutout, so that spellings of the same cutout share an entry.
+
+    [1][ 100:200, 100:200] becomes [1][100:200,100:200] and CIRCLE ICRS 10.50 -20.1 0.010 becomes
+    CIRCLE ICRS 10.5 -20.1 0.01.
+    """
+    cutout = cutout.strip()
+    if cutout.startswith('['):
+        cutout = re.sub(r'\s+', '', cutout)
+        # drop the + signs and leading zeros of the pixel numbers
+        return re.sub(r'(?<![\d.])\+?0*(\d)', r'\1', cutout)
+    words = []
+    for word in cutout.split():
+        try:
+            words.append(repr(float(word)))
+        except ValueError:
+            words.append(word.upper())
+    return ' '.join(words)
+
+
+class CutoutCache(object):
+    """Cutout files in a directory, evicted least recently used first.
+
+    usage:
+        cache = CutoutCache()
+        key = cache.key(uri, node.props['MD5'], '[1][100:200,100:200]')
+        if cache.get(key, 'cutout.fits') is None:
+            ... write the cutout to cutout.fits ...
+            cache.put(key, 'cutout.fits')
+    """
+
+    def __init__(self, cache_dir=DEFAULT_DIR, max_size=DEFAULT_SIZE):
+        """
+        :param cache_dir: the directory holding the cutouts, created when the first one is cached.
+        :type cache_dir: str
+        :param max_size: the bytes of cutouts kept, 0 disables the cache.
+        :type max_size: int
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    @staticmethod
+    def key(uri, md5, cutout):
+        """The key of a cutout of the version of uri whose MD5 is md5."""
+        return hashlib.sha1('\n'.join([uri, md5, normalize(cutout)]).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key, destination):
+        """Copy the cutout cached under key to destination.
+
+        :return: the size of the cutout, or None if it is not cached.
+        """
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            shutil.copyfile(path, destination)
+            # now the most recently used
+            os.utime(path, None)
+        except (IOError, OSError) as ex:
+            if getattr(ex, 'errno', None) != errno.ENOENT:
+                logger.debug("Failed to read cached cutout {0}: {1}".format(path, ex))
+            return None
+        logger.debug("Cutout {0} read from the cache".format(key))
+        return os.stat(destination).st_size
+
+    def put(self, key, filename):
+        """Cache a copy of the cutout in filename under key, then evict what no longer fits."""
+        if not self.enabled:
+            return
+        if os.stat(filename).st_size > self.max_size:
+            return
+        # written under a hidden name and renamed, so a reader never sees a partial cutout
+        partial = os.path.join(self.cache_dir, '.{0}.{1}.{2}'.format(key, os.getpid(),
+                                                                      threading.current_thread().ident))
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            shutil.copyfile(filename, partial)
+            os.rename(partial, self.path(key))
+        except (IOError, OSError) as ex:
+            logger.debug("Failed to cache cutout {0}: {1}".format(filename, ex))
+            if os.path.exists(partial):
+                os.remove(partial)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used cutouts until the cache fits in max_size."""
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # evicted by another process
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+            entries.sort()
+            total = sum(size for mtime, size, path in entries)
+            for mtime, size, path in entries:
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
@@ -0,0 +1,303 @@
+"""Fetch a VOSpace DataNode as a set of byte ranges retrieved concurrently.
+
+A single streaming GET is limited to one TCP stream.  RangeDownload splits the
+file into byte ranges, fetches them with a pool of threads spread across the
+endpoint URLs supplied by the transfer negotiation and writes each range into
+a preallocated destination file with positional writes.
+
+A TransferJournal records the ranges that have reached the destination file in
+a small sidecar file so an interrupted download only fetches the missing pieces
+when it is retried.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import json
+import logging
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+from .chunking import ChunkSizer, iter_content
+from .scheduler import BULK, DOWNLOAD
+
+logger = logging.getLogger('vos')
+
+RANGE_SIZE = 2 ** 26  # size of each byte range requested (64 MiB)
+READ_CHUNK = 512 * 1024  # size of the first blocks read from the range responses, adapted as they arrive
+JOURNAL_INTERVAL = 2 ** 24  # record progress in the journal every 16 MiB of a range
+RANGES = 'ranges'  # the method of a download fetched as byte ranges in TransferStats
+
+
+def byte_ranges(size, range_size=RANGE_SIZE, start=0):
+    """Split the bytes [start, size) into consecutive ranges.
+
+    :param size: total number of bytes in the file.
+    :param range_size: maximum number of bytes in a range.
+    :param start: first byte to include.
+    :return: list of (first, last) tuples, both inclusive as in a HTTP Range header.
+    """
+    if range_size < 1:
+        raise ValueError("range_size must be positive: {0}".format(range_size))
+    return [(first, min(first + range_size, size) - 1)
+            for first in range(start, size, range_size)]
+
+
+def merge_ranges(ranges):
+    """Merge overlapping and adjacent (first, last) ranges.
+
+    :param ranges: iterable of (first, last) inclusive ranges.
+    :return: sorted list of disjoint [first, last] ranges.
+    """
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged
+
+
+class TransferJournal(object):
+    """Sidecar record of the byte ranges of a download already written to the destination.
+
+    The journal is only trusted if it describes the same version of the source (same MD5 and size) and
+    the destination file still exists, otherwise the download starts from scratch.
+
+    usage:
+        journal = TransferJournal('/tmp/big.fits', md5, size)
+        for first, last in journal.missing():
+            # fetch and write the bytes, then
+            journal.add(first, last)
+        journal.remove()
+    """
+    SUFFIX = '.vos-journal'
+
+    def __init__(self, destination, md5, size):
+        """
+        :param destination: the local file being downloaded.
+        :param md5: the MD5 of the source node, identifies the version being downloaded.
+        :param size: the size of the source node in bytes.
+        """
+        self.destination = destination
+        self.path = destination + TransferJournal.SUFFIX
+        self.md5 = md5
+        self.size = int(size)
+        self.ranges = []
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.access(self.path, os.F_OK):
+            return
+        try:
+            with open(self.path, 'r') as fin:
+                record = json.load(fin)
+            if (record.get('md5') == self.md5 and record.get('size') == self.size and
+                    os.access(self.destination, os.F_OK)):
+                self.ranges = merge_ranges(record.get('ranges', []))
+                logger.debug("Resuming {0}: {1} of {2} bytes already transferred".format(
+                    self.destination, self.completed(), self.size))
+            else:
+                logger.debug("Journal {0} is for a different version of the file, ignoring it".format(self.path))
+        except (IOError, OSError, ValueError) as ex:
+            logger.debug("Unable to read journal {0}: {1}".format(self.path, ex))
+
+    def add(self, first, last):
+        """Record bytes first to last (inclusive) as written and persist the journal."""
+        with self.lock:
+            self.ranges = merge_ranges(self.ranges + [[first, last]])
+            self._persist()
+
+    def _persist(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fout:
+            json.dump({'md5': self.md5, 'size': self.size, 'ranges': self.ranges}, fout)
+        os.rename(tmp_path, self.path)
+
+    def completed(self):
+        """Number of bytes already written to the destination."""
+        return sum([last - first + 1 for first, last in self.ranges])
+
+    def missing(self):
+        """The (first, last) ranges of the file that have not been written yet."""
+        gaps = []
+        start = 0
+        for first, last in self.ranges:
+            if first > start:
+                gaps.append((start, first - 1))
+            start = max(start, last + 1)
+        if start < self.size:
+            gaps.append((start, self.size - 1))
+        return gaps
+
+    def remove(self):
+        """Remove the journal, the download is complete or must restart from scratch."""
+        with self.lock:
+            self.ranges = []
+            if os.access(self.path, os.F_OK):
+                os.remove(self.path)
+
+
+class RangeDownload(object):
+    """Download a file by fetching byte ranges in parallel.
+
+    usage:
+        RangeDownload(session, urls, '/tmp/big.fits', size, nstreams=4).run()
+    """
+
+    def __init__(self, session, urls, destination, size, nstreams=4,
+                 range_size=RANGE_SIZE, timeout=(2, 5), journal=None, scheduler=None, priority=BULK):
+        """
+        :param session: the requests session used for the GETs.
+        :param urls: the endpoint URLs that serve the file, ranges are spread across these.
+        :type urls: [str]
+        :param destination: local file to write into.
+        :type destination: str
+        :param size: the size of the file in bytes.
+        :type size: int
+        :param nstreams: maximum number of ranges fetched at the same time.
+        :type nstreams: int
+        :param range_size: number of bytes requested per range.
+        :type range_size: int
+        :param timeout: (connect, read) timeouts passed to each GET, or a function giving them for the URL of the GET,
+        such as EndpointSelector.timeout.
+        :param journal: records completed ranges; only the ranges missing from the journal are fetched.
+        :type journal: TransferJournal
+        :param scheduler: the TransferScheduler that limits the bandwidth of the download.
+        :param priority: the scheduler priority of the download.
+        """
+        if not urls:
+            raise OSError(errno.EINVAL, "No URLs to download {0} from".format(destination))
+        self.session = session
+        self.urls = list(urls)
+        self.destination = destination
+        self.size = int(size)
+        self.nstreams = max(1, int(nstreams))
+        self.range_size = range_size
+        self.timeout = timeout
+        self.journal = journal
+        self.scheduler = scheduler
+        self.priority = priority
+        # shared by the ranges, so each range starts from the size the previous ones settled on
+        self.sizer = ChunkSizer(READ_CHUNK)
+        self._fd = None
+        self._write_lock = threading.Lock()
+
+    def ranges(self):
+        """The byte ranges that still need to be fetched for this download."""
+        if self.journal is None:
+            return byte_ranges(self.size, self.range_size)
+        ranges = []
+        for first, last in self.journal.missing():
+            ranges.extend(byte_ranges(last + 1, self.range_size, start=first))
+        return ranges
+
+    def run(self):
+        """Fetch all ranges into the destination file.
+
+        :return: the size of the destination file.
+        """
+        ranges = self.ranges()
+        self._fd = os.open(self.destination, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self._preallocate()
+            if len(ranges) == 0:
+                return self.size
+            pool = ThreadPool(min(self.nstreams, len(ranges)))
+            try:
+                # map re-raises the first exception raised by a range fetch.
+                pool.map(self._fetch, list(enumerate(ranges)), chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+            os.fsync(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+        return self.size
+
+    def _preallocate(self):
+        """Size the destination file before any range lands in it."""
+        os.ftruncate(self._fd, self.size)
+        if self.size > 0 and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(self._fd, 0, self.size)
+            except OSError as ex:
+                # not all filesystems support fallocate, the truncate is enough.
+                logger.debug("posix_fallocate failed on {0}: {1}".format(self.destination, ex))
+
+    def _record(self, first, last):
+        """Mark bytes first to last as written in the journal, once they are on disk."""
+        if self.journal is None or last < first:
+            return
+        if hasattr(os, 'fdatasync'):
+            os.fdatasync(self._fd)
+        else:
+            os.fsync(self._fd)
+        self.journal.add(first, last)
+
+    def _pwrite(self, data, offset):
+        """Write data at offset in the destination file."""
+        if hasattr(os, 'pwrite'):
+            view = memoryview(data)
+            while len(view) > 0:
+                written = os.pwrite(self._fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self._write_lock:
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                os.write(self._fd, data)
+
+    def _fetch(self, args):
+        """Fetch one range, trying each endpoint URL in turn starting with the one assigned to this range.
+
+        The error of the last URL is raised as an IOError (EIO) if it is not one already, so callers only have
+        to catch IOError and OSError.
+        """
+        index, byte_range = args
+        error = None
+        for i in range(len(self.urls)):
+            url = self.urls[(index + i) % len(self.urls)]
+            try:
+                return self._fetch_range(url, byte_range)
+            except Exception as ex:
+                logger.debug("Failed to GET bytes {0}-{1} from {2}: {3}".format(byte_range[0], byte_range[1], url, ex))
+                error = ex
+        if not isinstance(error, (IOError, OSError)):
+            error = IOError(errno.EIO, "Failed to GET bytes {0}-{1}: {2}".format(byte_range[0], byte_range[1], error))
+        raise error
+
+    def _fetch_range(self, url, byte_range):
+        first, last = byte_range
+        headers = {'Range': 'bytes={0}-{1}'.format(first, last)}
+        timeout = callable(self.timeout) and self.timeout(url) or self.timeout
+        response = self.session.get(url, headers=headers, timeout=timeout, stream=True)
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise OSError(errno.EOPNOTSUPP, "{0} does not support byte range requests".format(url))
+            offset = first
+            recorded = first
+            try:
+                for chunk in iter_content(response, self.sizer):
+                    if chunk:
+                        if offset + len(chunk) > last + 1:
+                            raise OSError(errno.EIO, "{0} returned more than bytes {1}-{2}".format(url, first, last))
+                        if self.scheduler is not None:
+                            self.scheduler.acquire(len(chunk), DOWNLOAD, self.priority)
+                        self._pwrite(chunk, offset)
+                        offset += len(chunk)
+                        if offset - recorded >= JOURNAL_INTERVAL:
+                            self._record(recorded, offset - 1)
+                            recorded = offset
+            finally:
+                self._record(recorded, offset - 1)
+            if offset != last + 1:
+                raise OSError(errno.EIO, "Short read from {0}: got bytes {1}-{2} of {1}-{3}".format(
+                    url, first, offset - 1, last))
+        finally:
+            response.close()
+        return last - first + 1
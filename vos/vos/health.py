@@ -0,0 +1,194 @@
+"""Keep score of how well the storage endpoints returned by a transfer negotiation perform.
+
+A transfer negotiation can return several endpoint URLs for the same data.  Trying them in the order the
+service lists them means a slow or half-dead storage node keeps being the first choice.  The EndpointSelector
+remembers, per host, the time to the first byte, the throughput and the recent errors seen by every transfer
+in this process.  It orders URL lists by that history and can race the best two URLs, keeping whichever
+answers first, when it has yet to learn about one of them.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import logging
+import math
+import threading
+import time
+
+from six.moves import queue
+from six.moves.urllib.parse import urlparse
+
+logger = logging.getLogger('vos')
+
+DEFAULT_TIMEOUT = (2, 5)  # (connect, read) timeouts of a GET from a host with no history
+MAX_READ_TIMEOUT = 60  # upper limit of the read timeout allowed to a slow host
+SMOOTHING = 0.3  # weight of the newest measurement in the running averages
+ERROR_PENALTY = 30.0  # seconds added to the score of a host for each recent error
+ERROR_MEMORY = 300.0  # seconds for the penalty of an error to decay by a factor e
+REFERENCE_SIZE = 2 ** 23  # bytes used to turn a throughput into seconds when scoring
+
+
+def host_of(url):
+    """The host:port part of url, hosts are scored rather than individual URLs."""
+    return urlparse(url).netloc
+
+
+class HostHealth(object):
+    """Running averages of the latency and throughput of one host and a decaying count of its errors."""
+
+    def __init__(self):
+        self.latency = None
+        self.throughput = None
+        self.errors = 0.0
+        self.last_error = None
+
+    def error_weight(self, now=None):
+        """The number of recent errors, each fading away with a time constant of ERROR_MEMORY."""
+        if self.last_error is None:
+            return 0.0
+        now = now is None and time.time() or now
+        return self.errors * math.exp(-(now - self.last_error) / ERROR_MEMORY)
+
+    def score(self, now=None):
+        """Estimated seconds to fetch REFERENCE_SIZE bytes from the host, plus the penalty of its errors."""
+        score = self.latency or 0.0
+        if self.throughput:
+            score += REFERENCE_SIZE / self.throughput
+        return score + ERROR_PENALTY * self.error_weight(now)
+
+    def __str__(self):
+        return "latency: {0} throughput: {1} errors: {2:.2f}".format(self.latency, self.throughput,
+                                                                     self.error_weight())
+
+
+def _average(old, new):
+    if old is None:
+        return new
+    return (1 - SMOOTHING) * old + SMOOTHING * new
+
+
+class EndpointSelector(object):
+    """Order and race endpoint URLs using the history of the hosts that serve them.
+
+    usage:
+        selector = EndpointSelector()
+        url, response = selector.race(session, selector.order(urls)[:2])
+        ... read the response ...
+        selector.record_transfer(url, nbytes, elapsed)
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def health(self, url):
+        """The HostHealth of the host serving url."""
+        host = host_of(url)
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostHealth()
+            return self.hosts[host]
+
+    def record_latency(self, url, seconds):
+        """Record the time a request to url took to start returning data."""
+        health = self.health(url)
+        with self.lock:
+            health.latency = _average(health.latency, seconds)
+            if health.last_error is not None:
+                # a host that answers is forgiven one error, the decay so far is now part of the count
+                now = time.time()
+                health.errors = max(0.0, health.error_weight(now) - 1)
+                health.last_error = now
+
+    def record_transfer(self, url, nbytes, seconds):
+        """Record nbytes read from url in seconds."""
+        if seconds <= 0 or nbytes <= 0:
+            return
+        health = self.health(url)
+        with self.lock:
+            health.throughput = _average(health.throughput, nbytes / seconds)
+
+    def record_failure(self, url):
+        """Record a failed request to url."""
+        health = self.health(url)
+        with self.lock:
+            now = time.time()
+            health.errors = health.error_weight(now) + 1
+            health.last_error = now
+        logger.debug("{0} failed, {1}".format(host_of(url), health))
+
+    def order(self, urls):
+        """Return urls sorted from the most to the least promising host.
+
+        Hosts with no history score 0 so they get tried, URLs with the same score keep their order.
+        """
+        now = time.time()
+        return sorted(urls, key=lambda url: self.health(url).score(now))
+
+    def known(self, url):
+        """Whether there is a history of the host serving url."""
+        health = self.health(url)
+        return health.latency is not None or health.last_error is not None
+
+    def timeout(self, url):
+        """(connect, read) timeouts for a GET of url, the read timeout stretches for hosts known to be slow."""
+        latency = self.health(url).latency
+        if latency is None:
+            return DEFAULT_TIMEOUT
+        return DEFAULT_TIMEOUT[0], min(MAX_READ_TIMEOUT, max(DEFAULT_TIMEOUT[1], 4 * latency))
+
+    def race(self, session, urls, **kwargs):
+        """Start a streaming GET of each of urls at once and return the first to deliver a good response.
+
+        The responses of the slower URLs are closed as they arrive, their latency and errors are still recorded.
+        Each GET loaded on a storage node is a cost to it, so once every host has a history the URLs are not raced,
+        the best of them is the only one fetched.
+
+        :param session: the requests session to GET with.
+        :param urls: the URLs to race, normally the first two of an ordered list.
+        :param kwargs: passed to session.get.
+        :return: (url, response) of the winner
+        """
+        if len(urls) == 0:
+            raise ValueError("No URLs to race")
+        if len([url for url in urls if not self.known(url)]) == 0:
+            urls = self.order(urls)[:1]
+        results = queue.Queue()
+        state = {'winner': None}
+        lock = threading.Lock()
+
+        def get(url):
+            start = time.time()
+            try:
+                response = session.get(url, stream=True, timeout=self.timeout(url), **kwargs)
+                response.raise_for_status()
+            except Exception as ex:
+                logger.debug("GET {0} failed: {1}".format(url, ex))
+                self.record_failure(url)
+                results.put((url, None, ex))
+                return
+            self.record_latency(url, time.time() - start)
+            with lock:
+                if state['winner'] is None:
+                    state['winner'] = url
+                    results.put((url, response, None))
+                    return
+            logger.debug("{0} lost the race to {1}".format(url, state['winner']))
+            response.close()
+
+        if len(urls) == 1:
+            get(urls[0])
+        else:
+            for url in urls:
+                thread = threading.Thread(target=get, args=(url,))
+                thread.daemon = True
+                thread.start()
+        error = None
+        for _ in urls:
+            url, response, error = results.get()
+            if response is not None:
+                return url, response
+        raise error
+
+
+# the selector shared by every Client of this process
+SELECTOR = EndpointSelector()
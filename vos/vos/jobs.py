@@ -0,0 +1,247 @@
+"""Follow the phase of many UWS jobs at once from one background poller.
+
+A move, a recursive property update and a full transfer negotiation each start a UWS job on the service and
+then have to wait for it to leave the PENDING/QUEUED/EXECUTING phases.  Polling each job from the thread that
+started it serialises those waits.  The JobMonitor keeps every job of the process in a single schedule, polls
+the ones that are due from a small pool of threads and hands callers a JobFuture to wait on, so a batch of
+moves waits for the slowest job rather than for the sum of them.
+
+A job is polled again soon after its phase changes and less and less often while it stays the same.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger('vos')
+
+PENDING_PHASES = ('PENDING', 'QUEUED', 'EXECUTING', 'UNKNOWN')
+POLL_START = 0.5  # seconds before the first poll after a job starts or changes phase
+POLL_FACTOR = 2  # the interval grows by this factor for each poll that sees the same phase
+POLL_MAX = 32  # longest interval between two polls of a job
+POLL_THREADS = 4  # phase requests running at the same time
+MAX_POLL_ERRORS = 5  # consecutive failed polls before the job is given up on
+IDLE_TIMEOUT = 10  # seconds the poller thread waits for new jobs before it exits
+WAIT_SLICE = 0.5  # waits are sliced so a KeyboardInterrupt gets delivered
+
+
+class JobFuture(object):
+    """The eventual outcome of a UWS job.
+
+    usage:
+        future = monitor.watch(session, job_url)
+        ... do other things ...
+        phase = future.result()
+    """
+
+    def __init__(self, job_url):
+        self.job_url = job_url
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        """Has the job reached a final phase?"""
+        return self._done.is_set()
+
+    def _wait(self, timeout):
+        deadline = timeout is not None and time.time() + timeout or None
+        while not self._done.is_set():
+            remaining = WAIT_SLICE
+            if deadline is not None:
+                remaining = min(remaining, deadline - time.time())
+                if remaining <= 0:
+                    raise OSError(errno.ETIMEDOUT, "Timed out waiting for {0}".format(self.job_url))
+            self._done.wait(remaining)
+
+    def result(self, timeout=None):
+        """Wait for the job and return its result, or raise the error it ended with.
+
+        :param timeout: seconds to wait, None waits for as long as the job takes.
+        """
+        self._wait(timeout)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Wait for the job and return the error it ended with, None if it succeeded."""
+        self._wait(timeout)
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """Call callback(future) once the job is over, right away if it already is."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as ex:
+                logger.error("Callback of {0} failed: {1}".format(self.job_url, ex))
+
+
+class _Job(object):
+    """The polling state of one watched job."""
+
+    def __init__(self, session, job_url, resolve):
+        self.session = session
+        self.phase_url = job_url + "/phase"
+        self.resolve = resolve
+        self.future = JobFuture(job_url)
+        self.phase = None
+        self.interval = POLL_START
+        self.errors = 0
+
+
+class JobMonitor(object):
+    """Poll the phase of UWS jobs in the background until they are over.
+
+    usage:
+        monitor = JobMonitor()
+        futures = [monitor.watch(session, job_url) for job_url in job_urls]
+        phases = [future.result() for future in futures]
+    """
+
+    def __init__(self, nthreads=POLL_THREADS):
+        """
+        :param nthreads: number of phase requests sent at the same time.
+        :type nthreads: int
+        """
+        self.nthreads = nthreads
+        self._schedule = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pool = None
+        self._pid = os.getpid()
+
+    def watch(self, session, job_url, resolve=None):
+        """Start following the job at job_url.
+
+        :param session: the requests session to poll with.
+        :param job_url: the URL of the UWS job, without the /phase.
+        :param resolve: called with the final phase from a poller thread, what it returns or raises becomes the
+        outcome of the future.  Without it the future's result is the final phase.
+        :return: the JobFuture of the job
+        :rtype: JobFuture
+        """
+        job = _Job(session, job_url, resolve)
+        logger.debug("Job URL: {0}/phase".format(job_url))
+        self._add(job, 0)
+        return job.future
+
+    def __len__(self):
+        return len(self._schedule)
+
+    def _forked(self):
+        """Drop the schedule, lock, poller thread and pool a forked process inherited from its parent."""
+        if self._pid != os.getpid():
+            # the threads of the parent do not exist in the child, and the parent polls its own jobs
+            self._condition = threading.Condition()
+            self._schedule = []
+            self._thread = None
+            self._pool = None
+            self._pid = os.getpid()
+
+    def _add(self, job, delay):
+        self._forked()
+        with self._condition:
+            heapq.heappush(self._schedule, (time.time() + delay, next(self._counter), job))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="vos-job-monitor")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def _due(self):
+        """Wait for and return the jobs due for a poll, an empty list once idle for IDLE_TIMEOUT."""
+        with self._condition:
+            while True:
+                now = time.time()
+                due = []
+                while self._schedule and self._schedule[0][0] <= now:
+                    due.append(heapq.heappop(self._schedule)[2])
+                if due:
+                    return due
+                if not self._schedule:
+                    self._condition.wait(IDLE_TIMEOUT)
+                    if not self._schedule:
+                        self._thread = None
+                        return []
+                else:
+                    self._condition.wait(self._schedule[0][0] - now)
+
+    def _run(self):
+        while True:
+            due = self._due()
+            if not due:
+                return
+            if len(due) == 1:
+                self._poll(due[0])
+                continue
+            if self._pool is None:
+                self._pool = ThreadPool(self.nthreads)
+            self._pool.map(self._poll, due)
+
+    def _poll(self, job):
+        try:
+            response = job.session.get(job.phase_url, allow_redirects=False)
+            response.raise_for_status()
+            phase = response.text.strip()
+        except Exception as ex:
+            job.errors += 1
+            logger.debug("Polling {0} failed ({1}): {2}".format(job.phase_url, job.errors, ex))
+            if job.errors >= MAX_POLL_ERRORS:
+                job.future.set_exception(ex)
+            else:
+                job.interval = min(POLL_MAX, job.interval * POLL_FACTOR)
+                self._add(job, job.interval)
+            return
+        job.errors = 0
+        if phase in PENDING_PHASES:
+            if phase == job.phase:
+                job.interval = min(POLL_MAX, job.interval * POLL_FACTOR)
+            else:
+                job.interval = POLL_START
+            job.phase = phase
+            logger.debug("Job phase of {0}: {1}, next poll in {2}s".format(job.phase_url, phase, job.interval))
+            self._add(job, job.interval)
+            return
+        logger.debug("Job phase of {0}: {1}".format(job.phase_url, phase))
+        job.phase = phase
+        if job.resolve is None:
+            job.future.set_result(phase)
+            return
+        try:
+            job.future.set_result(job.resolve(phase))
+        except Exception as ex:
+            job.future.set_exception(ex)
+
+
+# the monitor shared by every Client of this process
+MONITOR = JobMonitor()
@@ -0,0 +1,52 @@
+"""Parse VOSpace node documents as they are read.
+
+The listing of a ContainerNode holds an element per child, and for directories of hundreds of thousands of
+files reading the whole response into a string and building its tree took several copies of the document
+and a long pause before the first child could be used.  The document is instead parsed with iterparse as the
+response is read: the element of each child is handed over once complete and taken out of the tree, so only
+the children not yet consumed are held.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from xml.etree import ElementTree
+
+VOSNS = "http://www.ivoa.net/xml/VOSpace/v2.0"
+NODES = '{%s}nodes' % VOSNS
+NODE = '{%s}node' % VOSNS
+
+
+def iter_elements(stream):
+    """Parse the node document read from stream, yielding the node element then the element of each child.
+
+    The node element comes first, as soon as its properties have been read, and never holds the children.
+    Each child element is yielded when it is complete.
+
+    usage:
+        elements = iter_elements(response.raw)
+        node = Node(next(elements))
+        for element in elements:
+            child = Node(element)
+
+    :param stream: an object with a read method returning the bytes of the document.
+    """
+    # the elements from the root to the current one
+    path = []
+    root = None
+    for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            path.append(element)
+            if len(path) == 2 and element.tag == NODES:
+                # the properties of the node come before its children, it is complete but for them, and
+                # the children parsed ahead of those handed over stay out of its tree
+                root = path[0]
+                root.remove(element)
+                yield root
+            continue
+        path.pop()
+        if len(path) == 2 and element.tag == NODE and path[1].tag == NODES:
+            path[1].remove(element)
+            yield element
+        elif len(path) == 0 and root is None:
+            # a node without children
+            yield element
@@ -1,8 +1,38 @@
 
 import sqlite3, logging
 import hashlib
+from .chunking import ChunkSizer, iter_file
 READBUF = 8192
 
+class MD5Reader(object):
+    """File-like wrapper that computes the MD5 of the bytes as they are read.
+
+    Passing an MD5Reader as the body of a request hashes the file while it is being sent, so the file
+    is read from disk only once.
+    """
+
+    def __init__(self, fileobj, size=None):
+        """
+        :param fileobj: the open (binary) file to read from.
+        :param size: the number of bytes that will be read, used as the content length of a request body.
+        """
+        self.fileobj = fileobj
+        self.size = size
+        self.md5 = hashlib.md5()
+
+    def read(self, size=-1):
+        buf = self.fileobj.read(size)
+        self.md5.update(buf)
+        return buf
+
+    def __len__(self):
+        return self.size
+
+    def hexdigest(self):
+        """The MD5 of the bytes read so far."""
+        return self.md5.hexdigest()
+
+
 class MD5_Cache:
 
     def __init__(self, cache_db="/tmp/#vos_cached.db#"):
@@ -16,13 +46,15 @@ class MD5_Cache:
         ## build cache lookup if doesn't already exists
 
     @staticmethod
-    def computeMD5(filename, block_size=READBUF):
+    def computeMD5(filename, block_size=None):
+        """The MD5 of a file, read in blocks that grow from READBUF bytes unless block_size fixes their size."""
         md5 = hashlib.md5()
+        if block_size is None:
+            sizer = ChunkSizer(READBUF, minimum=READBUF)
+        else:
+            sizer = ChunkSizer(block_size, minimum=block_size, maximum=block_size)
         with open(filename, 'rb') as f:
-            while True:
-                buf = f.read(block_size)
-                if len(buf) == 0:
-                    break
+            for buf in iter_file(f, sizer):
                 md5.update(buf)
         return md5.hexdigest()
 
@@ -0,0 +1,81 @@
+"""Size the connection pools of the requests sessions and report how often connections are reused.
+
+A requests session keeps a pool of connections per host, 10 of them unless told otherwise.  When more
+threads than that talk to a host at once, the connections opened beyond the pool are closed after their
+request ("Connection pool is full, discarding connection"), and the next request pays for a new TCP and TLS
+handshake.  A Connection sizes its pools from the concurrency of the command, or of the vofs mount, using it,
+and can give each thread a session of its own rather than share one.
+
+Each pool counts the requests it sent and the connections it opened, the difference is the number of
+requests that reused a kept-alive connection.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from . import tls
+
+POOL_SIZE = 10  # connections kept per host, the requests default
+POOL_HOSTS = 10  # hosts a session keeps a pool of connections for
+
+SHARED = 'shared'  # one session shared by the threads of a process
+THREAD = 'thread'  # a session per thread
+STRATEGIES = (SHARED, THREAD)
+
+
+def _adapter(session, prefix, size):
+    """An adapter like the one session uses for prefix, keeping size connections per host.
+
+    Its HTTPS connections resume the TLS sessions shared by the requests with the same certificate and
+    verify setting.
+    """
+    try:
+        max_retries = session.get_adapter(prefix).max_retries
+    except Exception:
+        max_retries = 0
+    return tls.TLSAdapter(tls.SESSIONS, pool_connections=POOL_HOSTS, pool_maxsize=size, max_retries=max_retries)
+
+
+def size_pools(session, size=POOL_SIZE, hosts=None):
+    """Keep up to size connections per host open in session, or the size given in hosts for those hosts.
+
+    The adapters of the session are replaced, so this is done before the session is used by the transfers.
+
+    :param session: the requests session.
+    :param size: the connections kept per host.
+    :type size: int
+    :param hosts: the connections kept for particular hosts, by host name.
+    :type hosts: dict
+    """
+    for scheme in ('https://', 'http://'):
+        session.mount(scheme, _adapter(session, scheme, size))
+        for host, host_size in (hosts or {}).items():
+            prefix = '{0}{1}/'.format(scheme, host)
+            session.mount(prefix, _adapter(session, prefix, host_size))
+
+
+def pool_stats(sessions):
+    """The requests sent, connections opened and requests that reused a connection, per host.
+
+    :param sessions: the requests sessions to add up.
+    :return: {host: {'requests': n, 'connections': n, 'reused': n}}
+    :rtype: dict
+    """
+    stats = {}
+    for session in sessions:
+        adapters = []
+        for adapter in session.adapters.values():
+            if adapter not in adapters:
+                adapters.append(adapter)
+        for adapter in adapters:
+            pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+            if pools is None:
+                continue
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                counts = stats.setdefault(pool.host, {'requests': 0, 'connections': 0, 'reused': 0})
+                counts['requests'] += pool.num_requests
+                counts['connections'] += pool.num_connections
+                counts['reused'] += max(0, pool.num_requests - pool.num_connections)
+    return stats
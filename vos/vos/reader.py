@@ -0,0 +1,317 @@
+"""Read a DataNode as a seekable, buffered binary file.
+
+VOFile wraps a single HTTP request: reads come straight from the socket, a seek only moves a counter and a
+failing URL is retried by starting the request again.  A DataReader is an io.RawIOBase over the data URLs of a
+node, so it can be wrapped in an io.BufferedReader and handed to anything expecting a binary file:
+
+- readinto copies the bytes into the caller's buffer;
+- a seek closes the current response and the next read reconnects with a Range starting at the new position;
+- while the caller processes one chunk a background thread reads the next ones, up to readahead bytes;
+- a response that fails or ends early is resumed from the current position on the next URL, in a loop bounded
+  by MAX_RETRIES, and once every URL failed the transfer is negotiated again if the caller said how.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import io
+import logging
+import re
+import threading
+import time
+
+from six.moves import queue
+
+from .scheduler import DOWNLOAD, INTERACTIVE
+
+logger = logging.getLogger('vos')
+
+READ_CHUNK = 2 ** 18  # bytes read from the response at a time (256 KiB)
+READAHEAD = 2 ** 22  # bytes read ahead of the caller in the background (4 MiB)
+BUFFER_SIZE = 2 ** 20  # buffer of the io.BufferedReader returned by open_reader
+MAX_RETRIES = 5  # failed connections or broken responses before a read gives up
+RETRY_DELAY = 1  # seconds waited before starting over once every URL failed
+MAX_RETRY_DELAY = 30  # longest wait asked for by a busy server that is honoured
+STOP_SLICE = 0.5  # the readahead thread checks for a stop this often while the queue is full
+
+CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+class _ReadAhead(object):
+    """Read a response into a bounded queue of chunks from a background thread.
+
+    The queue ends with None at the end of the response, or with the exception that broke it.
+    """
+
+    def __init__(self, response, chunk_size, depth):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(max(1, depth))
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="vos-readahead")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=STOP_SLICE)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                chunk = self.response.raw.read(self.chunk_size)
+                if not chunk:
+                    break
+                if not self._put(chunk):
+                    return
+            self._put(None)
+        except Exception as ex:
+            if not self._stopped.is_set():
+                self._put(ex)
+
+    def get(self):
+        item = self.chunks.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def stop(self):
+        self._stopped.set()
+
+
+class DataReader(io.RawIOBase):
+    """A seekable binary stream over the data URLs of a DataNode.
+
+    usage:
+        fin = io.BufferedReader(DataReader(session, urls), BUFFER_SIZE)
+        fin.seek(2880 * 10)
+        header = fin.read(2880)
+    """
+
+    def __init__(self, session, urls, size=None, renegotiate=None, selector=None, scheduler=None,
+                 readahead=READAHEAD, chunk_size=READ_CHUNK, end=None):
+        """
+        :param session: the requests session to GET with.
+        :param urls: the data URLs of the node, in the order they should be tried.
+        :type urls: [str]
+        :param size: the length of the node, learned from the first response when None.
+        :param renegotiate: called without arguments for a fresh list of URLs once all of urls failed.
+        :param selector: an EndpointSelector to order the URLs and record their health with.
+        :param scheduler: a TransferScheduler to account the bytes read to.
+        :param readahead: bytes read in the background ahead of the caller, 0 to read only on demand.
+        :param chunk_size: bytes read from the response at a time.
+        :param end: the stream stops at this offset rather than at the end of the node.
+        """
+        super(DataReader, self).__init__()
+        self.session = session
+        self.urls = list(urls)
+        if selector is not None:
+            self.urls = selector.order(self.urls)
+        if not self.urls:
+            raise OSError(errno.EREMOTE, "No URLs to read from")
+        self.size = size
+        self.renegotiate = renegotiate
+        self.selector = selector
+        self.scheduler = scheduler
+        self.readahead = readahead
+        self.chunk_size = chunk_size
+        self.end = end
+        self.url = self.urls[0]
+        self.reconnects = 0
+        self._index = 0
+        self._pos = 0
+        self._response = None
+        self._ahead = None
+        self._eof = False
+        self._chunk = b''
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    @property
+    def limit(self):
+        """The offset the stream ends at, None while the size is unknown."""
+        if self.end is None:
+            return self.size
+        if self.size is None:
+            return self.end
+        return min(self.end, self.size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            if self.limit is None:
+                # the first response tells us the size
+                self._retry(self._connect)
+            pos = self.limit + offset
+        else:
+            raise ValueError("Invalid whence ({0})".format(whence))
+        if pos < 0:
+            raise OSError(errno.EINVAL, "Negative seek position {0}".format(pos))
+        if pos != self._pos:
+            remaining = len(self._chunk) - self._offset
+            if 0 < pos - self._pos <= remaining:
+                # still within the chunk in hand
+                self._offset += pos - self._pos
+            else:
+                self._disconnect()
+            self._pos = pos
+        return self._pos
+
+    def readinto(self, b):
+        """Read up to len(b) bytes into b, return the number of bytes read, 0 at the end of the stream."""
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        want = len(b)
+        if self.limit is not None:
+            want = min(want, self.limit - self._pos)
+        if want <= 0:
+            return 0
+        if self._offset >= len(self._chunk):
+            chunk = self._retry(self._next_chunk)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+            self._offset = 0
+        n = min(want, len(self._chunk) - self._offset)
+        b[:n] = self._chunk[self._offset:self._offset + n]
+        self._offset += n
+        self._pos += n
+        return n
+
+    def _retry(self, action):
+        """Call action until it succeeds, moving to the next URL after each failure."""
+        failures = 0
+        while True:
+            try:
+                return action()
+            except Exception as ex:
+                failures += 1
+                self._failed(ex, failures)
+
+    def _next_chunk(self):
+        """The next chunk of the response, connecting first if needed, None at the end of the stream."""
+        if self._eof:
+            # the read ahead queue is drained, asking it again would block forever
+            return None
+        if self._response is None:
+            if not self._connect():
+                return None
+        if self._ahead is not None:
+            chunk = self._ahead.get()
+        else:
+            chunk = self._response.raw.read(self.chunk_size) or None
+        if chunk is None:
+            if self.limit is not None and self._pos < self.limit:
+                raise IOError(errno.EIO, "Response from {0} ended at {1} of {2} bytes".format(
+                    self.url, self._pos, self.limit))
+            self._eof = True
+            return None
+        if self.scheduler is not None:
+            self.scheduler.acquire(len(chunk), DOWNLOAD, INTERACTIVE)
+        return chunk
+
+    def _failed(self, ex, failures):
+        """Drop the broken response and pick the URL to resume from, raise once out of retries."""
+        logger.debug("Reading {0} at {1} failed ({2}): {3}".format(self.url, self._pos, failures, ex))
+        self._disconnect()
+        if self.selector is not None:
+            self.selector.record_failure(self.url)
+        if failures > MAX_RETRIES:
+            raise ex
+        self.reconnects += 1
+        self._index += 1
+        if self._index < len(self.urls):
+            return
+        self._index = 0
+        if self.renegotiate is not None:
+            logger.debug("Every URL failed, negotiating the transfer again")
+            urls = self.renegotiate()
+            if urls:
+                self.urls = list(urls)
+        delay = getattr(ex, 'retry_after', None) or RETRY_DELAY
+        time.sleep(min(delay, MAX_RETRY_DELAY))
+
+    def _connect(self):
+        """GET the current URL from the current position, return False if there is nothing left to read."""
+        self.url = self.urls[self._index]
+        headers = {}
+        if self._pos > 0 or self.end is not None:
+            last = self.end is not None and str(self.end - 1) or ''
+            headers['Range'] = 'bytes={0}-{1}'.format(self._pos, last)
+        kwargs = {}
+        if self.selector is not None:
+            kwargs['timeout'] = self.selector.timeout(self.url)
+        start = time.time()
+        response = self.session.get(self.url, headers=headers, stream=True, **kwargs)
+        if response.status_code == 416:
+            response.close()
+            return False
+        if response.status_code == 503:
+            error = IOError(errno.EAGAIN, "{0} is busy".format(self.url))
+            try:
+                error.retry_after = int(response.headers.get('Retry-After', RETRY_DELAY))
+            except ValueError:
+                pass
+            response.close()
+            raise error
+        response.raise_for_status()
+        if self.selector is not None:
+            self.selector.record_latency(self.url, time.time() - start)
+        self._learn_size(response)
+        if response.status_code == 200 and self._pos > 0:
+            # the server ignored the Range, skip up to the position
+            skip = self._pos
+            while skip > 0:
+                chunk = response.raw.read(min(skip, self.chunk_size))
+                if not chunk:
+                    response.close()
+                    raise IOError(errno.EIO, "{0} ended before {1}".format(self.url, self._pos))
+                skip -= len(chunk)
+        self._response = response
+        if self.readahead > 0:
+            self._ahead = _ReadAhead(response, self.chunk_size, self.readahead // self.chunk_size)
+        return True
+
+    def _learn_size(self, response):
+        if self.size is not None:
+            return
+        match = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+        if match is not None:
+            if match.group(3) != '*':
+                self.size = int(match.group(3))
+        elif response.status_code == 200 and response.headers.get('Content-Length'):
+            self.size = int(response.headers['Content-Length'])
+
+    def _disconnect(self):
+        if self._ahead is not None:
+            self._ahead.stop()
+            self._ahead = None
+        if self._response is not None:
+            try:
+                self._response.close()
+            except Exception as ex:
+                logger.debug("Closing {0} failed: {1}".format(self.url, ex))
+            self._response = None
+        self._eof = False
+        self._chunk = b''
+        self._offset = 0
+
+    def close(self):
+        self._disconnect()
+        super(DataReader, self).close()
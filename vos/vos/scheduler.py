@@ -0,0 +1,159 @@
+"""Share a bandwidth budget between all the transfers of a process.
+
+vsync streams, vofs flush threads and parallel byte ranges each move data as fast as they can, so together
+they can fill a shared uplink and leave nothing for an interactive read.  The TransferScheduler holds token
+buckets, filled at a configured number of bytes per second: one for the aggregate of all transfers and one for
+each direction.  Before moving a chunk a transfer acquires as many tokens as the chunk has bytes from every
+bucket that applies to it, waiting while they are empty.
+
+Transfers are either INTERACTIVE (a read somebody is waiting for, e.g. through vofs) or BULK (copies, syncs and
+flushes).  While an interactive transfer waits for tokens of a bucket no bulk transfer is given tokens from
+that bucket, so interactive reads preempt bulk uploads as soon as the bulk transfer finishes its chunk.
+
+A bucket with a rate of 0 does not limit anything, and with no rates configured acquire returns at once.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger('vos')
+
+UPLOAD = 'upload'
+DOWNLOAD = 'download'
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+BURST_TIME = 0.5  # seconds worth of tokens a bucket holds when full
+SLICE_TIME = 0.25  # seconds worth of tokens acquired at a time by a throttled transfer
+MIN_SLICE = 2 ** 14  # smallest chunk a throttled transfer is cut into
+MB = 2 ** 20  # configured rates are in MB/s
+
+
+class TokenBucket(object):
+    """Tokens (bytes) added at rate per second up to a burst, a bucket may go into debt by one chunk."""
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: bytes per second added to the bucket.
+        :param burst: the most tokens the bucket holds, defaults to BURST_TIME seconds worth.
+        """
+        self.rate = float(rate)
+        self.burst = burst is None and max(MIN_SLICE, self.rate * BURST_TIME) or burst
+        self.tokens = self.burst
+        self.updated = time.time()
+        # number of interactive transfers waiting on this bucket
+        self.interactive = 0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until the bucket has tokens again."""
+        if self.tokens > 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class TransferScheduler(object):
+    """Token buckets limiting the aggregate and per direction bandwidth of the transfers of a process.
+
+    usage:
+        scheduler = TransferScheduler(rate=50 * MB, upload_rate=20 * MB)
+        for chunk in chunks:
+            scheduler.acquire(len(chunk), UPLOAD, BULK)
+            send(chunk)
+    """
+
+    def __init__(self, rate=0, upload_rate=0, download_rate=0):
+        """
+        :param rate: aggregate bytes per second of all transfers, 0 for no limit.
+        :param upload_rate: bytes per second of all uploads, 0 for no limit.
+        :param download_rate: bytes per second of all downloads, 0 for no limit.
+        """
+        self._condition = threading.Condition()
+        self.waited = 0.0
+        self.set_rates(rate, upload_rate, download_rate)
+
+    def set_rates(self, rate=0, upload_rate=0, download_rate=0):
+        """Replace the limits, in bytes per second, 0 for no limit."""
+        with self._condition:
+            self.rates = {None: rate or 0, UPLOAD: upload_rate or 0, DOWNLOAD: download_rate or 0}
+            self._buckets = dict((key, TokenBucket(value)) for key, value in self.rates.items() if value > 0)
+            self._condition.notify_all()
+
+    def split(self, parts):
+        """Keep 1/parts of each limit, for when the transfers are spread over parts processes."""
+        parts = max(1, parts)
+        self.set_rates(*[self.rates[key] / parts for key in (None, UPLOAD, DOWNLOAD)])
+
+    @property
+    def limited(self):
+        return len(self._buckets) > 0
+
+    def slice_size(self, direction, size):
+        """The largest chunk, at most size, a transfer in direction should move between two acquires."""
+        rates = [self.rates[key] for key in (None, direction) if self.rates[key] > 0]
+        if not rates:
+            return size
+        return max(MIN_SLICE, min(size, int(min(rates) * SLICE_TIME)))
+
+    def acquire(self, nbytes, direction, priority=BULK):
+        """Wait until nbytes may be moved in direction.
+
+        :param nbytes: the size of the chunk about to be moved.
+        :param direction: UPLOAD or DOWNLOAD.
+        :param priority: INTERACTIVE or BULK.
+        :return: the seconds spent waiting.
+        """
+        if not self._buckets or nbytes <= 0:
+            return 0.0
+        start = time.time()
+        with self._condition:
+            buckets = [self._buckets[key] for key in (None, direction) if key in self._buckets]
+            if not buckets:
+                return 0.0
+            interactive = priority == INTERACTIVE
+            if interactive:
+                for bucket in buckets:
+                    bucket.interactive += 1
+            try:
+                while True:
+                    now = time.time()
+                    for bucket in buckets:
+                        bucket.refill(now)
+                    preempted = not interactive and any(bucket.interactive > 0 for bucket in buckets)
+                    if not preempted:
+                        delay = max(bucket.delay() for bucket in buckets)
+                        if delay <= 0:
+                            for bucket in buckets:
+                                bucket.tokens -= nbytes
+                            break
+                    else:
+                        # woken up when the interactive transfers got their tokens
+                        delay = max(bucket.delay() for bucket in buckets) or SLICE_TIME
+                    self._condition.wait(max(delay, 0.001))
+            finally:
+                if interactive:
+                    for bucket in buckets:
+                        bucket.interactive -= 1
+                    self._condition.notify_all()
+            waited = time.time() - start
+            self.waited += waited
+        return waited
+
+
+def config_rates(config):
+    """The (aggregate, upload, download) limits in bytes per second set, in MB/s, in the [transfer] section."""
+    rates = []
+    for option in ('bandwidth', 'upload_bandwidth', 'download_bandwidth'):
+        value = config.get('transfer', option)
+        rates.append(value and float(value) * MB or 0)
+    return rates
+
+
+# the scheduler shared by every Client of this process
+SCHEDULER = TransferScheduler()
@@ -0,0 +1,113 @@
+# Test the chunking module
+
+import errno
+import io
+import unittest
+
+from mock import Mock, patch
+from requests.packages.urllib3.response import HTTPResponse
+
+from vos.chunking import ChunkSizer, iter_content, iter_file, MIN_CHUNK, MAX_CHUNK, TARGET_TIME
+
+
+class TestChunkSizer(unittest.TestCase):
+    """Test the ChunkSizer class.
+    """
+
+    def test_grow(self):
+        sizer = ChunkSizer(2 ** 16)
+        # fast chunks with a large per-call overhead: bigger chunks pay off
+        while sizer.size < MAX_CHUNK:
+            size = sizer.size
+            sizer.record(size, 0.001 + size / 1e9)
+            self.assertEqual(2 * size, sizer.size)
+        sizer.record(MAX_CHUNK, 0.001)
+        self.assertEqual(MAX_CHUNK, sizer.size)
+        self.assertEqual(MAX_CHUNK, sizer.largest)
+
+    def test_plateau(self):
+        sizer = ChunkSizer(2 ** 16)
+        # the throughput does not depend on the chunk size, growing stops after one doubling
+        for _ in range(10):
+            sizer.record(sizer.size, sizer.size / 1e9)
+        self.assertEqual(2 ** 17, sizer.size)
+
+    def test_shrink(self):
+        sizer = ChunkSizer(2 ** 20)
+        sizer.record(2 ** 20, 10 * TARGET_TIME)
+        self.assertEqual(2 ** 19, sizer.size)
+        for _ in range(20):
+            sizer.record(sizer.size, 10 * TARGET_TIME)
+        self.assertEqual(MIN_CHUNK, sizer.size)
+        self.assertEqual(2 ** 20, sizer.largest)
+
+        # chunks that do not say anything about the size
+        sizer = ChunkSizer(2 ** 20)
+        sizer.record(100, 0.0001)
+        sizer.record(2 ** 20, 0.0001, requested=2 ** 19)
+        self.assertEqual(2 ** 20, sizer.size)
+        self.assertEqual(2, sizer.chunks)
+        self.assertEqual(100 + 2 ** 20, sizer.nbytes)
+
+    def test_limits(self):
+        sizer = ChunkSizer(2 ** 30, minimum=2 ** 14, maximum=2 ** 15)
+        self.assertEqual(2 ** 15, sizer.size)
+        sizer = ChunkSizer(1, minimum=2 ** 14)
+        self.assertEqual(2 ** 14, sizer.size)
+        sizer = ChunkSizer(4096, minimum=4096, maximum=4096)
+        sizer.record(4096, 0.00001)
+        self.assertEqual(4096, sizer.size)
+
+
+class TestIterators(unittest.TestCase):
+    """Test iter_content and iter_file.
+    """
+
+    def test_iter_file(self):
+        data = b'x' * (2 ** 16 + 5)
+        sizer = ChunkSizer(2 ** 14)
+        with patch('vos.chunking.time.time', side_effect=[i * 0.001 for i in range(100)]):
+            chunks = list(iter_file(io.BytesIO(data), sizer))
+        self.assertEqual(data, b''.join(chunks))
+        # fast reads double the size
+        self.assertEqual([2 ** 14, 2 ** 15, 2 ** 16 - 2 ** 14 - 2 ** 15 + 5], [len(chunk) for chunk in chunks])
+        self.assertEqual(3, sizer.chunks)
+
+    @patch('vos.chunking.HTTPResponse', Mock)
+    def test_iter_content(self):
+        data = b'0123456789'
+        stream = io.BytesIO(data)
+        response = Mock()
+        response.raw = Mock(read=lambda size, decode_content: stream.read(size))
+        sizer = ChunkSizer(4, minimum=4, maximum=4)
+        self.assertEqual([b'0123', b'4567', b'89'], list(iter_content(response, sizer)))
+        response.iter_content.assert_not_called()
+
+    def test_iter_content_truncated(self):
+        # the server promised 10 bytes and closed the connection after 4
+        response = Mock()
+        response.raw = HTTPResponse(body=io.BytesIO(b'0123'), headers={'content-length': '10'},
+                                    preload_content=False, enforce_content_length=True)
+        sizer = ChunkSizer(4, minimum=4, maximum=4)
+        chunks = iter_content(response, sizer)
+        self.assertEqual(b'0123', next(chunks))
+        with self.assertRaises(IOError) as ex:
+            next(chunks)
+        self.assertEqual(errno.EIO, ex.exception.errno)
+
+    def test_iter_content_fallback(self):
+        response = Mock(raw=None)
+        response.iter_content.return_value = [b'01', b'', b'23']
+        sizer = ChunkSizer(MIN_CHUNK)
+        self.assertEqual([b'01', b'23'], list(iter_content(response, sizer)))
+        response.iter_content.assert_called_once_with(chunk_size=MIN_CHUNK)
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestChunkSizer)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(TestIterators)
+    allTests = unittest.TestSuite([suite1, suite2])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
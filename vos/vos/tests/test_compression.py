@@ -0,0 +1,59 @@
+# Test the compression module
+
+import errno
+import gzip
+import io
+import unittest
+
+from mock import patch
+
+from vos import compression
+from vos.compression import EncodingSupport, compress_chunks, decompress_chunks, check, GZIP, ZSTD
+
+
+class TestCompression(unittest.TestCase):
+    """Test the compression functions.
+    """
+
+    def test_check(self):
+        self.assertIsNone(check(None))
+        self.assertIsNone(check('identity'))
+        self.assertEqual(GZIP, check('gzip'))
+        with self.assertRaises(OSError) as ex:
+            check('lzw')
+        self.assertEqual(errno.EINVAL, ex.exception.errno)
+        with patch('vos.compression.zstandard', None):
+            self.assertEqual([GZIP], compression.available())
+            with self.assertRaises(OSError) as ex:
+                check(ZSTD)
+            self.assertEqual(errno.EOPNOTSUPP, ex.exception.errno)
+
+    def test_round_trip(self):
+        data = b'ra,dec,mag\n' + b'10.1,-20.2,17.5\n' * 10000
+        chunks = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+        for encoding in compression.available():
+            compressed = b''.join(compress_chunks(chunks, encoding))
+            self.assertLess(len(compressed), len(data) // 5)
+            # decompressed whatever the boundaries of the compressed chunks
+            pieces = [compressed[i:i + 1000] for i in range(0, len(compressed), 1000)]
+            self.assertEqual(data, b''.join(decompress_chunks(pieces, encoding)))
+        # gzip is readable by the gzip module
+        compressed = b''.join(compress_chunks(chunks, GZIP))
+        self.assertEqual(data, gzip.GzipFile(fileobj=io.BytesIO(compressed)).read())
+        self.assertEqual(b'', b''.join(decompress_chunks(compress_chunks([], GZIP), GZIP)))
+
+    def test_support(self):
+        support = EncodingSupport()
+        self.assertTrue(support.accepts('http://a.ca/data/file'))
+        support.refuse('http://a.ca/data/other')
+        self.assertFalse(support.accepts('http://a.ca/data/file'))
+        self.assertTrue(support.accepts('http://b.ca/data/file'))
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestCompression)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
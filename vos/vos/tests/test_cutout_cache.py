@@ -0,0 +1,73 @@
+# Test the cutout_cache module
+
+import os
+import tempfile
+import time
+import unittest
+
+from vos.cutout_cache import CutoutCache, normalize
+
+
+class TestCutoutCache(unittest.TestCase):
+    """Test the CutoutCache class.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def write(self, name, data):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'wb') as fout:
+            fout.write(data)
+        return filename
+
+    def test_normalize(self):
+        self.assertEqual('[1][100:200,100:200]', normalize(' [1][ 100:200, +100:0200]'))
+        self.assertEqual('[0][-5:*]', normalize('[0][-05:*]'))
+        self.assertEqual('CIRCLE ICRS 10.5 -20.1 0.01', normalize('circle icrs 10.50 -20.1  0.010'))
+        uri = 'vos://cadc.nrc.ca!vospace/dir/image.fits'
+        self.assertEqual(CutoutCache.key(uri, 'a' * 32, '[1][1:10]'), CutoutCache.key(uri, 'a' * 32, '[1][ 1:10]'))
+        self.assertNotEqual(CutoutCache.key(uri, 'a' * 32, '[1][1:10]'), CutoutCache.key(uri, 'b' * 32, '[1][1:10]'))
+
+    def test_get_put(self):
+        cache = CutoutCache(os.path.join(self.tmpdir, 'cache'), max_size=100)
+        destination = os.path.join(self.tmpdir, 'out')
+        self.assertIsNone(cache.get('k1', destination))
+        cache.put('k1', self.write('c1', b'x' * 40))
+        self.assertEqual(40, cache.get('k1', destination))
+        with open(destination, 'rb') as fin:
+            self.assertEqual(b'x' * 40, fin.read())
+        # larger than the whole cache
+        cache.put('k2', self.write('c2', b'y' * 101))
+        self.assertIsNone(cache.get('k2', destination))
+        # a disabled cache keeps nothing
+        cache = CutoutCache(os.path.join(self.tmpdir, 'none'), max_size=0)
+        cache.put('k1', self.write('c1', b'x' * 40))
+        self.assertIsNone(cache.get('k1', destination))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'none')))
+        # as is the cache unless given a size
+        self.assertFalse(CutoutCache(os.path.join(self.tmpdir, 'none')).enabled)
+
+    def test_evict(self):
+        cache = CutoutCache(os.path.join(self.tmpdir, 'cache'), max_size=100)
+        destination = os.path.join(self.tmpdir, 'out')
+        now = time.time()
+        for i, key in enumerate(['k1', 'k2']):
+            cache.put(key, self.write(key, b'x' * 40))
+            os.utime(cache.path(key), (now - 100 + i, now - 100 + i))
+        # k1 was used last, so k2 goes when k3 does not fit
+        self.assertEqual(40, cache.get('k1', destination))
+        cache.put('k3', self.write('k3', b'z' * 40))
+        self.assertIsNone(cache.get('k2', destination))
+        self.assertEqual(40, cache.get('k1', destination))
+        self.assertEqual(40, cache.get('k3', destination))
+        self.assertEqual(['k1', 'k3'], sorted(os.listdir(cache.cache_dir)))
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestCutoutCache)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,197 @@
+# Test the download module
+
+import errno
+import io
+import os
+import tempfile
+import unittest
+
+from mock import Mock, MagicMock, call
+from requests.packages.urllib3.response import HTTPResponse
+
+from vos.download import byte_ranges, merge_ranges, RangeDownload, TransferJournal
+
+# The following is a temporary workaround for Python issue 25532 (https://bugs.python.org/issue25532)
+call.__wrapped__ = None
+
+
+class FakeSession(object):
+    """Serve byte ranges of content, failing for any url listed in bad_urls."""
+
+    def __init__(self, content, bad_urls=(), status_code=206):
+        self.content = content
+        self.bad_urls = bad_urls
+        self.status_code = status_code
+        self.requests = []
+        self.timeouts = {}
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append((url, headers['Range']))
+        self.timeouts[url] = timeout
+        if url in self.bad_urls:
+            raise IOError("connection refused")
+        first, last = [int(x) for x in headers['Range'].replace('bytes=', '').split('-')]
+        body = self.content[first:last + 1]
+        response = MagicMock(status_code=self.status_code)
+        response.iter_content.return_value = [body[i:i + 3] for i in range(0, len(body), 3)]
+        return response
+
+
+class TestDownload(unittest.TestCase):
+    """Test the RangeDownload class.
+    """
+
+    def setUp(self):
+        self.content = b'0123456789abcdefghijklmnopqrstuvwxyz'
+        handle, self.destination = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.destination)
+
+    def test_byte_ranges(self):
+        self.assertEqual([(0, 9), (10, 19), (20, 24)], byte_ranges(25, 10))
+        self.assertEqual([(0, 9)], byte_ranges(10, 10))
+        self.assertEqual([(5, 9)], byte_ranges(10, 10, start=5))
+        self.assertEqual([], byte_ranges(0, 10))
+        with self.assertRaises(ValueError):
+            byte_ranges(10, 0)
+
+    def test_run(self):
+        session = FakeSession(self.content)
+        urls = ['http://a.ca/file', 'http://b.ca/file']
+        download = RangeDownload(session, urls, self.destination, len(self.content),
+                                 nstreams=3, range_size=8)
+        self.assertEqual(len(self.content), download.run())
+        with open(self.destination, 'rb') as fin:
+            self.assertEqual(self.content, fin.read())
+        # the ranges are spread across both urls
+        self.assertEqual(5, len(session.requests))
+        self.assertEqual(set(urls), set([r[0] for r in session.requests]))
+        self.assertIn(('http://a.ca/file', 'bytes=0-7'), session.requests)
+        self.assertEqual({'http://a.ca/file': (2, 5), 'http://b.ca/file': (2, 5)}, session.timeouts)
+
+        # the timeouts can be worked out for each url
+        session = FakeSession(self.content)
+        download = RangeDownload(session, urls, self.destination, len(self.content), nstreams=3, range_size=8,
+                                 timeout=lambda url: url == urls[1] and (2, 20) or (2, 5))
+        download.run()
+        self.assertEqual({urls[0]: (2, 5), urls[1]: (2, 20)}, session.timeouts)
+
+    def test_failover(self):
+        session = FakeSession(self.content, bad_urls=['http://a.ca/file'])
+        download = RangeDownload(session, ['http://a.ca/file', 'http://b.ca/file'],
+                                 self.destination, len(self.content), nstreams=2, range_size=10)
+        download.run()
+        with open(self.destination, 'rb') as fin:
+            self.assertEqual(self.content, fin.read())
+
+        # every url failing raises the error
+        session = FakeSession(self.content, bad_urls=['http://a.ca/file'])
+        download = RangeDownload(session, ['http://a.ca/file'], self.destination,
+                                 len(self.content), range_size=10)
+        with self.assertRaises(IOError):
+            download.run()
+
+    def test_error_type(self):
+        # a failure that is not an IOError still reaches the caller as one
+        session = Mock()
+        session.get.side_effect = ValueError("bad response")
+        download = RangeDownload(session, ['http://a.ca/file'], self.destination,
+                                 len(self.content), range_size=10)
+        with self.assertRaises(IOError) as ex:
+            download.run()
+        self.assertEqual(errno.EIO, ex.exception.errno)
+
+    def test_range_not_supported(self):
+        session = FakeSession(self.content, status_code=200)
+        download = RangeDownload(session, ['http://a.ca/file'], self.destination,
+                                 len(self.content), range_size=10)
+        with self.assertRaises(OSError):
+            download.run()
+
+    def test_journal(self):
+        journal = TransferJournal(self.destination, 'abc', 100)
+        self.assertEqual([(0, 99)], journal.missing())
+        journal.add(10, 19)
+        journal.add(20, 29)
+        journal.add(50, 59)
+        self.assertEqual([[10, 29], [50, 59]], journal.ranges)
+        self.assertEqual(30, journal.completed())
+        self.assertEqual([(0, 9), (30, 49), (60, 99)], journal.missing())
+
+        # a new journal picks up the recorded ranges
+        self.assertEqual([(0, 9), (30, 49), (60, 99)], TransferJournal(self.destination, 'abc', 100).missing())
+        # but not if the source has changed
+        self.assertEqual([(0, 99)], TransferJournal(self.destination, 'def', 100).missing())
+        self.assertEqual([(0, 100)], TransferJournal(self.destination, 'abc', 101).missing())
+
+        journal.remove()
+        self.assertFalse(os.access(journal.path, os.F_OK))
+        self.assertEqual([(0, 99)], TransferJournal(self.destination, 'abc', 100).missing())
+
+    def test_merge_ranges(self):
+        self.assertEqual([[0, 20]], merge_ranges([(11, 20), (0, 10)]))
+        self.assertEqual([[0, 5], [7, 9]], merge_ranges([(0, 5), (7, 9), (2, 3)]))
+        self.assertEqual([], merge_ranges([]))
+
+    def test_resume(self):
+        # the first 10 bytes are already in the destination
+        with open(self.destination, 'wb') as fout:
+            fout.write(self.content[:10])
+        journal = TransferJournal(self.destination, 'abc', len(self.content))
+        journal.add(0, 9)
+        session = FakeSession(self.content)
+        RangeDownload(session, ['http://a.ca/file'], self.destination, len(self.content),
+                      range_size=100, journal=journal).run()
+        self.assertEqual([('http://a.ca/file', 'bytes=10-35')], session.requests)
+        with open(self.destination, 'rb') as fin:
+            self.assertEqual(self.content, fin.read())
+        self.assertEqual([], journal.missing())
+        # nothing is left to fetch, the file is complete
+        self.assertEqual(len(self.content), RangeDownload(session, ['http://a.ca/file'], self.destination,
+                                                          len(self.content), journal=journal).run())
+
+        # an interrupted transfer records the bytes received before the failure
+        journal.remove()
+        journal = TransferJournal(self.destination, 'abc', len(self.content))
+        session = FakeSession(self.content)
+        session.get = Mock(return_value=MagicMock(status_code=206))
+        session.get.return_value.iter_content.side_effect = lambda chunk_size: self._broken_stream()
+        with self.assertRaises(IOError):
+            RangeDownload(session, ['http://a.ca/file'], self.destination, len(self.content),
+                          range_size=100, journal=journal).run()
+        self.assertEqual([(6, 35)], journal.missing())
+        journal.remove()
+
+    def test_truncated(self):
+        # a server that closes the connection part way through the body
+        journal = TransferJournal(self.destination, 'abc', len(self.content))
+        response = MagicMock(status_code=206)
+        response.raw = HTTPResponse(body=io.BytesIO(self.content[:6]),
+                                    headers={'content-length': str(len(self.content))},
+                                    preload_content=False, enforce_content_length=True)
+        session = Mock()
+        session.get.return_value = response
+        with self.assertRaises(IOError) as ex:
+            RangeDownload(session, ['http://a.ca/file'], self.destination, len(self.content),
+                          range_size=100, journal=journal).run()
+        self.assertEqual(errno.EIO, ex.exception.errno)
+        journal.remove()
+
+    def _broken_stream(self):
+        yield self.content[:6]
+        raise IOError("connection reset by peer")
+
+    def test_no_urls(self):
+        with self.assertRaises(OSError):
+            RangeDownload(Mock(), [], self.destination, 10)
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestDownload)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
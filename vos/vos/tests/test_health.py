@@ -0,0 +1,148 @@
+# Test the health module
+
+import math
+import threading
+import time
+import unittest
+
+from mock import Mock, MagicMock
+
+from vos.health import EndpointSelector, HostHealth, DEFAULT_TIMEOUT, MAX_READ_TIMEOUT, ERROR_PENALTY, ERROR_MEMORY
+
+
+class TestEndpointSelector(unittest.TestCase):
+    """Test the EndpointSelector class.
+    """
+
+    def setUp(self):
+        self.urls = ['http://a.ca/data/file', 'http://b.ca/data/file', 'http://c.ca/data/file']
+
+    def test_order(self):
+        selector = EndpointSelector()
+        # no history, the order is kept
+        self.assertEqual(self.urls, selector.order(self.urls))
+
+        selector.record_latency(self.urls[0], 0.5)
+        selector.record_latency(self.urls[1], 0.1)
+        self.assertEqual([self.urls[2], self.urls[1], self.urls[0]], selector.order(self.urls))
+
+        # a slow transfer counts against a host
+        selector.record_latency(self.urls[2], 0.1)
+        selector.record_transfer(self.urls[2], 2 ** 20, 10.0)
+        selector.record_transfer(self.urls[1], 2 ** 30, 1.0)
+        self.assertEqual([self.urls[1], self.urls[0], self.urls[2]], selector.order(self.urls))
+
+        # and so do errors
+        selector.record_failure(self.urls[1])
+        self.assertEqual([self.urls[0], self.urls[1], self.urls[2]], selector.order(self.urls))
+        selector.record_failure(self.urls[1])
+        selector.record_failure(self.urls[1])
+        self.assertEqual([self.urls[0], self.urls[2], self.urls[1]], selector.order(self.urls))
+
+    def test_health(self):
+        host = HostHealth()
+        self.assertEqual(0, host.score())
+        host.errors = 2.0
+        host.last_error = 1000.0
+        self.assertEqual(2 * ERROR_PENALTY, host.score(now=1000.0))
+        # errors are forgotten with time
+        self.assertTrue(host.score(now=5000.0) < 0.01)
+
+        selector = EndpointSelector()
+        selector.record_failure(self.urls[0])
+        selector.record_failure(self.urls[0])
+        self.assertAlmostEqual(2.0, selector.health(self.urls[0]).error_weight(), places=2)
+        # URLs of the same host share their history
+        selector.record_latency('http://a.ca/other/file', 0.2)
+        self.assertAlmostEqual(1.0, selector.health(self.urls[0]).error_weight(), places=2)
+        self.assertEqual(0.2, selector.health(self.urls[0]).latency)
+
+        # the decay applied by a success is not applied again by later lookups
+        health = selector.health(self.urls[1])
+        health.errors = 3.0
+        health.last_error = time.time() - ERROR_MEMORY
+        selector.record_latency(self.urls[1], 0.2)
+        remaining = 3.0 * math.exp(-1) - 1
+        self.assertAlmostEqual(remaining, health.error_weight(), places=3)
+        self.assertAlmostEqual(remaining * math.exp(-1), health.error_weight(time.time() + ERROR_MEMORY), places=3)
+
+    def test_timeout(self):
+        selector = EndpointSelector()
+        self.assertEqual(DEFAULT_TIMEOUT, selector.timeout(self.urls[0]))
+        selector.record_latency(self.urls[0], 0.1)
+        self.assertEqual(DEFAULT_TIMEOUT, selector.timeout(self.urls[0]))
+        selector.record_latency(self.urls[1], 4.0)
+        self.assertEqual((DEFAULT_TIMEOUT[0], 16.0), selector.timeout(self.urls[1]))
+        selector.record_latency(self.urls[2], 400.0)
+        self.assertEqual((DEFAULT_TIMEOUT[0], MAX_READ_TIMEOUT), selector.timeout(self.urls[2]))
+
+    def test_race(self):
+        selector = EndpointSelector()
+        responses = {}
+        slow_done = threading.Event()
+
+        def get(url, stream=None, timeout=None):
+            response = MagicMock()
+            responses[url] = response
+            if url == self.urls[0]:
+                time.sleep(0.2)
+                slow_done.set()
+            return response
+
+        session = Mock()
+        session.get.side_effect = get
+        url, response = selector.race(session, self.urls[:2])
+        self.assertEqual(self.urls[1], url)
+        self.assertEqual(responses[self.urls[1]], response)
+        # the slow response is closed once it arrives, and its latency kept
+        self.assertTrue(slow_done.wait(5))
+        for _ in range(50):
+            if responses[self.urls[0]].close.called:
+                break
+            time.sleep(0.01)
+        responses[self.urls[0]].close.assert_called_once_with()
+        response.close.assert_not_called()
+        self.assertTrue(selector.health(self.urls[0]).latency >= 0.2)
+
+    def test_race_failure(self):
+        selector = EndpointSelector()
+        session = Mock()
+        good = MagicMock()
+        session.get.side_effect = lambda url, **kwargs: url == self.urls[0] and good or \
+            Mock(raise_for_status=Mock(side_effect=IOError("503")))
+
+        self.assertEqual((self.urls[0], good), selector.race(session, self.urls[:2]))
+        self.assertTrue(selector.health(self.urls[1]).error_weight() > 0.9)
+        # the hosts are known by now, the failing one is left out
+        self.assertEqual((self.urls[0], good), selector.race(session, [self.urls[1], self.urls[0]]))
+        self.assertTrue(selector.health(self.urls[1]).error_weight() < 1.1)
+
+        with self.assertRaises(IOError):
+            selector.race(session, self.urls[1:])
+        with self.assertRaises(IOError):
+            selector.race(session, self.urls[1:2])
+        with self.assertRaises(ValueError):
+            selector.race(session, [])
+
+    def test_race_known(self):
+        selector = EndpointSelector()
+        session = Mock()
+        session.get.side_effect = lambda url, **kwargs: MagicMock()
+        selector.record_latency(self.urls[0], 0.5)
+        selector.record_latency(self.urls[1], 0.1)
+        # the hosts with a history are not raced, the best one is fetched
+        self.assertEqual(self.urls[1], selector.race(session, self.urls[:2])[0])
+        self.assertEqual([self.urls[1]], [c[0][0] for c in session.get.call_args_list])
+        # one yet to be tried still is
+        session.get.reset_mock()
+        selector.race(session, self.urls[1:])
+        self.assertEqual(set(self.urls[1:]), set([c[0][0] for c in session.get.call_args_list]))
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestEndpointSelector)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
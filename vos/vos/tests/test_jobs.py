@@ -0,0 +1,121 @@
+# Test the jobs module
+
+import errno
+import unittest
+
+from mock import Mock, patch
+
+from vos.jobs import JobMonitor, JobFuture, POLL_MAX
+
+
+class TestJobMonitor(unittest.TestCase):
+    """Test the JobMonitor class.
+    """
+
+    def setUp(self):
+        self.job_url = 'https://somevospace.server/vospace/transfers/1'
+
+    @patch('vos.jobs.POLL_START', 0)
+    def test_watch(self):
+        session = Mock()
+        session.get.side_effect = [Mock(text='QUEUED'), Mock(text='EXECUTING'), Mock(text='COMPLETED\n')]
+        future = JobMonitor().watch(session, self.job_url)
+        self.assertEqual('COMPLETED', future.result(timeout=5))
+        self.assertTrue(future.done())
+        self.assertEqual(3, session.get.call_count)
+        session.get.assert_called_with(self.job_url + '/phase', allow_redirects=False)
+
+        # the outcome comes from resolve
+        session.get.side_effect = [Mock(text='ERROR')]
+        future = JobMonitor().watch(session, self.job_url, Mock(side_effect=OSError(errno.EIO, 'failed')))
+        with self.assertRaises(OSError):
+            future.result(timeout=5)
+        self.assertEqual(errno.EIO, future.exception().errno)
+
+        session.get.side_effect = [Mock(text='ABORTED')]
+        future = JobMonitor().watch(session, self.job_url, lambda phase: phase.lower())
+        self.assertEqual('aborted', future.result(timeout=5))
+
+    @patch('vos.jobs.POLL_START', 0)
+    @patch('vos.jobs.MAX_POLL_ERRORS', 2)
+    def test_poll_errors(self):
+        session = Mock()
+        failed = Mock(raise_for_status=Mock(side_effect=IOError("503")))
+        session.get.side_effect = [failed, Mock(text='COMPLETED')]
+        self.assertEqual('COMPLETED', JobMonitor().watch(session, self.job_url).result(timeout=5))
+
+        session.get.side_effect = [failed, failed]
+        with self.assertRaises(IOError):
+            JobMonitor().watch(session, self.job_url).result(timeout=5)
+
+    @patch('vos.jobs.POLL_START', 0.01)
+    def test_many_jobs(self):
+        monitor = JobMonitor()
+        polls = {}
+
+        def get(url, allow_redirects=None):
+            polls[url] = polls.get(url, 0) + 1
+            return Mock(text=polls[url] < 3 and 'EXECUTING' or 'COMPLETED')
+
+        session = Mock()
+        session.get.side_effect = get
+        futures = [monitor.watch(session, '{0}{1}'.format(self.job_url, i)) for i in range(20)]
+        self.assertEqual(['COMPLETED'] * 20, [future.result(timeout=5) for future in futures])
+        self.assertEqual(3 * 20, session.get.call_count)
+        self.assertEqual(0, len(monitor))
+
+    @patch('vos.jobs.POLL_START', 0.01)
+    def test_fork(self):
+        monitor = JobMonitor()
+        session = Mock()
+        session.get.return_value = Mock(text='COMPLETED')
+        futures = [monitor.watch(session, '{0}{1}'.format(self.job_url, i)) for i in range(4)]
+        self.assertEqual(['COMPLETED'] * 4, [future.result(timeout=5) for future in futures])
+
+        # in a forked child the pool and poller thread of the parent are gone
+        pool = Mock()
+        monitor._pool = pool
+        monitor._pid = -1
+        futures = [monitor.watch(session, '{0}{1}'.format(self.job_url, i)) for i in range(4)]
+        self.assertEqual(['COMPLETED'] * 4, [future.result(timeout=5) for future in futures])
+        pool.map.assert_not_called()
+        self.assertIsNot(pool, monitor._pool)
+
+    def test_interval(self):
+        monitor = JobMonitor()
+        monitor._add = Mock()
+        session = Mock()
+        session.get.return_value = Mock(text='QUEUED')
+        monitor.watch(session, self.job_url)
+        job = monitor._add.call_args[0][0]
+        delays = []
+        for phase in ['QUEUED'] * 8 + ['EXECUTING', 'EXECUTING']:
+            session.get.return_value = Mock(text=phase)
+            monitor._poll(job)
+            delays.append(monitor._add.call_args[0][1])
+        # the interval doubles while the phase stays the same, and starts over when it changes
+        self.assertEqual([0.5, 1, 2, 4, 8, 16, POLL_MAX, POLL_MAX, 0.5, 1], delays)
+
+    def test_future(self):
+        future = JobFuture(self.job_url)
+        with self.assertRaises(OSError):
+            future.result(timeout=0.01)
+        callback = Mock()
+        future.add_done_callback(callback)
+        callback.assert_not_called()
+        future.set_result(0)
+        callback.assert_called_once_with(future)
+        self.assertEqual(0, future.result())
+        self.assertIsNone(future.exception())
+        # callbacks added later are called right away
+        future.add_done_callback(callback)
+        self.assertEqual(2, callback.call_count)
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestJobMonitor)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,77 @@
+# Test the listing module
+
+import io
+import unittest
+
+from vos import listing
+from vos.vos import Node
+
+CONTAINER = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<vos:node xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xmlns:vos="http://www.ivoa.net/xml/VOSpace/v2.0" uri="vos://cadc.nrc.ca!vospace/dir" '
+    'xsi:type="vos:ContainerNode">'
+    '<vos:properties><vos:property uri="ivo://ivoa.net/vospace/core#length">0</vos:property>'
+    '<vos:property uri="ivo://ivoa.net/vospace/core#date">2017-01-01T00:00:00.000</vos:property></vos:properties>'
+    '<vos:nodes>{0}</vos:nodes>'
+    '</vos:node>')
+CHILD = (
+    '<vos:node uri="vos://cadc.nrc.ca!vospace/dir/file{0}" xsi:type="vos:DataNode">'
+    '<vos:properties><vos:property uri="ivo://ivoa.net/vospace/core#length">{0}</vos:property>'
+    '<vos:property uri="ivo://ivoa.net/vospace/core#date">2017-01-01T00:00:00.000</vos:property></vos:properties>'
+    '</vos:node>')
+DATA = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<vos:node xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xmlns:vos="http://www.ivoa.net/xml/VOSpace/v2.0" uri="vos://cadc.nrc.ca!vospace/dir/file" '
+    'xsi:type="vos:DataNode">'
+    '<vos:properties><vos:property uri="ivo://ivoa.net/vospace/core#length">10</vos:property>'
+    '<vos:property uri="ivo://ivoa.net/vospace/core#date">2017-01-01T00:00:00.000</vos:property></vos:properties>'
+    '</vos:node>')
+
+
+class TestListing(unittest.TestCase):
+    """Test the iter_elements function.
+    """
+
+    def test_container(self):
+        document = CONTAINER.format(''.join([CHILD.format(i) for i in range(1000)]))
+        elements = listing.iter_elements(io.BytesIO(document.encode('utf-8')))
+        node = Node(next(elements))
+        self.assertEqual('dir', node.name)
+        self.assertTrue(node.isdir())
+        self.assertEqual('2017-01-01T00:00:00.000', node.props['date'])
+        # the node never holds the children
+        self.assertIsNone(node.node.find(listing.NODES))
+        self.assertEqual(2, node.attr['st_nlink'])
+        names = []
+        lengths = []
+        for element in elements:
+            child = Node(element)
+            names.append(child.name)
+            lengths.append(child.props['length'])
+        self.assertEqual(['file{0}'.format(i) for i in range(1000)], names)
+        self.assertEqual([str(i) for i in range(1000)], lengths)
+        self.assertEqual([], node.node_list)
+
+    def test_empty_container(self):
+        elements = listing.iter_elements(io.BytesIO(CONTAINER.format('').encode('utf-8')))
+        node = Node(next(elements))
+        self.assertEqual('dir', node.name)
+        self.assertEqual([], list(elements))
+
+    def test_data_node(self):
+        elements = list(listing.iter_elements(io.BytesIO(DATA.encode('utf-8'))))
+        self.assertEqual(1, len(elements))
+        node = Node(elements[0])
+        self.assertEqual('file', node.name)
+        self.assertEqual('10', node.props['length'])
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestListing)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
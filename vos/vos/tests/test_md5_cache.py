@@ -3,8 +3,8 @@
 import unittest
 import hashlib
 
-from vos.md5_cache import MD5_Cache
-from mock import patch, MagicMock, Mock, call, mock_open
+from vos.md5_cache import MD5_Cache, MD5Reader
+from mock import patch, MagicMock, call, mock_open
 
 # The following is a temporary workaround for Python issue 25532 (https://bugs.python.org/issue25532)
 call.__wrapped__ = None
@@ -65,9 +65,28 @@ class TestMD5Cache(unittest.TestCase):
         with patch('six.moves.builtins.open', mock_open(read_data=b''.join(buffer))):
                 self.assertEquals(expect_md5.hexdigest(), md5_cache.computeMD5('fakefile', 4))
 
+class TestMD5Reader(unittest.TestCase):
+    """Test the MD5Reader class.
+    """
+
+    def test_read(self):
+        file_mock = MagicMock()
+        buffer = [b'abcd', b'efgh', b'']
+        file_mock.read.side_effect = buffer
+
+        reader = MD5Reader(file_mock, 8)
+        self.assertEqual(8, len(reader))
+        self.assertEqual(b'abcd', reader.read(4))
+        self.assertEqual(hashlib.md5(b'abcd').hexdigest(), reader.hexdigest())
+        self.assertEqual(b'efgh', reader.read(4))
+        self.assertEqual(b'', reader.read(4))
+        self.assertEqual(hashlib.md5(b'abcdefgh').hexdigest(), reader.hexdigest())
+        file_mock.read.assert_called_with(4)
+
 def run():
     suite1 = unittest.TestLoader().loadTestsFromTestCase(TestMD5Cache)
-    allTests = unittest.TestSuite([suite1])
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(TestMD5Reader)
+    allTests = unittest.TestSuite([suite1, suite2])
     return unittest.TextTestRunner(verbosity=2).run(allTests)
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+# Test the pool module
+
+import threading
+import unittest
+
+import requests
+from six.moves import BaseHTTPServer
+
+from vos.pool import size_pools, pool_stats, POOL_HOSTS
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer each GET with a short body, keeping the connection open."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPool(unittest.TestCase):
+    """Test the pool functions.
+    """
+
+    def test_size_pools(self):
+        session = requests.Session()
+        size_pools(session, 30, hosts={'data.ca': 50})
+        self.assertEqual(30, session.get_adapter('https://ws.ca/vospace/nodes')._pool_maxsize)
+        self.assertEqual(POOL_HOSTS, session.get_adapter('https://ws.ca/vospace/nodes')._pool_connections)
+        self.assertEqual(30, session.get_adapter('http://ws.ca/vospace/nodes')._pool_maxsize)
+        self.assertEqual(50, session.get_adapter('https://data.ca/data/file')._pool_maxsize)
+        # the other hosts are not matched by the prefix of a host
+        self.assertEqual(30, session.get_adapter('https://data.ca.org/data/file')._pool_maxsize)
+
+    def test_pool_stats(self):
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            session = requests.Session()
+            size_pools(session, 2)
+            url = 'http://127.0.0.1:{0}/file'.format(server.server_port)
+            for i in range(3):
+                self.assertEqual(b'ok', session.get(url).content)
+            self.assertEqual({'127.0.0.1': {'requests': 3, 'connections': 1, 'reused': 2}},
+                             pool_stats([session]))
+            self.assertEqual({}, pool_stats([requests.Session()]))
+            session.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestPool)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
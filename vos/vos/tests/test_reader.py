@@ -0,0 +1,153 @@
+# Test the reader module
+
+import io
+import unittest
+
+from mock import Mock, MagicMock, patch
+
+from vos.reader import DataReader
+
+DATA = bytes(bytearray(range(256))) * 64
+
+
+def response(data, status=200, headers=None, fail_after=None):
+    """A streamed response serving data, breaking after fail_after bytes if given."""
+    resp = Mock(status_code=status, headers=headers or {})
+    body = io.BytesIO(data)
+
+    def read(size):
+        if fail_after is not None and body.tell() >= fail_after:
+            raise IOError("connection reset")
+        return body.read(size)
+    resp.raw.read = read
+    return resp
+
+
+def serve(data, urls=None, broken=(), ignore_range=False):
+    """A session GET serving data with Range support, the URLs in broken fail half way through."""
+    calls = []
+
+    def get(url, headers=None, stream=True, **kwargs):
+        calls.append((url, dict(headers or {})))
+        if urls is not None and url not in urls:
+            raise IOError("unknown url {0}".format(url))
+        fail_after = url in broken and len(data) // 2 or None
+        byte_range = (headers or {}).get('Range')
+        if byte_range is None or ignore_range:
+            return response(data, headers={'Content-Length': str(len(data))}, fail_after=fail_after)
+        first, last = byte_range[len('bytes='):].split('-')
+        first = int(first)
+        last = last and int(last) or len(data) - 1
+        if first >= len(data):
+            return response(b'', status=416)
+        headers = {'Content-Range': 'bytes {0}-{1}/{2}'.format(first, last, len(data))}
+        return response(data[first:last + 1], status=206, headers=headers,
+                        fail_after=fail_after and max(0, fail_after - first))
+    session = MagicMock()
+    session.get.side_effect = get
+    return session, calls
+
+
+class TestDataReader(unittest.TestCase):
+    """Test the DataReader class.
+    """
+
+    def test_read(self):
+        for readahead in (0, 4096):
+            session, calls = serve(DATA)
+            raw = DataReader(session, ['http://a.ca/f'], readahead=readahead, chunk_size=1000)
+            self.assertTrue(raw.readable())
+            self.assertTrue(raw.seekable())
+            buf = bytearray(300)
+            self.assertEqual(300, raw.readinto(buf))
+            self.assertEqual(DATA[:300], bytes(buf))
+            self.assertEqual(len(DATA), raw.size)
+            fin = io.BufferedReader(raw, 512)
+            self.assertEqual(DATA[300:], fin.read())
+            self.assertEqual(b'', fin.read())
+            self.assertEqual(1, len(calls))
+            self.assertEqual({}, calls[0][1])
+            fin.close()
+            self.assertTrue(raw.closed)
+
+    def test_unknown_size(self):
+        # a chunked response: the size is only known once the stream ends
+        for readahead in (0, 4096):
+            session = MagicMock()
+            session.get.side_effect = lambda url, headers=None, stream=True, **kwargs: response(DATA)
+            raw = DataReader(session, ['http://a.ca/f'], readahead=readahead, chunk_size=1000)
+            fin = io.BufferedReader(raw, 512)
+            self.assertEqual(DATA, fin.read())
+            self.assertIsNone(raw.limit)
+            # reading past the end again neither blocks nor reconnects
+            self.assertEqual(b'', fin.read())
+            self.assertEqual(b'', io.BufferedReader(raw).read())
+            self.assertEqual(1, session.get.call_count)
+            fin.close()
+
+    def test_seek(self):
+        session, calls = serve(DATA)
+        fin = io.BufferedReader(DataReader(session, ['http://a.ca/f'], chunk_size=1000), 100)
+        self.assertEqual(DATA[:10], fin.read(10))
+        fin.seek(5000)
+        self.assertEqual(DATA[5000:5010], fin.read(10))
+        self.assertEqual(5010, fin.tell())
+        self.assertEqual({'Range': 'bytes=5000-'}, calls[-1][1])
+        fin.seek(-16, io.SEEK_END)
+        self.assertEqual(DATA[-16:], fin.read())
+        self.assertEqual({'Range': 'bytes={0}-'.format(len(DATA) - 16)}, calls[-1][1])
+        # past the end nothing is requested
+        ncalls = len(calls)
+        fin.seek(len(DATA) + 10)
+        self.assertEqual(b'', fin.read(10))
+        self.assertEqual(ncalls, len(calls))
+
+    def test_range(self):
+        session, calls = serve(DATA)
+        raw = DataReader(session, ['http://a.ca/f'], end=100, readahead=0)
+        self.assertEqual(DATA[:100], raw.read())
+        self.assertEqual({'Range': 'bytes=0-99'}, calls[0][1])
+        # a server ignoring the Range is skipped up to the position
+        session, calls = serve(DATA, ignore_range=True)
+        raw = DataReader(session, ['http://a.ca/f'], readahead=0, chunk_size=1000)
+        raw.seek(3000)
+        self.assertEqual(DATA[3000:3010], raw.read(10))
+
+    @patch('vos.reader.time.sleep')
+    def test_resume(self, sleep):
+        # a response breaking half way is resumed from the next URL at the current position
+        urls = ['http://a.ca/f', 'http://b.ca/f']
+        session, calls = serve(DATA, broken=['http://a.ca/f'])
+        selector = Mock()
+        selector.order.side_effect = lambda u: list(u)
+        raw = DataReader(session, urls, selector=selector, chunk_size=1000)
+        self.assertEqual(DATA, io.BufferedReader(raw).read())
+        self.assertEqual(1, raw.reconnects)
+        self.assertEqual('http://b.ca/f', calls[-1][0])
+        self.assertTrue(calls[-1][1]['Range'].startswith('bytes='))
+        selector.record_failure.assert_called_once_with('http://a.ca/f')
+        sleep.assert_not_called()
+
+        # once every URL failed the transfer is negotiated again
+        session, calls = serve(DATA, urls=['http://c.ca/f'])
+        renegotiate = Mock(return_value=['http://c.ca/f'])
+        raw = DataReader(session, urls, renegotiate=renegotiate, readahead=0)
+        self.assertEqual(DATA, raw.readall())
+        renegotiate.assert_called_once_with()
+        self.assertEqual(1, sleep.call_count)
+
+        # and the retries are bounded
+        session, calls = serve(DATA, urls=[])
+        raw = DataReader(session, urls, readahead=0)
+        with self.assertRaises(IOError):
+            raw.read(10)
+        self.assertEqual(6, len(calls))
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestDataReader)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
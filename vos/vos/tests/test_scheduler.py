@@ -0,0 +1,100 @@
+# Test the scheduler module
+
+import threading
+import time
+import unittest
+
+from mock import Mock
+
+from vos.scheduler import TransferScheduler, TokenBucket, config_rates, UPLOAD, DOWNLOAD, INTERACTIVE, BULK, \
+    MB, MIN_SLICE, SLICE_TIME
+
+
+class TestTransferScheduler(unittest.TestCase):
+    """Test the TransferScheduler class.
+    """
+
+    def test_unlimited(self):
+        scheduler = TransferScheduler()
+        self.assertFalse(scheduler.limited)
+        self.assertEqual(0.0, scheduler.acquire(10 * MB, UPLOAD))
+        self.assertEqual(2 ** 23, scheduler.slice_size(UPLOAD, 2 ** 23))
+        # a limit on uploads does not slow down downloads
+        scheduler = TransferScheduler(upload_rate=MB)
+        self.assertTrue(scheduler.limited)
+        self.assertEqual(0.0, scheduler.acquire(10 * MB, DOWNLOAD))
+        self.assertEqual(2 ** 23, scheduler.slice_size(DOWNLOAD, 2 ** 23))
+        self.assertEqual(int(MB * SLICE_TIME), scheduler.slice_size(UPLOAD, 2 ** 23))
+
+    def test_rate(self):
+        rate = 4 * MB
+        scheduler = TransferScheduler(rate=rate)
+        chunk = 2 ** 18
+        # use up the burst, then 2 MB must take about half a second
+        scheduler.acquire(rate, UPLOAD)
+        start = time.time()
+        for _ in range(2 * MB // chunk):
+            scheduler.acquire(chunk, UPLOAD)
+        elapsed = time.time() - start
+        self.assertTrue(0.3 < elapsed < 1.5, elapsed)
+        self.assertTrue(scheduler.waited > 0.3)
+
+    def test_direction(self):
+        scheduler = TransferScheduler(rate=100 * MB, download_rate=MB)
+        scheduler.acquire(MB, DOWNLOAD)
+        start = time.time()
+        scheduler.acquire(MB // 4, DOWNLOAD)
+        self.assertTrue(time.time() - start > 0.5)
+        # uploads only count against the aggregate
+        start = time.time()
+        scheduler.acquire(MB, UPLOAD)
+        self.assertTrue(time.time() - start < 0.2)
+
+    def test_preempt(self):
+        scheduler = TransferScheduler(rate=MB)
+        order = []
+
+        def transfer(priority, delay):
+            time.sleep(delay)
+            scheduler.acquire(MB // 4, UPLOAD if priority == BULK else DOWNLOAD, priority)
+            order.append(priority)
+
+        # empty the bucket so everybody has to wait
+        scheduler.acquire(MB, UPLOAD)
+        threads = [threading.Thread(target=transfer, args=(BULK, 0))]
+        threads.append(threading.Thread(target=transfer, args=(INTERACTIVE, 0.05)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        # the bulk upload waited first, the interactive read still went ahead
+        self.assertEqual([INTERACTIVE, BULK], order)
+
+    def test_split(self):
+        scheduler = TransferScheduler(rate=8 * MB, upload_rate=4 * MB)
+        scheduler.split(4)
+        self.assertEqual({None: 2 * MB, UPLOAD: MB, DOWNLOAD: 0}, scheduler.rates)
+
+    def test_bucket(self):
+        bucket = TokenBucket(MB)
+        self.assertEqual(MB / 2, bucket.tokens)
+        bucket.tokens = -MB / 4
+        self.assertEqual(0.25, bucket.delay())
+        bucket.refill(bucket.updated + 1.0)
+        self.assertEqual(MB / 2, bucket.tokens)
+        self.assertEqual(MIN_SLICE, TokenBucket(1).burst)
+
+    def test_config(self):
+        config = Mock()
+        config.get.side_effect = lambda section, option: {'bandwidth': '10', 'upload_bandwidth': None,
+                                                          'download_bandwidth': '0.5'}[option]
+        self.assertEqual([10 * MB, 0, MB / 2], config_rates(config))
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestTransferScheduler)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,110 @@
+# Test the tls module
+
+import os
+import ssl
+import threading
+import unittest
+
+import requests
+from mock import patch
+from six.moves import BaseHTTPServer
+
+from vos import tls
+from vos.tls import TLSAdapter, TLSSessions
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+SERVER_CERT = os.path.join(DATA_DIR, 'test-server.pem')  # self signed for 127.0.0.1
+SERVER_KEY = os.path.join(DATA_DIR, 'test-server.key')
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer each GET with a short body, keeping the connection open."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipUnless(tls.RESUMPTION, "TLS sessions can not be resumed by this python")
+class TestTLS(unittest.TestCase):
+    """Test the resumption of TLS sessions.
+    """
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(SERVER_CERT, SERVER_KEY)
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'https://127.0.0.1:{0}/file'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, sessions):
+        session = requests.Session()
+        session.mount('https://', TLSAdapter(sessions, pool_maxsize=2))
+        self.assertEqual(b'ok', session.get(self.url, verify=SERVER_CERT).content)
+        session.close()
+
+    def test_resume(self):
+        sessions = TLSSessions()
+        # the sessions of a context are resumed by new connections of any requests session using it
+        for i in range(3):
+            self.get(sessions)
+        self.assertEqual({'handshakes': 3, 'resumed': 2}, sessions.stats())
+        self.assertIs(sessions.context(), sessions.context(None))
+        self.assertIsNot(sessions.context(), sessions.context(('cert.pem', 'cert.pem')))
+
+        # the certificate of the server is still verified
+        session = requests.Session()
+        session.mount('https://', TLSAdapter(TLSSessions()))
+        with self.assertRaises(requests.exceptions.SSLError):
+            session.get(self.url)
+
+    def test_verify(self):
+        sessions = TLSSessions()
+        self.assertIsNot(sessions.context(), sessions.context(verify=False))
+        self.assertIs(sessions.context(verify=SERVER_CERT), sessions.context(None, SERVER_CERT))
+        # each request connects with the context of its own verify setting
+        session = requests.Session()
+        session.trust_env = False
+        session.verify = SERVER_CERT
+        session.mount('https://', TLSAdapter(sessions))
+        self.assertEqual(b'ok', session.get(self.url).content)
+        # the server answers one connection at a time
+        session.close()
+        self.assertEqual(b'ok', session.send(requests.Request('GET', self.url).prepare(), verify=False).content)
+        self.assertEqual(1, sessions.context(verify=SERVER_CERT).handshakes)
+        self.assertEqual(1, sessions.context(verify=False).handshakes)
+        # so one sent without checks leaves those of the others on
+        self.assertEqual(ssl.CERT_NONE, sessions.context(verify=False).verify_mode)
+        self.assertEqual(ssl.CERT_REQUIRED, sessions.context(verify=SERVER_CERT).verify_mode)
+        session.close()
+        with patch.dict(os.environ, {'REQUESTS_CA_BUNDLE': SERVER_CERT}):
+            # a CA bundle from the environment is a setting of its own, as it is for requests
+            session = requests.Session()
+            session.verify = False
+            session.mount('https://', TLSAdapter(sessions))
+            self.assertEqual(b'ok', session.get(self.url).content)
+            self.assertEqual(2, sessions.context(verify=SERVER_CERT).handshakes)
+            session.close()
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestTLS)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
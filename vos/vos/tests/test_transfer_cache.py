@@ -0,0 +1,76 @@
+# Test the transfer_cache module
+
+import unittest
+
+from mock import patch
+
+from vos.transfer_cache import TransferCache
+
+
+class TestTransferCache(unittest.TestCase):
+    """Test the TransferCache class.
+    """
+
+    def test_get_put(self):
+        cache = TransferCache(ttl=60)
+        key = TransferCache.key('vos://cadc.nrc.ca!vospace/dir/file', 'GET', 'data')
+        self.assertEqual(('vos://cadc.nrc.ca!vospace/dir/file', 'GET', 'data', None), key)
+        self.assertIsNone(cache.get(key))
+
+        cache.put(key, ['http://a.ca/file', 'http://b.ca/file'])
+        urls = cache.get(key)
+        self.assertEqual(['http://a.ca/file', 'http://b.ca/file'], urls)
+        # callers get their own copy to pop from
+        urls.pop(0)
+        self.assertEqual(['http://a.ca/file', 'http://b.ca/file'], cache.get(key))
+        self.assertIsNone(cache.get(TransferCache.key('vos://cadc.nrc.ca!vospace/dir/file', 'PUT')))
+
+    def test_expiry(self):
+        cache = TransferCache(ttl=60)
+        key = TransferCache.key('vos://cadc.nrc.ca!vospace/file', 'GET', 'data')
+        with patch('vos.transfer_cache.time.time', return_value=1000.0):
+            cache.put(key, ['http://a.ca/file'])
+        with patch('vos.transfer_cache.time.time', return_value=1059.0):
+            self.assertEqual(['http://a.ca/file'], cache.get(key))
+        with patch('vos.transfer_cache.time.time', return_value=1061.0):
+            self.assertIsNone(cache.get(key))
+        self.assertEqual(0, len(cache))
+
+        # a ttl of 0 disables the cache
+        cache = TransferCache(ttl=0)
+        cache.put(key, ['http://a.ca/file'])
+        self.assertIsNone(cache.get(key))
+
+    def test_size(self):
+        cache = TransferCache(size=2)
+        keys = [TransferCache.key('vos://cadc.nrc.ca!vospace/{0}'.format(i), 'GET', 'data') for i in range(3)]
+        cache.put(keys[0], ['http://a.ca/0'])
+        cache.put(keys[1], ['http://a.ca/1'])
+        # using the first entry makes the second the least recently used
+        cache.get(keys[0])
+        cache.put(keys[2], ['http://a.ca/2'])
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(['http://a.ca/0'], cache.get(keys[0]))
+
+    def test_invalidate(self):
+        cache = TransferCache()
+        uri = 'vos://cadc.nrc.ca!vospace/dir/file'
+        cache.put(TransferCache.key(uri, 'GET', 'data'), ['http://a.ca/file'])
+        cache.put(TransferCache.key(uri, 'GET', 'cutout', '[1]'), ['http://a.ca/file?cutout=[1]'])
+        cache.put(TransferCache.key(uri, 'PUT'), ['http://a.ca/file'])
+        cache.put(TransferCache.key(uri + '2', 'PUT'), ['http://a.ca/file2'])
+        cache.invalidate(uri + '/')
+        self.assertEqual(1, len(cache))
+        self.assertEqual(['http://a.ca/file2'], cache.get(TransferCache.key(uri + '2', 'PUT')))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestTransferCache)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,328 @@
+# Test the upload module
+
+import errno
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+import zlib
+
+import requests
+from mock import Mock, patch, call
+from six.moves import BaseHTTPServer
+
+from vos.upload import FileUpload, MmapBody, SegmentMD5, StreamBody, TransferStats, SENDFILE, MMAP, STREAM, \
+    SEGMENTS, SEGMENT_RETRIES, BLOCK_SIZE
+from vos.scheduler import UPLOAD, INTERACTIVE
+from vos.compression import EncodingSupport
+
+
+class PutHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Keep the body of each PUT in the server's bodies list.
+
+    PUTs to /segments/ paths are assembled from their Content-Range into the server's files, the first attempt
+    at each range listed in the server's flaky list fails.  Bodies with a gzip Content-Encoding are decoded,
+    except on /plain/ paths which refuse them.  PUTs to /redirect/ paths are redirected to /data/.
+    """
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding') != 'chunked':
+            return self.rfile.read(int(self.headers['Content-Length']))
+        body = b''
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            body += self.rfile.read(size)
+            self.rfile.readline()
+            if size == 0:
+                return body
+
+    def do_PUT(self):
+        body = self._read_body()
+        content_range = self.headers.get('Content-Range')
+        self.server.bodies.append((self.path, self.headers.get('X-Test'), body))
+        headers = {}
+        encoding = self.headers.get('Content-Encoding')
+        if self.path.endswith('bad'):
+            status = 500
+        elif self.path.startswith('/redirect/'):
+            status = 307
+            headers['Location'] = self.path.replace('/redirect/', '/data/')
+        elif encoding is not None and self.path.startswith('/plain/'):
+            status = 415
+        elif encoding is not None:
+            self.server.files[self.path] = bytearray(zlib.decompress(body, 16 + zlib.MAX_WBITS))
+            status = 201
+        elif self.path.startswith('/segments/') and content_range is not None:
+            if content_range in self.server.flaky:
+                self.server.flaky.remove(content_range)
+                status = 503
+            else:
+                first, last, total = [int(x) for x in
+                                      content_range.replace('bytes ', '').replace('/', '-').split('-')]
+                data = self.server.files.setdefault(self.path, bytearray(total))
+                data[first:last + 1] = body
+                status = 202
+                headers['Range'] = 'bytes={0}-{1}'.format(first, last)
+        else:
+            self.server.files[self.path] = bytearray(body)
+            status = 201
+        self.send_response(status)
+        for key in headers:
+            self.send_header(key, headers[key])
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestUpload(unittest.TestCase):
+    """Test the FileUpload class.
+    """
+
+    def setUp(self):
+        self.content = os.urandom(100000)
+        handle, self.source = tempfile.mkstemp()
+        os.write(handle, self.content)
+        os.close(handle)
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), PutHandler)
+        self.server.bodies = []
+        self.server.files = {}
+        self.server.flaky = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{0}/data/file'.format(self.server.server_address[1])
+        self.session = requests.Session()
+        self.session.trust_env = False
+        self.session.headers['X-Test'] = 'token'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.session.close()
+        os.remove(self.source)
+
+    def test_method(self):
+        uploader = FileUpload(self.session, self.source)
+        self.assertEqual(len(self.content), uploader.size)
+        if hasattr(os, 'sendfile'):
+            self.assertEqual(SENDFILE, uploader.method(self.url))
+        self.assertEqual(MMAP, uploader.method('https://cadc.ca/data/file'))
+        self.session.proxies = {'http': 'http://proxy.ca:3128'}
+        self.assertEqual(MMAP, uploader.method(self.url))
+        self.assertEqual(STREAM, FileUpload(self.session, self.source, size=0).method(self.url))
+
+    @unittest.skipUnless(hasattr(os, 'sendfile'), "no os.sendfile")
+    def test_sendfile(self):
+        uploader = FileUpload(self.session, self.source, block_size=30000)
+        stats = uploader.put(self.url + '?x=1')
+        self.assertEqual([('/data/file?x=1', 'token', self.content)], self.server.bodies)
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), uploader.md5)
+        self.assertEqual(SENDFILE, stats.method)
+        self.assertEqual(len(self.content), stats.nbytes)
+
+        with self.assertRaises(OSError):
+            uploader.put(self.url + 'bad')
+
+    @unittest.skipUnless(hasattr(os, 'sendfile'), "no os.sendfile")
+    def test_sendfile_again(self):
+        # the send buffer of the socket is full, the upload waits rather than fails
+        sendfile = os.sendfile
+        busy = [OSError(errno.EAGAIN, 'Resource temporarily unavailable')] * 2
+
+        def full(*args):
+            if busy:
+                raise busy.pop()
+            return sendfile(*args)
+        uploader = FileUpload(self.session, self.source, block_size=30000, timeout=5)
+        with patch('vos.upload.os.sendfile', side_effect=full):
+            self.assertEqual(SENDFILE, uploader.put(self.url).method)
+        self.assertEqual([], busy)
+        self.assertEqual([('/data/file', 'token', self.content)], self.server.bodies)
+
+    @unittest.skipUnless(hasattr(os, 'sendfile'), "no os.sendfile")
+    @patch('vos.upload.SESSION_HOSTS', set())
+    def test_sendfile_redirect(self):
+        # the redirect is followed by a PUT through the session
+        url = self.url.replace('/data/', '/redirect/')
+        uploader = FileUpload(self.session, self.source, block_size=30000)
+        self.assertEqual(MMAP, uploader.put(url).method)
+        self.assertEqual(['/redirect/file', '/redirect/file', '/data/file'], [body[0] for body in self.server.bodies])
+        self.assertEqual(self.content, bytes(self.server.files['/data/file']))
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), uploader.md5)
+        # and the host is not sent files with sendfile again
+        self.assertEqual(MMAP, uploader.method(self.url))
+
+    def test_mmap(self):
+        uploader = FileUpload(self.session, self.source, block_size=30000)
+        uploader.method = Mock(return_value=MMAP)
+        self.assertEqual(MMAP, uploader.put(self.url).method)
+        self.assertEqual([('/data/file', 'token', self.content)], self.server.bodies)
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), uploader.md5)
+
+        with self.assertRaises(requests.HTTPError):
+            uploader.put(self.url + 'bad')
+
+    def test_throttle(self):
+        scheduler = Mock()
+        scheduler.slice_size.return_value = 40000
+        uploader = FileUpload(self.session, self.source, scheduler=scheduler, priority=INTERACTIVE)
+        scheduler.slice_size.assert_called_once_with(UPLOAD, BLOCK_SIZE)
+        self.assertEqual(40000, uploader.block_size)
+        for method in [MMAP, SENDFILE]:
+            if method == SENDFILE and not hasattr(os, 'sendfile'):
+                continue
+            scheduler.acquire.reset_mock()
+            uploader.method = Mock(return_value=method)
+            uploader.put(self.url)
+            # every block is accounted for before it is sent
+            self.assertEqual([call(40000, UPLOAD, INTERACTIVE)] * (len(self.content) // 40000) +
+                             [call(len(self.content) % 40000, UPLOAD, INTERACTIVE)],
+                             scheduler.acquire.call_args_list)
+
+    @patch('vos.compression.SUPPORT', EncodingSupport())
+    def test_content_encoding(self):
+        uploader = FileUpload(self.session, self.source, content_encoding='gzip')
+        self.assertEqual('gzip', uploader.put(self.url).method)
+        self.assertEqual('gzip', uploader.sent_encoding)
+        self.assertEqual(self.content, bytes(self.server.files['/data/file']))
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), uploader.md5)
+
+        # an endpoint refusing the encoding gets the file as is, and is not asked again
+        url = 'http://127.0.0.1:{0}/plain/file'.format(self.server.server_address[1])
+        self.assertIn(uploader.put(url).method, [SENDFILE, MMAP])
+        self.assertIsNone(uploader.sent_encoding)
+        self.assertEqual(self.content, bytes(self.server.files['/plain/file']))
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), uploader.md5)
+        self.assertEqual(3, len(self.server.bodies))
+        uploader.put(self.url)
+        self.assertEqual(4, len(self.server.bodies))
+        self.assertEqual(self.content, self.server.bodies[-1][2])
+
+    def test_stream(self):
+        with open(self.source, 'wb'):
+            pass
+        uploader = FileUpload(self.session, self.source)
+        self.assertEqual(STREAM, uploader.put(self.url).method)
+        self.assertEqual([('/data/file', 'token', b'')], self.server.bodies)
+        self.assertEqual(hashlib.md5(b'').hexdigest(), uploader.md5)
+
+    def test_segments(self):
+        url = 'http://127.0.0.1:{0}/segments/file'.format(self.server.server_address[1])
+        uploader = FileUpload(self.session, self.source, nstreams=3, segment_size=30000, segments=True)
+        self.assertEqual(SEGMENTS, uploader.method(url))
+        # unless asked for, one stream or a small file is sent in a single PUT
+        self.assertNotEqual(SEGMENTS, FileUpload(self.session, self.source, nstreams=3, segment_size=30000).method(url))
+        self.assertNotEqual(SEGMENTS, FileUpload(self.session, self.source, segment_size=30000,
+                                                 segments=True).method(url))
+        self.assertNotEqual(SEGMENTS, FileUpload(self.session, self.source, nstreams=3, segments=True).method(url))
+        self.server.flaky.append('bytes 60000-89999/100000')
+        stats = uploader.put(url)
+        self.assertEqual(SEGMENTS, stats.method)
+        self.assertEqual(self.content, bytes(self.server.files['/segments/file']))
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), uploader.md5)
+        # only the failed segment was sent twice
+        self.assertEqual(5, len(self.server.bodies))
+        self.assertEqual([0, 30000, 60000, 60000, 90000],
+                         sorted([self.content.index(body[2]) for body in self.server.bodies]))
+
+        # a segment that keeps failing fails the upload
+        self.server.bodies = []
+        self.server.flaky.extend(['bytes 90000-99999/100000'] * SEGMENT_RETRIES)
+        with self.assertRaises(OSError):
+            uploader.put(url)
+
+    def test_segments_not_supported(self):
+        # the service stores the first segment as the whole file, the upload is redone as a single PUT
+        uploader = FileUpload(self.session, self.source, nstreams=3, segment_size=30000, segments=True)
+        stats = uploader.put(self.url)
+        self.assertNotEqual(SEGMENTS, stats.method)
+        self.assertEqual(2, len(self.server.bodies))
+        self.assertEqual(30000, len(self.server.bodies[0][2]))
+        self.assertEqual(self.content, bytes(self.server.files['/data/file']))
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), uploader.md5)
+
+        # a service refusing segments
+        session = Mock()
+        session.put.return_value = Mock(status_code=501, headers={})
+        with self.assertRaises(OSError) as ex:
+            FileUpload(session, self.source)._put_segment(self.url, memoryview(self.content), (0, 9), probe=True)
+        self.assertEqual(errno.EOPNOTSUPP, ex.exception.errno)
+
+    def test_segments_stored(self):
+        url = 'http://127.0.0.1:{0}/segments/file'.format(self.server.server_address[1])
+        probe = (30000, hashlib.md5(self.content[:30000]).hexdigest())
+        # the first segment is found stored as the file
+        uploader = FileUpload(self.session, self.source, nstreams=3, segment_size=30000, segments=True,
+                              stored=lambda: probe)
+        self.assertNotEqual(SEGMENTS, uploader.put(url).method)
+        self.assertEqual(2, len(self.server.bodies))
+        self.assertEqual(self.content, bytes(self.server.files['/segments/file']))
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), uploader.md5)
+
+        # the file stored in the end is not the one sent
+        self.server.bodies = []
+        stored = Mock(side_effect=[(0, None), probe])
+        uploader = FileUpload(self.session, self.source, nstreams=3, segment_size=30000, segments=True,
+                              stored=stored)
+        self.assertNotEqual(SEGMENTS, uploader.put(url).method)
+        self.assertEqual(5, len(self.server.bodies))
+        self.assertEqual(2, stored.call_count)
+
+        # and once it is, the segments are done with
+        self.server.bodies = []
+        uploader = FileUpload(self.session, self.source, nstreams=3, segment_size=30000, segments=True,
+                              stored=lambda: (len(self.content), hashlib.md5(self.content).hexdigest()))
+        self.assertEqual(SEGMENTS, uploader.put(url).method)
+        self.assertEqual(4, len(self.server.bodies))
+
+    def test_mmap_body(self):
+        md5 = hashlib.md5()
+        body = MmapBody(memoryview(b'abcdefg'), md5, block_size=3)
+        self.assertEqual(7, len(body))
+        self.assertEqual([b'abc', b'def', b'g'], [bytes(block) for block in body])
+        self.assertEqual(hashlib.md5(b'abcdefg').hexdigest(), md5.hexdigest())
+
+    def test_segment_md5(self):
+        data = memoryview(b'0123456789abcdefghij')
+        md5 = SegmentMD5()
+        # the segments are sent out of order, the third one twice
+        for first, last in [(10, 14), (15, 19), (15, 19), (0, 9)]:
+            list(MmapBody(data[first:last + 1], md5.at(first), block_size=3))
+        self.assertEqual(20, md5.position)
+        self.assertEqual(hashlib.md5(data).hexdigest(), md5.hexdigest())
+
+        # a segment that never went out
+        md5 = SegmentMD5()
+        list(MmapBody(data[10:], md5.at(10)))
+        with self.assertRaises(OSError):
+            md5.hexdigest()
+
+    def test_stream_body(self):
+        md5 = hashlib.md5()
+        throttle = Mock()
+        body = StreamBody(iter([b'abc', b'defg']), 7, md5, throttle)
+        self.assertEqual(7, len(body))
+        self.assertEqual(b'abcdefg', b''.join(body))
+        self.assertEqual(7, body.nbytes)
+        self.assertEqual([call(3), call(4)], throttle.call_args_list)
+        self.assertEqual(hashlib.md5(b'abcdefg').hexdigest(), md5.hexdigest())
+
+    def test_stats(self):
+        stats = TransferStats(MMAP, 2 ** 21, 2.0)
+        self.assertEqual(2 ** 20, stats.throughput)
+        self.assertEqual('2097152 bytes in 2.000s (1.00 MB/s) using mmap', str(stats))
+        self.assertEqual(0, TransferStats(STREAM).throughput)
+        self.assertEqual('1024 bytes in 1.000s (0.00 MB/s) using stream in chunks of 512 bytes',
+                         str(TransferStats(STREAM, 1024, 1.0, 512)))
+
+
+def run():
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TestUpload)
+    allTests = unittest.TestSuite([suite1])
+    return unittest.TextTestRunner(verbosity=2).run(allTests)
+
+if __name__ == "__main__":
+    run()
@@ -1,11 +1,21 @@
 # Test the vos Client class
  
+import errno
+import gc
+import hashlib
+import io
 import os
+import stat
+import tempfile
 import unittest
+import zlib
 import requests
 from xml.etree import ElementTree
-from mock import Mock, patch, MagicMock, call, mock_open
-from vos import Client, Connection, Node, VOFile
+from mock import ANY, Mock, patch, MagicMock, call, mock_open
+from vos import Client, Connection, DirEntry, Node, VOFile
+from vos.compression import EncodingSupport
+from vos.cutout_cache import CutoutCache
+from vos.health import EndpointSelector
 
 # The following is a temporary workaround for Python issue 25532 (https://bugs.python.org/issue25532)
 call.__wrapped__ = None
@@ -31,6 +41,18 @@ class Object(object):
     pass
 
 
+def node_file(xml):
+    """A VOFile like object reading the node document xml."""
+    fobj = io.BytesIO(xml.encode('UTF-8'))
+    fobj.resp = Mock()
+    return fobj
+
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
 class TestClient(unittest.TestCase):
     """Test the vos Client class.
     """
@@ -102,15 +124,12 @@ class TestClient(unittest.TestCase):
     @patch('vos.vos.Node.get_info', Mock(return_value={'name':'aa'}))
     def test_get_info_list(self):
         # list tuples of a LinkNode
-        mock_node = MagicMock(type='vos:DataNode')
-        mock_node.return_value = mock_node
-        mock_node.name = 'testnode'
-        mock_node.get_info.return_value = {'name':'aa'}
-        mock_link_node = Mock(type='vos:LinkNode')
-        mock_link_node.target = 'vos:/somefile'
+        link_xml = NODE_XML.replace('vos:ContainerNode', 'vos:LinkNode').format(
+            '', '<vos:target>vos:/somefile</vos:target>')
+        node_xml = NODE_XML.replace('vos:ContainerNode', 'vos:DataNode').replace('bar', 'testnode').format('', '')
         client = Client()
-        client.get_node = MagicMock(side_effect=[mock_link_node, mock_node])
-        self.assertEquals({'testnode':mock_node.get_info.return_value}.items(), 
+        client.open = Mock(side_effect=[node_file(link_xml), node_file(node_xml)])
+        self.assertEquals({'testnode': {'name': 'aa'}}.items(),
                           client.get_info_list('vos:/somenode'))
         
                 
@@ -185,7 +204,8 @@ class TestClient(unittest.TestCase):
         mock_base_node.node_list = [mock_node]
         mock_node.node_list = [mock_base_node, mock_child_node1, mock_child_node2]
         client = Client()
-        client.get_node = Mock(side_effect=[mock_node, mock_base_node, mock_node])
+        client.get_node = Mock(return_value=mock_node)
+        client.scandir = Mock(side_effect=[iter(mock_node.node_list), iter(mock_base_node.node_list)])
         self.assertEquals(['vos:/anode/abc'], client.glob('vos:/anode/a*'))
         self.assertEquals(['vos:/anode/abc'], client.glob('vos:/*node/abc'))
         
@@ -215,19 +235,19 @@ class TestClient(unittest.TestCase):
         mock_base_node.name = 'vos:'
         mock_base_node.node_list = [mock_node1, mock_node2]
         client = Client()
-        client.get_node = Mock(side_effect=[mock_base_node, mock_node1, mock_node2])
+        client.scandir = Mock(side_effect=[iter(mock_base_node.node_list), iter(mock_node1.node_list),
+                                           iter(mock_node2.node_list)])
         self.assertEquals(['vos:/bnode/sometests'], 
                           client.glob('vos:/[a,b]node/*test*'))
         
         
+    @patch('vos.vos.os.stat', Mock(return_value=Mock(st_size=4)))
     @patch('vos.vos.md5_cache.MD5_Cache.computeMD5')
-    @patch('__main__.open', MagicMock(), create=True)
     def test_copy(self, computed_md5_mock):
-        # the md5sum of the file being copied
-        md5sum = 'd41d8cd98f00b204e9800998ecf84eee'
-        # patch the compute_md5 function in vos to return the above value
-        computed_md5_mock.return_value = md5sum
-        
+        # the content and md5sum of the file being copied
+        content = b'abcd'
+        md5sum = hashlib.md5(content).hexdigest()
+
         #mock the props of the corresponding node        
         props = MagicMock()
         props.get.return_value = md5sum
@@ -238,17 +258,20 @@ class TestClient(unittest.TestCase):
         
         # mock one by one the chain of connection.session.response.headers
         conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
         session = MagicMock()
         response = MagicMock()
         headers = MagicMock()
         headers.get.return_value = md5sum
         response.headers = headers
+        response.iter_content.return_value = [content[:2], content[2:]]
         session.get.return_value = response
+        # the PUT consumes the file it is given
+        session.put.side_effect = lambda url, data: data.read()
         conn.session = session
         
-        test_client = Client()
         # use the mocked connection instead of the real one
-        test_client.conn = conn
+        test_client = Client(conn=conn)
         get_node_url_mock = Mock(return_value=['http://cadc.ca/test', 'http://cadc.ca/test'])
         test_client.get_node_url = get_node_url_mock
             
@@ -259,86 +282,613 @@ class TestClient(unittest.TestCase):
         # time to test...
         vospaceLocation = 'vos://test/foo'
         osLocation = '/tmp/foo'
-        # copy from vospace
-        test_client.copy(vospaceLocation, osLocation)
+        # copy from vospace, the MD5 is computed from the stream, not by reading back the file
+        with patch('vos.vos.open', mock_open(), create=True) as file_mock:
+            self.assertEqual(md5sum, test_client.copy(vospaceLocation, osLocation, send_md5=True))
         get_node_url_mock.assert_called_once_with(vospaceLocation, method='GET', 
                                               cutout=None, view='data')
-        computed_md5_mock.assert_called_once_with(osLocation)
+        file_mock.return_value.write.assert_has_calls([call(content[:2]), call(content[2:])])
+        computed_md5_mock.assert_not_called()
         get_node_mock.assert_called_once_with(vospaceLocation)
+        self.assertEqual('stream', test_client.transfer_stats.method)
+        self.assertEqual(512 * 1024, test_client.transfer_stats.chunk_size)
         
-        # copy to vospace
+        # copy to vospace, the MD5 is computed by the uploader while the file is sent
         get_node_url_mock.reset_mock()
-        computed_md5_mock.reset_mock()
-        test_client.copy(osLocation, vospaceLocation)
+        with patch('vos.vos.upload.FileUpload') as upload_mock:
+            upload_mock.return_value.md5 = md5sum
+            self.assertEqual(md5sum, test_client.copy(osLocation, vospaceLocation, send_md5=True))
         get_node_url_mock.assert_called_once_with(vospaceLocation, 'PUT')
-        computed_md5_mock.assert_called_once_with(osLocation)
+        computed_md5_mock.assert_not_called()
+        # segmented uploads are off unless configured
+        upload_mock.assert_called_once_with(session, osLocation, nstreams=1, scheduler=test_client.scheduler,
+                                            priority='bulk', content_encoding=None, segments=False, stored=ANY)
+        upload_mock.return_value.put.assert_called_once_with('http://cadc.ca/test')
+        self.assertEqual(upload_mock.return_value.put.return_value, test_client.transfer_stats)
 
         # error tests - md5sum mismatch
-        computed_md5_mock.return_value = '000bad000'
-        with self.assertRaises(OSError):
-            test_client.copy(vospaceLocation, osLocation)
+        props.get.return_value = '000bad000'
+        headers.get.return_value = '000bad000'
+        with patch('vos.vos.open', mock_open(), create=True):
+            with self.assertRaises(OSError):
+                test_client.copy(vospaceLocation, osLocation)
         
-        with self.assertRaises(OSError):
-            test_client.copy(osLocation, vospaceLocation)
+        with patch('vos.vos.upload.FileUpload') as upload_mock:
+            upload_mock.return_value.md5 = md5sum
+            with self.assertRaises(OSError):
+                test_client.copy(osLocation, vospaceLocation)
     
-    # patch sleep to stop the test from sleeping and slowing down execution
-    @patch('vos.vos.time.sleep', MagicMock(), create=True)
-    @patch('vos.vos.VOFile')
-    def test_transfer_error(self, mock_vofile):
-        vofile = MagicMock()
-        mock_vofile.return_value = vofile
+    @patch('vos.vos.os.stat', Mock(return_value=Mock(st_size=2 ** 30)))
+    @patch('vos.vos.md5_cache.MD5_Cache.computeMD5')
+    @patch('vos.vos.download.RangeDownload')
+    def test_copy_parallel(self, range_download_mock, computed_md5_mock):
+        md5sum = 'd41d8cd98f00b204e9800998ecf84eee'
+        computed_md5_mock.return_value = md5sum
+        node = MagicMock(spec=Node)
+        node.props = {'MD5': md5sum, 'length': str(2 ** 30)}
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+        urls = ['http://cadc.ca/a', 'http://cadc.ca/b']
+        test_client.get_node_url = Mock(return_value=urls)
+        test_client.get_node = Mock(return_value=node)
+
+        self.assertEqual(md5sum, test_client.copy('vos://test/foo', '/tmp/foo', send_md5=True, nstreams=4))
+        range_download_mock.assert_called_once_with(conn.session, urls, '/tmp/foo', 2 ** 30, nstreams=4,
+                                                    timeout=test_client.endpoint_selector.timeout, journal=None,
+                                                    scheduler=test_client.scheduler, priority='bulk')
+        range_download_mock.return_value.run.assert_called_once_with()
+        conn.session.get.assert_not_called()
+
+        # small files are not split into ranges
+        range_download_mock.reset_mock()
+        node.props['length'] = '10'
+        node.props['MD5'] = hashlib.md5(b'0123456789').hexdigest()
+        conn.session.get.return_value = MagicMock(headers={})
+        conn.session.get.return_value.iter_content.return_value = [b'0123456789']
+        # with no history of the hosts
+        test_client.endpoint_selector = EndpointSelector()
+        with patch('vos.vos.open', mock_open(), create=True):
+            test_client.copy('vos://test/foo', '/tmp/foo', nstreams=4)
+        range_download_mock.assert_not_called()
+        # the two endpoints are raced
+        self.assertEqual(2, conn.session.get.call_count)
+        # and once they are known only the best one is fetched
+        conn.session.get.reset_mock()
+        with patch('vos.vos.open', mock_open(), create=True):
+            test_client.copy('vos://test/foo', '/tmp/foo', nstreams=4)
+        self.assertEqual(1, conn.session.get.call_count)
+
+    @patch('vos.vos.os.stat', Mock(return_value=Mock(st_size=10)))
+    @patch('vos.vos.md5_cache.MD5_Cache.computeMD5')
+    @patch('vos.vos.download.TransferJournal')
+    @patch('vos.vos.download.RangeDownload')
+    def test_copy_resume(self, range_download_mock, journal_mock, computed_md5_mock):
+        md5sum = 'd41d8cd98f00b204e9800998ecf84eee'
+        computed_md5_mock.return_value = md5sum
+        node = MagicMock(spec=Node)
+        node.props = {'MD5': md5sum, 'length': '10'}
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+        test_client.get_node_url = Mock(return_value=['http://cadc.ca/a'])
+        test_client.get_node = Mock(return_value=node)
+
+        test_client.copy('vos://test/foo', '/tmp/foo', resume=True)
+        journal_mock.assert_called_once_with('/tmp/foo', md5sum, 10)
+        range_download_mock.assert_called_once_with(conn.session, ['http://cadc.ca/a'], '/tmp/foo', 10,
+                                                    nstreams=1, timeout=test_client.endpoint_selector.timeout,
+                                                    journal=journal_mock.return_value,
+                                                    scheduler=test_client.scheduler, priority='bulk')
+        journal_mock.return_value.remove.assert_called_once_with()
+
+        # an interrupted download keeps the journal and asks for a retry
+        journal_mock.reset_mock()
+        range_download_mock.return_value.run.side_effect = IOError("connection reset")
+        with self.assertRaises(OSError) as ex:
+            test_client.copy('vos://test/foo', '/tmp/foo', resume=True)
+        self.assertEqual(errno.EIO, ex.exception.errno)
+        journal_mock.return_value.remove.assert_not_called()
+        conn.session.get.assert_not_called()
+
+    def test_copy_vospace(self):
+        data = b'0123456789'
+        md5sum = hashlib.md5(data).hexdigest()
+        node = MagicMock(spec=Node)
+        node.props = {'MD5': md5sum, 'length': str(len(data))}
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+        test_client.get_node = Mock(return_value=node)
+        test_client.transfer = Mock(return_value=True)
+        src = 'vos://cadc.nrc.ca!vospace/dir/file'
+        dest = 'vos://cadc.nrc.ca!vospace/dir2/file'
+
+        # the service copies the bytes itself
+        self.assertEqual(md5sum, test_client.copy(src, dest, send_md5=True))
+        test_client.transfer.assert_called_once_with(src, dest, view='copy')
+        conn.session.get.assert_not_called()
+        conn.session.put.assert_not_called()
+
+        # without a server side copy the GET is piped into the PUT
+        test_client.transfer.side_effect = OSError(errno.EOPNOTSUPP, "OperationNotSupported")
+        test_client.get_node_url = Mock(side_effect=lambda uri, method='GET', **kwargs:
+                                        ['http://a.ca/' + method])
+        response = Mock(headers={})
+        response.iter_content.return_value = [data[:4], data[4:]]
+        conn.session.get.return_value = response
+        sent = []
+
+        def put(url, data):
+            sent.append((url, len(data), b''.join(data)))
+            return Mock()
+        conn.session.put.side_effect = put
+        self.assertEqual(len(data), test_client.copy(src, dest))
+        self.assertEqual([('http://a.ca/PUT', len(data), data)], sent)
+        conn.session.get.assert_called_once_with('http://a.ca/GET', stream=True, timeout=ANY)
+        self.assertEqual('pipe', test_client.transfer_stats.method)
+
+        # a copy that would fail anyway is not retried as a stream
+        test_client.transfer.side_effect = OSError(errno.ENOENT, "NodeNotFound")
+        with self.assertRaises(OSError) as ex:
+            test_client.copy(src, dest)
+        self.assertEqual(errno.ENOENT, ex.exception.errno)
+        self.assertEqual(1, len(sent))
+
+    def test_put_stream(self):
+        data = b'0123456789' * 1000
+        node = MagicMock(spec=Node)
+        node.props = {'MD5': hashlib.md5(data).hexdigest()}
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+        test_client.get_node = Mock(return_value=node)
+        test_client.get_node_url = Mock(return_value=['http://a.ca/file', 'http://b.ca/file'])
+        sent = []
+
+        def put(url, data, headers=None):
+            if url == 'http://a.ca/file':
+                raise IOError("connection refused")
+            sent.append((url, b''.join(data)))
+            return Mock()
+        conn.session.put.side_effect = put
+
+        # a file-like object, the first URL failed before reading any of it
+        self.assertEqual(node.props['MD5'], test_client.copy(io.BytesIO(data), 'vos://cadc.nrc.ca!vospace/file',
+                                                             send_md5=True))
+        self.assertEqual([('http://b.ca/file', data)], sent)
+        self.assertEqual('chunked', test_client.transfer_stats.method)
+
+        # an iterator
+        del sent[:]
+        test_client.get_node_url.return_value = ['http://b.ca/file']
+        self.assertEqual(len(data), test_client.put_stream(iter([data[:10], data[10:]]),
+                                                           'vos://cadc.nrc.ca!vospace/file'))
+        self.assertEqual([('http://b.ca/file', data)], sent)
+
+        # the MD5 of the node must match what was sent
+        node.props['MD5'] = hashlib.md5(b'else').hexdigest()
+        with self.assertRaises(OSError) as ex:
+            test_client.put_stream([data], 'vos://cadc.nrc.ca!vospace/file')
+        self.assertEqual(errno.EIO, ex.exception.errno)
+
+        # a stream broken half way can not be sent again
+        def broken(url, data, headers=None):
+            next(data)
+            raise IOError("connection reset")
+        conn.session.put.reset_mock()
+        conn.session.put.side_effect = broken
+        test_client.get_node_url.return_value = ['http://b.ca/file', 'http://c.ca/file']
+        with self.assertRaises(OSError) as ex:
+            test_client.put_stream([b'abc', b'def'], 'vos://cadc.nrc.ca!vospace/file')
+        self.assertEqual(errno.EIO, ex.exception.errno)
+        self.assertEqual(1, conn.session.put.call_count)
+
+    def test_copy_compressed(self):
+        data = b'10.1,-20.2,17.5\n' * 1000
+        gz = gzip_compress(data)
+        node = MagicMock(spec=Node)
+        node.props = {'MD5': hashlib.md5(data).hexdigest(), 'length': str(len(data))}
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+        test_client.get_node = Mock(return_value=node)
+        test_client.get_node_url = Mock(return_value=['http://a.ca/file'])
+        handle, destination = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            # a gzip transfer encoding is decoded before the data is hashed
+            response = MagicMock(headers={'Content-Encoding': 'gzip', 'Content-MD5': hashlib.md5(gz).hexdigest()})
+            response.raw = io.BytesIO(gz)
+            conn.session.get.return_value = response
+            self.assertEqual(node.props['MD5'], test_client.copy('vos://test/foo', destination, send_md5=True,
+                                                                 content_encoding='gzip'))
+            conn.session.get.assert_called_once_with('http://a.ca/file', stream=True, timeout=ANY,
+                                                     headers={'Accept-Encoding': 'gzip'})
+            with open(destination, 'rb') as fin:
+                self.assertEqual(data, fin.read())
+
+            # a compressed variant is checked against the MD5 of the stored bytes and written decompressed
+            node.props['MD5'] = hashlib.md5(gz).hexdigest()
+            response = MagicMock(headers={})
+            response.iter_content.return_value = [gz[:100], gz[100:]]
+            conn.session.get.return_value = response
+            self.assertEqual(node.props['MD5'], test_client.copy('vos://test/foo.gz', destination, send_md5=True,
+                                                                 compressed='gzip'))
+            with open(destination, 'rb') as fin:
+                self.assertEqual(data, fin.read())
+
+            # and uploaded compressed
+            sent = []
+
+            def put(url, data, headers=None):
+                sent.append(b''.join(data))
+                node.props['MD5'] = hashlib.md5(sent[-1]).hexdigest()
+                return Mock()
+            conn.session.put.side_effect = put
+            stored = test_client.copy(destination, 'vos://test/bar.gz', compressed='gzip')
+            self.assertEqual(len(sent[0]), stored)
+            self.assertEqual(data, zlib.decompress(sent[0], 16 + zlib.MAX_WBITS))
+            self.assertLess(stored, len(data))
+        finally:
+            os.remove(destination)
+
+    @patch('vos.compression.SUPPORT', new_callable=EncodingSupport)
+    def test_copy_encoding_ignored(self, support):
+        data = b'10.1,-20.2,17.5\n' * 1000
+        node = MagicMock(spec=Node)
+        node.props = {}
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+        test_client.get_node = Mock(return_value=node)
+        test_client.get_node_url = Mock(side_effect=lambda *args, **kwargs: ['https://a.ca/file'])
+        sent = []
+
+        # an endpoint that stores the body as sent, whatever its Content-Encoding
+        def put(url, data, headers=None):
+            sent.append((b''.join(data), (headers or {}).get('Content-Encoding')))
+            node.props['MD5'] = hashlib.md5(sent[-1][0]).hexdigest()
+            return Mock(status_code=201)
+        conn.session.put.side_effect = put
+        handle, source = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            with open(source, 'wb') as fout:
+                fout.write(data)
+            # the compressed bytes are replaced by the plain ones on the same endpoint
+            self.assertEqual(hashlib.md5(data).hexdigest(),
+                             test_client.copy(source, 'vos://test/foo', send_md5=True, content_encoding='gzip'))
+            self.assertEqual(2, len(sent))
+            self.assertEqual('gzip', sent[0][1])
+            self.assertEqual((data, None), sent[1])
+            self.assertFalse(support.accepts('https://a.ca/file'))
+        finally:
+            os.remove(source)
+
+        # a seekable stream is sent again too
+        support.__init__()
+        del sent[:]
+        self.assertEqual(len(data), test_client.put_stream(io.BytesIO(data), 'vos://test/foo',
+                                                           content_encoding='gzip'))
+        self.assertEqual(['gzip', None], [encoding for body, encoding in sent])
+        self.assertEqual(data, sent[1][0])
+
+    def test_get_node_url_cache(self):
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+        negotiate_mock = Mock(side_effect=lambda *args, **kwargs: ['http://a.ca/file', 'http://b.ca/file'])
+        test_client._get_node_url = negotiate_mock
+
+        # a data URL is negotiated once, the cached copy is returned afterwards
+        urls = test_client.get_node_url('vos://cadc.nrc.ca!vospace/file', method='GET', view='data')
+        urls.pop(0)
+        self.assertEqual(['http://a.ca/file', 'http://b.ca/file'],
+                         test_client.get_node_url('vos://cadc.nrc.ca!vospace/file', method='GET', view='data'))
+        self.assertEqual(1, negotiate_mock.call_count)
+
+        # other views, directions and forced negotiations go to the service
+        test_client.get_node_url('vos://cadc.nrc.ca!vospace/file', method='GET', view='cutout', cutout='[1]')
+        test_client.get_node_url('vos://cadc.nrc.ca!vospace/file', method='PUT')
+        test_client.get_node_url('vos://cadc.nrc.ca!vospace/file', method='GET', view='data', full_negotiation=True)
+        self.assertEqual(4, negotiate_mock.call_count)
+        # node URLs are not cached
+        test_client.get_node_url('vos://cadc.nrc.ca!vospace/file', method='GET')
+        test_client.get_node_url('vos://cadc.nrc.ca!vospace/file', method='GET')
+        self.assertEqual(6, negotiate_mock.call_count)
+
+        # a failed transfer forgets the URLs
+        test_client.invalidate_node_url('vos://cadc.nrc.ca!vospace/file')
+        test_client.get_node_url('vos://cadc.nrc.ca!vospace/file', method='PUT')
+        self.assertEqual(7, negotiate_mock.call_count)
+
+    def test_get_node_urls(self):
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+
+        def negotiate(uri, **kwargs):
+            if uri.endswith('bad'):
+                raise OSError(errno.ENOENT, "no such node")
+            return ['http://a.ca/' + os.path.basename(uri)]
+        negotiate_mock = Mock(side_effect=negotiate)
+        test_client._get_node_url = negotiate_mock
+
+        uris = ['vos://cadc.nrc.ca!vospace/dir/{0}'.format(i) for i in range(20)] + \
+               ['vos://cadc.nrc.ca!vospace/dir/bad']
+        urls = test_client.get_node_urls(uris, method='PUT', nthreads=4)
+        self.assertEqual(21, len(urls))
+        self.assertEqual(['http://a.ca/3'], urls['vos://cadc.nrc.ca!vospace/dir/3'])
+        self.assertEqual(errno.ENOENT, urls['vos://cadc.nrc.ca!vospace/dir/bad'].errno)
+        self.assertEqual(21, negotiate_mock.call_count)
+
+        # the negotiated URLs are used by the copies that follow
+        self.assertEqual(['http://a.ca/3'], test_client.get_node_url('vos://cadc.nrc.ca!vospace/dir/3', 'PUT'))
+        self.assertEqual(21, negotiate_mock.call_count)
+        self.assertEqual({}, test_client.get_node_urls([]))
+
+        # GETs are for the data view by default
+        test_client.get_node_urls(uris[:2])
+        negotiate_mock.assert_any_call(uris[1], method='GET', view='data', limit=None, next_uri=None,
+                                          cutout=None, full_negotiation=None)
+
+    def test_get_cutouts(self):
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+
+        def negotiate(uri, view=None, cutout=None, **kwargs):
+            if view == 'cutout':
+                return ['http://c.ca/' + os.path.basename(uri) + '/' + cutout]
+            return ['http://a.ca/' + os.path.basename(uri)]
+        negotiate_mock = Mock(side_effect=negotiate)
+        test_client._get_node_url = negotiate_mock
+
+        def get(url, stream=True, timeout=None):
+            response = Mock(headers={})
+            if url.startswith('http://a.ca/rejects'):
+                response.raise_for_status.side_effect = requests.HTTPError("400 Bad Request")
+            response.iter_content.return_value = [url.encode('utf-8')]
+            return response
+        conn.session.get.side_effect = get
+        node = MagicMock(spec=Node)
+        node.props = {'MD5': 'a' * 32}
+        test_client.get_node = Mock(return_value=node)
+        tmpdir = tempfile.mkdtemp()
+        test_client.cutout_cache = CutoutCache(os.path.join(tmpdir, 'cache'), max_size=2 ** 20)
+
+        image = 'vos://cadc.nrc.ca!vospace/dir/image.fits'
+        other = 'vos://cadc.nrc.ca!vospace/dir/rejects.fits'
+        cutouts = [(image + '[1][{0}:{1},1:10]'.format(i, i + 10), os.path.join(tmpdir, str(i)))
+                   for i in range(10)]
+        cutouts.append((image + '(10.5,-20.1,0.01)', os.path.join(tmpdir, 'circle')))
+        cutouts.append((other + '[2]', os.path.join(tmpdir, 'other')))
+        results = test_client.get_cutouts(cutouts, nthreads=4)
+        self.assertEqual(12, len(results))
+
+        # the pixel cutouts come from the data URLs of the image, negotiated once
+        with open(os.path.join(tmpdir, '3')) as fin:
+            self.assertEqual('http://a.ca/image.fits?cutout=%5B1%5D%5B3%3A13%2C1%3A10%5D', fin.read())
+        self.assertEqual(len('http://a.ca/image.fits?cutout=%5B1%5D%5B3%3A13%2C1%3A10%5D'),
+                         results[os.path.join(tmpdir, '3')])
+        data_negotiations = [c for c in negotiate_mock.call_args_list if c[1]['view'] == 'data']
+        self.assertEqual(2, len(data_negotiations))
+
+        # the others are negotiated one by one
+        with open(os.path.join(tmpdir, 'circle')) as fin:
+            self.assertEqual('http://c.ca/image.fits/CIRCLE ICRS 10.5 -20.1 0.01', fin.read())
+        with open(os.path.join(tmpdir, 'other')) as fin:
+            self.assertEqual('http://c.ca/rejects.fits/[2]', fin.read())
+        self.assertEqual(4, negotiate_mock.call_count)
+        self.assertEqual(2, test_client.get_node.call_count)
+
+        # the same cutouts again come from the cutout cache
+        os.remove(os.path.join(tmpdir, '3'))
+        ngets = conn.session.get.call_count
+        self.assertEqual(results, test_client.get_cutouts(cutouts, nthreads=4))
+        self.assertEqual(ngets, conn.session.get.call_count)
+        with open(os.path.join(tmpdir, '3')) as fin:
+            self.assertEqual('http://a.ca/image.fits?cutout=%5B1%5D%5B3%3A13%2C1%3A10%5D', fin.read())
+        # but not once the image changed
+        node.props['MD5'] = 'b' * 32
+        test_client.get_cutouts(cutouts[:1])
+        self.assertEqual(ngets + 1, conn.session.get.call_count)
+
+        # a failed cutout is reported without stopping the others
+        negotiate_mock.side_effect = OSError(errno.ENOENT, "no such node")
+        test_client.get_node.side_effect = OSError(errno.ENOENT, "no such node")
+        results = test_client.get_cutouts([('vos://cadc.nrc.ca!vospace/dir/gone.fits[1]',
+                                            os.path.join(tmpdir, 'gone'))])
+        self.assertEqual(errno.ENOENT, results[os.path.join(tmpdir, 'gone')].errno)
+        with self.assertRaises(OSError):
+            test_client.get_cutouts([(image, os.path.join(tmpdir, 'whole'))])
 
+    def test_iterdir(self):
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
+        dir_uri = 'vos://cadc.nrc.ca!vospace/dir'
+        props = ("<vos:properties>"
+                 "<vos:property uri='ivo://ivoa.net/vospace/core#length'>{0}</vos:property>"
+                 "<vos:property uri='ivo://ivoa.net/vospace/core#MD5'>{1}</vos:property>"
+                 "<vos:property uri='ivo://ivoa.net/vospace/core#date'>2017-01-01T00:00:00.000</vos:property>"
+                 "</vos:properties>")
+        children = ["<vos:node uri='{0}/file{1}' xs:type='vos:DataNode'>{2}</vos:node>".format(
+            dir_uri, i, props.format(i, 'a' * 32)) for i in range(25)]
+        children.append("<vos:node uri='{0}/sub' xs:type='vos:ContainerNode'>{1}</vos:node>".format(
+            dir_uri, props.format(0, '')))
+        documents = {dir_uri: ("ContainerNode", children),
+                     dir_uri + '/file0': ("DataNode", []),
+                     'vos://cadc.nrc.ca!vospace/link': ("LinkNode", [])}
+        pages = []
+        files = []
+
+        def open_node(uri, mode, limit=None, next_uri=None):
+            pages.append((limit, next_uri))
+            node_type, nodes = documents[uri]
+            start = next_uri is not None and [c.split("'")[1] for c in nodes].index(next_uri) or 0
+            if limit is not None:
+                nodes = nodes[:start + limit]
+            nodes = nodes[start:]
+            files.append(node_file(("<vos:node xmlns:xs='http://www.w3.org/2001/XMLSchema-instance' "
+                              "xmlns:vos='http://www.ivoa.net/xml/VOSpace/v2.0' xs:type='vos:{0}' uri='{1}'>{2}"
+                              "<vos:target>{3}</vos:target><vos:nodes>{4}</vos:nodes></vos:node>").format(
+                node_type, uri, props.format(0, ''), dir_uri, ''.join(nodes))))
+            return files[-1]
+        test_client.open = Mock(side_effect=open_node)
+
+        # the children come page by page, each page starting with the last child of the previous one
+        names = [child.name for child in test_client.iterdir(dir_uri, page_size=10, force=True)]
+        self.assertEqual(['file{0}'.format(i) for i in range(25)] + ['sub'], names)
+        self.assertEqual([(10, None), (11, dir_uri + '/file9'), (11, dir_uri + '/file19')], pages)
+        self.assertEqual('file3', test_client.nodeCache[dir_uri + '/file3'].name)
+
+        # by default as many as the service returns at once
+        del pages[:]
+        self.assertEqual(names, test_client.listdir(dir_uri, force=True))
+        self.assertEqual([(None, None)], pages)
+
+        # the first children are handed over before the rest of the listing is read
+        del pages[:]
+        children = test_client.iterdir(dir_uri, page_size=10, force=True)
+        next(children)
+        self.assertEqual(1, len(pages))
+        children.close()
+        self.assertEqual(1, len(pages))
+
+        # a node got without its children does not stand for the listing
+        del pages[:]
+        test_client.get_node(dir_uri, limit=0, force=True)
+        self.assertEqual(names, test_client.listdir(dir_uri))
+        self.assertEqual([(0, None), (None, None)], pages)
+        # one got with all of them does
+        del pages[:]
+        node = test_client.get_node(dir_uri, limit=None, force=True)
+        self.assertEqual(names, test_client.listdir(dir_uri))
+        self.assertEqual([(None, None)], pages)
+        # its children are held and cached as entries, made into Nodes when node_list is used
+        self.assertIsNone(node._node_list)
+        self.assertEqual(26, node.child_count())
+        self.assertTrue(isinstance(test_client.nodeCache[dir_uri + '/file3'], DirEntry))
+        self.assertEqual(names, [child.name for child in node.node_list])
+        self.assertTrue(isinstance(node.node_list[3], Node))
+        self.assertEqual(3, node.node_list[3].attr['st_size'])
+
+        # links are followed
+        entries = list(test_client.scandir('vos://cadc.nrc.ca!vospace/link', page_size=20))
+        self.assertTrue(isinstance(entries[0], DirEntry))
+        self.assertEqual(names, [entry.name for entry in entries])
+        self.assertEqual((3, 'a' * 32, '2017-01-01T00:00:00.000'), (entries[3].size, entries[3].md5,
+                                                                    entries[3].date))
+        self.assertTrue(entries[-1].isdir())
+        self.assertFalse(entries[0].isdir())
+        self.assertEqual(entries[3].get_info(), test_client.nodeCache[dir_uri + '/file3'].get_info())
+        self.assertEqual(26, len(test_client.get_info_list(dir_uri)))
+        # the listing of a link is closed once its target is listed instead
+        del files[:]
+        self.assertEqual(26, len(test_client.get_info_list('vos://cadc.nrc.ca!vospace/link')))
+        self.assertEqual(2, len(files))
+        for fobj in files:
+            fobj.resp.close.assert_called_once_with()
+
+        # and a DataNode is not a directory
+        with self.assertRaises(OSError) as ex:
+            list(test_client.scandir(dir_uri + '/file0'))
+        self.assertEqual(errno.ENOTDIR, ex.exception.errno)
+        self.assertEqual([], list(test_client.iterdir(dir_uri + '/file0', force=True)))
+        self.assertEqual(['sub'], test_client.glob1(dir_uri, 's*'))
+        self.assertEqual([], test_client.glob1(dir_uri + '/file0', '*'))
+
+        # a cached entry gives the attributes of the node, and its Node when one is wanted
+        del pages[:]
+        test_client.nodeCache[entries[3].uri] = entries[3]
+        self.assertEqual(3, test_client.get_attr(entries[3].uri)['st_size'])
+        node = test_client.get_node(entries[3].uri)
+        self.assertTrue(isinstance(node, Node))
+        self.assertEqual(entries[3].props, node.props)
+        self.assertIs(node, test_client.nodeCache[entries[3].uri])
+        self.assertEqual([], pages)
+
+    # poll without waiting to stop the test from slowing down execution
+    @patch('vos.jobs.POLL_START', 0)
+    def test_transfer_error(self):
         vospace_url = 'https://somevospace.server/vospace'
         session = Mock()
-        session.get.side_effect = [Mock(content='COMPLETED')] 
         conn = Mock(spec=Connection)
         conn.session = session
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        test_client = Client(conn=conn)
 
-        test_client = Client()
-
-        # use the mocked connection instead of the real one
-        test_client.conn = conn
-        
         # job successfully completed
-        vofile.read.side_effect = [b'QUEUED', b'COMPLETED']
+        session.get.side_effect = [Mock(text='QUEUED'), Mock(text='COMPLETED')]
         self.assertFalse(test_client.get_transfer_error(
-                vospace_url +'/results/transferDetails', 'vos://vospace'))
-        session.get.assert_called_once_with(vospace_url + '/phase', allow_redirects=False)
-        
+                vospace_url + '/results/transferDetails', 'vos://vospace'))
+        self.assertEqual([call(vospace_url + '/phase', allow_redirects=False)] * 2,
+                         session.get.call_args_list)
+
         # job suspended
         session.reset_mock()
-        session.get.side_effect = [Mock(content=b'COMPLETED')]
-        vofile.read.side_effect = [b'QUEUED', b'SUSPENDED']
+        session.get.side_effect = [Mock(text='QUEUED'), Mock(text='SUSPENDED')]
         with self.assertRaises(OSError):
             test_client.get_transfer_error(
-                vospace_url +'/results/transferDetails', 'vos://vospace')
-        #check arguments for session.get calls
-        self.assertEquals([call(vospace_url + '/phase', allow_redirects=False)], 
-                          session.get.call_args_list )
+                vospace_url + '/results/transferDetails', 'vos://vospace')
+        self.assertEqual([call(vospace_url + '/phase', allow_redirects=False)] * 2,
+                         session.get.call_args_list)
 
         # job encountered an internal error
         session.reset_mock()
-        vofile.read.side_effect = Mock(side_effect=[b'QUEUED', b'ERROR'])
-        session.get.side_effect = [Mock(content=b'COMPLETED'), Mock(text='InternalFault')]
+        session.get.side_effect = [Mock(text='QUEUED'), Mock(text='ERROR'), Mock(text='InternalFault')]
         with self.assertRaises(OSError):
             test_client.get_transfer_error(
-                vospace_url +'/results/transferDetails', 'vos://vospace')
-        self.assertEquals([call(vospace_url + '/phase', allow_redirects=False),
-                           call(vospace_url + '/error')], 
-                          session.get.call_args_list )
+                vospace_url + '/results/transferDetails', 'vos://vospace')
+        self.assertEqual([call(vospace_url + '/phase', allow_redirects=False),
+                          call(vospace_url + '/phase', allow_redirects=False),
+                          call(vospace_url + '/error')],
+                         session.get.call_args_list)
 
         # job encountered an unsupported link error
         session.reset_mock()
         link_file = 'testlink.fits'
-        vofile.read.side_effect = Mock(side_effect=[b'QUEUED', b'ERROR'])
-        session.get.side_effect = [Mock(content=b'COMPLETED'),
+        session.get.side_effect = [Mock(text='ERROR'),
                                    Mock(text="Unsupported link target: " + link_file)]
-        self.assertEquals(link_file, test_client.get_transfer_error(
-            vospace_url +'/results/transferDetails', 'vos://vospace'))
-        self.assertEquals([call(vospace_url + '/phase', allow_redirects=False),
-                   call(vospace_url + '/error')], 
-                  session.get.call_args_list )
-          
+        self.assertEqual(link_file, test_client.get_transfer_error(
+            vospace_url + '/results/transferDetails', 'vos://vospace'))
+        self.assertEqual([call(vospace_url + '/phase', allow_redirects=False),
+                          call(vospace_url + '/error')],
+                         session.get.call_args_list)
+
+        # the job is aborted on a Ctrl-C
+        future = Mock(job_url=vospace_url)
+        future.result.side_effect = KeyboardInterrupt
+        test_client.watch_transfer = Mock(return_value=future)
+        with self.assertRaises(KeyboardInterrupt):
+            test_client.get_transfer_error(vospace_url + '/results/transferDetails', 'vos://vospace')
+        session.post.assert_called_once_with(vospace_url + '/phase', allow_redirects=False,
+                                             data="PHASE=ABORT", headers={"Content-type": 'text/text'})
+
+    @patch('vos.jobs.POLL_START', 0)
+    def test_move_async(self):
+        conn = MagicMock(spec=Connection)
+        conn.resource_id = "ivo://cadc.nrc.ca/vospace"
+        conn.session.auth = None
+        transfer_resp = Mock(status_code=303,
+                             headers={'Location': 'https://somevospace.server/vospace/transfers/1'})
+        conn.session.post.return_value = transfer_resp
+        conn.session.get.side_effect = [Mock(text='EXECUTING'), Mock(text='COMPLETED')]
+        client = Client(conn=conn)
+        client.get_endpoints = Mock()
+        src = 'vos://cadc.nrc.ca!vospace/dir/file'
+        dest = 'vos://cadc.nrc.ca!vospace/dir2'
+        client.nodeCache[src] = 'a node'
+
+        future = client.move(src, dest, wait=False)
+        self.assertTrue(future.result(timeout=5))
+        conn.session.get.assert_called_with('https://somevospace.server/vospace/transfers/1/phase',
+                                            allow_redirects=False)
+        self.assertNotIn(src, client.nodeCache)
+        # the nodes are no longer volatile once the move is over
+        self.assertEqual([], client.nodeCache.volatileNodes)
 
     def test_add_props(self):
         old_node = Node(ElementTree.fromstring(NODE_XML))
@@ -441,16 +991,13 @@ class TestClient(unittest.TestCase):
             </vos:nodes>
         """
 
-        mock_vofile = Mock()
         client = Client()
-        client.open = Mock(return_value=mock_vofile)
-
-        mock_vofile.read = Mock(return_value=NODE_XML.format(uri, '').encode('UTF-8'))
+        client.open = Mock(return_value=node_file(NODE_XML.format(uri, '')))
         my_node = client.get_node(uri, limit=0, force=False)
         self.assertEqual(uri, my_node.uri)
         self.assertEqual(len(my_node.node_list), 0)
 
-        mock_vofile.read = Mock(return_value=NODE_XML.format(uri, nodes).encode('UTF-8'))
+        client.open = Mock(return_value=node_file(NODE_XML.format(uri, nodes)))
 
         my_node = client.get_node(uri, limit=2, force=True)
         self.assertEqual(uri, my_node.uri)
@@ -539,6 +1086,52 @@ class TestNode(unittest.TestCase):
         node2.props = {'foo': 'bar'}
         self.assertEquals(node1, node2)
 
+    def test_convert_vospace_time_to_seconds(self):
+        from vos import vos
+        vos._vospace_times.clear()
+        self.assertEqual(1483228800.0, vos.convert_vospace_time_to_seconds('2017-01-01T00:00:00.000'))
+        self.assertEqual(1462873933.0, vos.convert_vospace_time_to_seconds('2016-05-10T09:52:13'))
+        # the date is UT whatever the season
+        self.assertEqual(1498910400.0, vos.convert_vospace_time_to_seconds('2017-07-01T12:00:00.999'))
+        self.assertEqual(1462873933.0, vos.convert_vospace_time_to_seconds('2016-5-10T9:52:13'))
+        with self.assertRaises(ValueError):
+            vos.convert_vospace_time_to_seconds('yesterday')
+
+        # converted dates are remembered, up to VOSPACE_TIMES of them
+        self.assertEqual(1483228800.0, vos._vospace_times['2017-01-01T00:00:00'])
+        with patch('vos.vos.VOSPACE_TIMES', 2):
+            vos.convert_vospace_time_to_seconds('2018-01-01T00:00:00.000')
+            self.assertEqual(1, len(vos._vospace_times))
+
+    @patch('vos.vos.convert_vospace_time_to_seconds', Mock(return_value=10.0))
+    def test_setattr(self):
+        from vos import vos
+        children = ''.join(["<vos:node uri='vos://foo.com!vospace/bar/{0}' xs:type='vos:DataNode'><vos:properties>"
+                            "<vos:property uri='ivo://ivoa.net/vospace/core#date'>2017-01-01T00:00:00</vos:property>"
+                            "<vos:property uri='ivo://ivoa.net/vospace/core#length'>1024</vos:property>"
+                            "</vos:properties></vos:node>".format(i) for i in range(5)])
+        node = Node(ElementTree.fromstring(NODE_XML.format('', '<vos:nodes>{0}</vos:nodes>'.format(children))))
+
+        # the children are counted without being made into Nodes
+        self.assertEqual(7, node.attr['st_nlink'])
+        self.assertTrue(stat.S_ISDIR(node.attr['st_mode']))
+        self.assertIsNone(node._node_list)
+
+        # and their attributes are only worked out when used
+        self.assertEqual(5, len(node.node_list))
+        self.assertFalse(vos.convert_vospace_time_to_seconds.called)
+        child = node.node_list[0]
+        self.assertEqual(1024, child.attr['st_size'])
+        self.assertEqual(10.0, child.attr['st_mtime'])
+        self.assertTrue(stat.S_ISREG(child.attr['st_mode']))
+        self.assertEqual(1, vos.convert_vospace_time_to_seconds.call_count)
+
+        # given attributes are kept, the others worked out again
+        node.node_list.pop()
+        node.setattr({'st_mtime': 20.0})
+        self.assertEqual(20.0, node.attr['st_mtime'])
+        self.assertEqual(6, node.attr['st_nlink'])
+
     def test_node_set_property(self):
         node = Node(ElementTree.fromstring(NODE_XML))
         properties = node.node.find(Node.PROPERTIES)
@@ -623,6 +1216,67 @@ class TestNode(unittest.TestCase):
         return None
 
 
+class TestDirEntry(unittest.TestCase):
+    """Test the vos DirEntry class.
+    """
+
+    CHILD = ("<vos:node xmlns:xs='http://www.w3.org/2001/XMLSchema-instance' "
+             "xmlns:vos='http://www.ivoa.net/xml/VOSpace/v2.0' uri='vos://foo.com!vospace/bar/{0}' "
+             "xs:type='vos:{1}'><vos:properties>"
+             "<vos:property uri='ivo://ivoa.net/vospace/core#length'>1024</vos:property>"
+             "<vos:property uri='ivo://ivoa.net/vospace/core#MD5'>d41d8cd98f00b204e9800998ecf8427e</vos:property>"
+             "<vos:property uri='ivo://ivoa.net/vospace/core#date'>2017-01-01T00:00:00.000</vos:property>"
+             "<vos:property uri='ivo://ivoa.net/vospace/core#creator'>CN=some one,OU=cadc</vos:property>"
+             "<vos:property uri='ivo://ivoa.net/vospace/core#groupread'>ivo://cadc.nrc.ca/gms#g</vos:property>"
+             "<vos:property uri='ivo://ivoa.net/vospace/core#ispublic'>true</vos:property>"
+             "</vos:properties>{2}</vos:node>")
+
+    def test_entry(self):
+        element = ElementTree.fromstring(self.CHILD.format('file', 'DataNode', ''))
+        entry = DirEntry(element)
+        node = Node(ElementTree.fromstring(self.CHILD.format('file', 'DataNode', '')))
+        self.assertFalse(hasattr(entry, '__dict__'))
+        self.assertEqual('file', entry.name)
+        self.assertEqual(1024, entry.size)
+        self.assertEqual('d41d8cd98f00b204e9800998ecf8427e', entry.md5)
+        self.assertEqual('2017-01-01T00:00:00.000', entry.date)
+        self.assertEqual('-rw-r--r--', entry.permissions)
+        self.assertFalse(entry.isdir())
+        self.assertEqual(node.props, entry.props)
+        self.assertEqual(node.get_info(), entry.get_info())
+        attr = entry.attr
+        del attr['st_atime']
+        node_attr = dict(node.attr)
+        del node_attr['st_atime']
+        self.assertEqual(node_attr, attr)
+
+        # the Node is made on demand
+        materialized = entry.node()
+        self.assertTrue(isinstance(materialized, Node))
+        self.assertEqual(node.uri, materialized.uri)
+        self.assertEqual(node.type, materialized.type)
+        self.assertEqual(node.props, materialized.props)
+
+        # the other properties of the entries are shared
+        other = DirEntry(ElementTree.fromstring(self.CHILD.format('other', 'DataNode', '')))
+        self.assertIs(entry._others, other._others)
+        # but only as long as some entry uses them
+        key = tuple(entry._others)
+        self.assertIn(key, DirEntry._shared)
+        del entry, other, materialized
+        gc.collect()
+        self.assertNotIn(key, DirEntry._shared)
+
+    def test_link(self):
+        element = ElementTree.fromstring(self.CHILD.format('link', 'LinkNode',
+                                                           '<vos:target>vos://foo.com!vospace/baz</vos:target>'))
+        entry = DirEntry(element)
+        self.assertTrue(entry.islink())
+        self.assertEqual('vos://foo.com!vospace/baz', entry.target)
+        self.assertEqual('l', entry.get_info()['permissions'][0])
+        self.assertEqual('vos://foo.com!vospace/baz', entry.node().target)
+
+
 @patch('vos.vos.net.ws.WsCapabilities.get_access_url',
        Mock(return_value='http://foo.com/vospace'))
 @patch('vos.vos.net.ws.WsCapabilities.get_service_host', Mock())
@@ -0,0 +1,222 @@
+"""Resume TLS sessions rather than repeat full handshakes.
+
+A full TLS handshake authenticated with a client certificate costs two round trips and public key operations
+on both ends, and a command talks to several hosts (the nodes and transfer services, then the data endpoints)
+over several connections each.  A connection opened to a host a session was already established with offers
+that session, and the server resumes it with an abbreviated handshake.
+
+Python only resumes a session it is handed, so the contexts, one per client certificate and verify setting,
+remember the last session established with each host.  They are kept in SESSIONS, shared by every Connection
+and EndPoints of the process: the session opened to look up the capabilities of the service is resumed by the
+node requests, the session of the first transfer to a data host by the next ones, and forked processes (vsync
+streams) resume the sessions of their parent.
+
+The ssl module can neither export nor import a session, so they do not outlive the process: a loop of short
+vls or vcp runs still pays a full handshake per host and run, giving a single vcp every file avoids that.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import logging
+import os
+import ssl
+import threading
+import time
+import weakref
+
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_CA_BUNDLE_PATH
+
+logger = logging.getLogger('vos')
+
+RESUMPTION = hasattr(ssl, 'SSLSession')  # sessions can be resumed from python 3.6
+
+
+def _mtime(filename):
+    try:
+        return filename is not None and os.stat(filename).st_mtime or None
+    except OSError:
+        return None
+
+
+if RESUMPTION:
+    class ResumableSocket(ssl.SSLSocket):
+        """An SSLSocket handing its session back to its context when closed.
+
+        With TLS 1.3 the session tickets are sent after the handshake, the session is only resumable once the
+        response has been read.
+        """
+
+        def close(self):
+            if isinstance(self.context, ResumingContext):
+                self.context.keep(self)
+            super(ResumableSocket, self).close()
+
+    class ResumingContext(ssl.SSLContext):
+        """An SSLContext offering each host the last session established with it.
+
+        urllib3 loads the client certificate and the CA certificates into the context of each new connection,
+        this is done once here and again only if the certificate file changes.  It also sets the verify mode of
+        the context from the verify setting of each request, so a context is only used for the requests with its
+        own setting, see TLSAdapter.
+        """
+
+        sslsocket_class = ResumableSocket
+
+        def __new__(cls, verify=True, protocol=ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+            return super(ResumingContext, cls).__new__(cls, protocol, *args, **kwargs)
+
+        def __init__(self, verify=True, protocol=ssl.PROTOCOL_TLS_CLIENT):
+            """
+            :param verify: the verify setting of the requests sessions using the context: True to check the
+            server certificate against the requests CA bundle, the path of a CA bundle or directory, or False.
+            """
+            # urllib3 matches the host names itself, also when verification is turned off
+            self.check_hostname = False
+            self._lock = threading.Lock()
+            self._loaded = set()
+            # host: (weak reference to the last socket connected to it, its session)
+            self._sessions = {}
+            self.handshakes = 0
+            self.resumed = 0
+            if verify is False:
+                self.verify_mode = ssl.CERT_NONE
+            elif verify is True:
+                # requests only hands its CA bundle to the contexts it makes
+                self.load_verify_locations(DEFAULT_CA_BUNDLE_PATH)
+            elif os.path.isdir(verify):
+                self.load_verify_locations(capath=verify)
+            else:
+                self.load_verify_locations(verify)
+
+        def load_cert_chain(self, certfile, keyfile=None, password=None):
+            key = ('cert', certfile, keyfile, _mtime(certfile), _mtime(keyfile))
+            with self._lock:
+                if key in self._loaded:
+                    return
+                super(ResumingContext, self).load_cert_chain(certfile, keyfile, password)
+                # the sessions were established with the previous certificate
+                self._loaded = set([loaded for loaded in self._loaded if loaded[0] != 'cert'])
+                self._loaded.add(key)
+                self._sessions.clear()
+
+        def load_verify_locations(self, cafile=None, capath=None, cadata=None):
+            key = ('ca', cafile, capath, cadata)
+            with self._lock:
+                if key in self._loaded:
+                    return
+                super(ResumingContext, self).load_verify_locations(cafile, capath, cadata)
+                self._loaded.add(key)
+
+        def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                        server_hostname=None, session=None):
+            client = not server_side and server_hostname is not None
+            if client and session is None:
+                session = self.session(server_hostname)
+            ssl_sock = super(ResumingContext, self).wrap_socket(
+                sock, server_side=server_side, do_handshake_on_connect=do_handshake_on_connect,
+                suppress_ragged_eofs=suppress_ragged_eofs, server_hostname=server_hostname, session=session)
+            if client and do_handshake_on_connect:
+                with self._lock:
+                    self.handshakes += 1
+                    if ssl_sock.session_reused:
+                        self.resumed += 1
+                self.keep(ssl_sock)
+            return ssl_sock
+
+        def keep(self, ssl_sock):
+            """Remember the session of ssl_sock, and ssl_sock to get the session tickets it receives later."""
+            host = ssl_sock.server_hostname
+            session = ssl_sock.session
+            if host is None or session is None:
+                return
+            with self._lock:
+                self._sessions[host] = (weakref.ref(ssl_sock), session)
+
+        def session(self, host):
+            """The session to offer host, None if there is none or it expired."""
+            with self._lock:
+                entry = self._sessions.get(host)
+            if entry is None:
+                return None
+            ssl_sock = entry[0]()
+            session = entry[1]
+            if ssl_sock is not None:
+                # the latest state of a live connection, with the tickets received since the handshake
+                try:
+                    session = ssl_sock.session or session
+                except (ValueError, OSError):
+                    pass
+            if session.timeout and time.time() > session.time + session.timeout:
+                return None
+            return session
+
+
+class TLSAdapter(HTTPAdapter):
+    """An HTTPAdapter opening its HTTPS connections with the contexts of sessions, and so resuming the TLS
+    sessions they keep.
+
+    The context is chosen for each request from its client certificate and verify setting: a request sent with
+    verify=False, as VOFile reads are, connects with a context of its own rather than turn off the checks of the
+    context the other requests share.
+    """
+
+    def __init__(self, sessions=None, **kwargs):
+        """
+        :param sessions: the TLSSessions giving the contexts, SESSIONS if None.
+        """
+        self.sessions = sessions
+        super(TLSAdapter, self).__init__(**kwargs)
+
+    def cert_verify(self, conn, url, verify, cert):
+        super(TLSAdapter, self).cert_verify(conn, url, verify, cert)
+        if not url.lower().startswith('https') or not hasattr(conn, 'conn_kw'):
+            return
+        # an unpickled adapter has no sessions
+        sessions = getattr(self, 'sessions', None) or SESSIONS
+        context = sessions.context(cert, verify is None and True or verify)
+        if context is not None:
+            # the new connections of the pool are opened with it: requests keeps a pool per verify setting, or
+            # switches the verify setting of the pool along with it
+            conn.conn_kw['ssl_context'] = context
+
+
+class TLSSessions(object):
+    """The ResumingContext of each client certificate and verify setting.
+
+    usage:
+        session.mount('https://', TLSAdapter(SESSIONS, pool_maxsize=20))
+        ...
+        print(SESSIONS.stats())
+    """
+
+    def __init__(self):
+        self.contexts = {}
+        self.lock = threading.Lock()
+
+    def context(self, cert=None, verify=True):
+        """The context of the connections authenticated with cert, None if sessions can not be resumed.
+
+        :param cert: the certificate file, a (certificate, key) pair of files, or None for anonymous connections.
+        :param verify: how the server certificates are checked, as the verify setting of a requests session.
+        """
+        if not RESUMPTION:
+            return None
+        key = (isinstance(cert, (list, tuple)) and tuple(cert) or cert, verify)
+        with self.lock:
+            context = self.contexts.get(key)
+            if context is None:
+                context = ResumingContext(verify)
+                self.contexts[key] = context
+        return context
+
+    def stats(self):
+        """The number of TLS handshakes made and how many of them resumed a session."""
+        with self.lock:
+            contexts = list(self.contexts.values())
+        return {'handshakes': sum([context.handshakes for context in contexts]),
+                'resumed': sum([context.resumed for context in contexts])}
+
+
+# the TLS sessions of the process, shared by every Connection and EndPoints
+SESSIONS = TLSSessions()
@@ -0,0 +1,85 @@
+"""A bounded, expiring cache of the data URLs returned by transfer negotiations.
+
+Negotiating a transfer costs at least one round trip to the transfer service, and a full UWS negotiation
+several.  Reading the same node again a few seconds later (as vofs does each time it refills its cache) does
+not need a new negotiation, so the URLs are kept for a short time.  Entries are dropped when a transfer using
+them fails.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 60  # seconds a negotiated list of URLs is reused for
+DEFAULT_SIZE = 1024  # maximum number of negotiations remembered
+
+
+class TransferCache(object):
+    """Map (uri, direction, view, cutout) to the list of endpoint URLs negotiated for it.
+
+    usage:
+        cache = TransferCache(ttl=60)
+        urls = cache.get(key)
+        if urls is None:
+            urls = negotiate()
+            cache.put(key, urls)
+        ...
+        # a transfer failed, renegotiate next time
+        cache.invalidate(uri)
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, size=DEFAULT_SIZE):
+        """
+        :param ttl: seconds an entry stays valid, 0 disables the cache.
+        :type ttl: float
+        :param size: maximum number of entries, the least recently used entries are dropped beyond that.
+        :type size: int
+        """
+        self.ttl = ttl
+        self.size = size
+        self._entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(uri, direction, view=None, cutout=None):
+        """The key of a negotiation."""
+        return uri.rstrip('/'), direction, view, cutout
+
+    def get(self, key):
+        """Return a copy of the URLs cached for key, None if there are none or they have expired."""
+        with self.lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, urls = entry
+            if expires < time.time():
+                return None
+            # most recently used go to the end
+            self._entries[key] = entry
+            return list(urls)
+
+    def put(self, key, urls):
+        """Cache the URLs negotiated for key."""
+        if self.ttl <= 0 or self.size <= 0:
+            return
+        with self.lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, tuple(urls))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, uri):
+        """Drop every negotiation cached for uri."""
+        uri = uri.rstrip('/')
+        with self.lock:
+            for key in [key for key in self._entries if key[0] == uri]:
+                del self._entries[key]
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,527 @@
+"""Send a local file to a VOSpace endpoint without copying it through Python buffers.
+
+Handing an open file to requests reads every block of the file into a Python string before it reaches the
+socket.  FileUpload avoids that: on plain HTTP the kernel moves the file straight to the socket with
+os.sendfile, over TLS (where the data must be encrypted in user space) the file is memory mapped and sent as
+large views of the mapping.  The MD5 of the file is computed from the mapping as it is sent.
+
+Files larger than a segment can instead be sent as fixed size segments PUT concurrently, each carrying a
+'Content-Range: bytes first-last/total' header.  This is no part of the VOSpace protocol, and a service that
+does not know it may store the first segment as the whole file, so it is only done when asked for (the
+segmented_uploads option of the [transfer] configuration).  A service that assembles segments acknowledges each
+one with a 2xx (or 308) response that carries a 'Range' header describing what it holds.  If the first segment
+is refused, acknowledged without a Range header, or found stored as a complete file, or if the file stored in
+the end is not the one sent, the upload falls back to a single PUT of the whole file.  A failed segment is
+retried on its own.
+
+With a content_encoding the single PUT of a file is compressed on the fly and sent with a Content-Encoding
+header (see the compression module), the MD5 is still that of the file as the endpoint decodes what it stores.
+An endpoint refusing the encoding is sent the file again the usual way.
+
+Data that is not in a local file, such as the body of a GET from another VOSpace node or the output of a
+program, is sent from an iterator of chunks by a StreamBody, which hashes and throttles the chunks the same way.
+
+Each upload records a TransferStats so the throughput of the different methods can be compared.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import hashlib
+import logging
+import mmap
+import os
+import select
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+from six.moves import http_client
+from six.moves.urllib.parse import urlparse
+
+from . import compression
+from . import md5_cache
+from .download import byte_ranges
+from .scheduler import BULK, UPLOAD
+
+logger = logging.getLogger('vos')
+
+BLOCK_SIZE = 2 ** 23  # number of bytes handed to the socket at a time (8 MiB)
+SEGMENT_SIZE = 2 ** 28  # size of each segment of a segmented upload (256 MiB)
+SEGMENT_RETRIES = 3  # attempts made to send each segment
+
+SENDFILE = 'sendfile'
+MMAP = 'mmap'
+STREAM = 'stream'
+SEGMENTS = 'segments'
+PIPE = 'pipe'
+CHUNKED = 'chunked'
+SERVER_COPY = 'server copy'
+
+# status codes of a sendfile PUT that are left to the requests session: redirects and authentication challenges
+SESSION_STATUS = (301, 302, 303, 307, 308, 401, 407)
+# hosts that answered a sendfile PUT with one of those, they are sent files through the session
+SESSION_HOSTS = set()
+
+# status codes of a service refusing a segment because it does not understand Content-Range
+SEGMENTS_NOT_SUPPORTED = (400, 405, 411, 416, 501)
+SEGMENT_ACCEPTED = (200, 201, 202, 204, 308)
+
+
+def _close(mapping):
+    """Unmap a file, leaving it to the garbage collector if a view of it is still referenced."""
+    try:
+        mapping.close()
+    except BufferError as ex:
+        logger.debug("Unable to close mmap yet: {0}".format(ex))
+
+
+def _sendfile(sock, fin, offset, count):
+    """os.sendfile up to count bytes of fin from offset to sock, return the number of bytes sent.
+
+    A socket with a timeout is non-blocking underneath, so a full send buffer is waited out with select for as
+    long as the timeout rather than failing with EAGAIN.
+    """
+    while True:
+        try:
+            return os.sendfile(sock.fileno(), fin.fileno(), offset, count)
+        except OSError as ex:
+            if ex.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        writable = select.select([], [sock], [], sock.gettimeout())[1]
+        if not writable:
+            raise OSError(errno.ETIMEDOUT, "Timed out sending to {0}".format(sock.getpeername()))
+
+
+class TransferStats(object):
+    """The amount of data moved by a transfer and how long it took."""
+
+    def __init__(self, method, nbytes=0, elapsed=0.0, chunk_size=None):
+        """
+        :param method: how the data was moved, e.g. sendfile, mmap or stream.
+        :param nbytes: number of bytes transferred.
+        :param elapsed: wall clock seconds the transfer took.
+        :param chunk_size: the number of bytes moved per call, the size settled on for adaptive reads.
+        """
+        self.method = method
+        self.nbytes = nbytes
+        self.elapsed = elapsed
+        self.chunk_size = chunk_size
+
+    @property
+    def throughput(self):
+        """Bytes per second, 0 if nothing was timed."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.nbytes / self.elapsed
+
+    def __str__(self):
+        stats = "{0} bytes in {1:.3f}s ({2:.2f} MB/s) using {3}".format(
+            self.nbytes, self.elapsed, self.throughput / 2 ** 20, self.method)
+        if self.chunk_size is not None:
+            stats += " in chunks of {0} bytes".format(self.chunk_size)
+        return stats
+
+
+class MmapBody(object):
+    """Iterable request body serving a memory mapped file as views of block_size bytes.
+
+    If md5 is given the views are hashed as they are handed out, so once the body has been sent md5 holds the
+    MD5 of the file; a body sent again (after a redirect) is not hashed twice.  If throttle is given it is called
+    with the length of each view before it is handed out.
+    """
+
+    def __init__(self, view, md5=None, block_size=BLOCK_SIZE, throttle=None):
+        self.view = view
+        self.md5 = md5
+        self.block_size = block_size
+        self.throttle = throttle
+        self.hashed = 0
+
+    def __len__(self):
+        return len(self.view)
+
+    def __iter__(self):
+        for offset in range(0, len(self.view), self.block_size):
+            block = self.view[offset:offset + self.block_size]
+            if self.throttle is not None:
+                self.throttle(len(block))
+            if self.md5 is not None and offset == self.hashed:
+                self.md5.update(block)
+                self.hashed += len(block)
+            yield block
+
+
+class SegmentMD5(object):
+    """The MD5 of a file sent as segments, computed from the blocks of the segments as they are sent.
+
+    Segments go out concurrently and in any order while an MD5 has to be fed in order: a block is hashed when it
+    is sent if every byte before it has been, else it is kept (a view of the mapping, not a copy) until they
+    have.  A block sent again by a retried segment is only hashed once.
+
+    usage:
+        md5 = SegmentMD5()
+        body = MmapBody(view[first:last + 1], md5.at(first))
+    """
+
+    def __init__(self):
+        self.position = 0
+        self._md5 = hashlib.md5()
+        self._early = {}
+        self._lock = threading.Lock()
+
+    def at(self, offset):
+        """An object with the update method of an MD5, for the blocks of a segment starting at offset."""
+        return _SegmentBlocks(self, offset)
+
+    def update(self, offset, block):
+        """Hash block, the bytes of the file starting at offset, once everything before it is hashed."""
+        with self._lock:
+            if offset < self.position or offset in self._early:
+                return
+            if offset > self.position:
+                self._early[offset] = block
+                return
+            self._md5.update(block)
+            self.position += len(block)
+            while self.position in self._early:
+                block = self._early.pop(self.position)
+                self._md5.update(block)
+                self.position += len(block)
+
+    def hexdigest(self):
+        if self._early:
+            raise OSError(errno.EIO, "Bytes {0} onwards of the segments were not sent".format(self.position))
+        return self._md5.hexdigest()
+
+    def clear(self):
+        """Drop the blocks waiting to be hashed, so the mapping they view can be closed."""
+        with self._lock:
+            self._early.clear()
+
+
+class _SegmentBlocks(object):
+
+    def __init__(self, md5, offset):
+        self.md5 = md5
+        self.offset = offset
+
+    def update(self, block):
+        self.md5.update(self.offset, block)
+        self.offset += len(block)
+
+
+class StreamBody(object):
+    """Iterable request body relaying the chunks of an iterator, e.g. the body of a streamed GET.
+
+    With a length the body is sent with a Content-Length, otherwise iterate it to send it chunked.  The md5 and
+    throttle are used as by MmapBody, nbytes counts the bytes handed out.
+    """
+
+    def __init__(self, chunks, length=None, md5=None, throttle=None):
+        self.chunks = chunks
+        self.length = length
+        self.md5 = md5
+        self.throttle = throttle
+        self.nbytes = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if self.throttle is not None:
+                self.throttle(len(chunk))
+            if self.md5 is not None:
+                self.md5.update(chunk)
+            self.nbytes += len(chunk)
+            yield chunk
+
+
+class FileUpload(object):
+    """PUT a local file to a URL using the cheapest method the URL allows.
+
+    usage:
+        uploader = FileUpload(session, '/tmp/big.fits')
+        stats = uploader.put(put_url)
+        print(uploader.md5, stats.throughput)
+    """
+
+    def __init__(self, session, path, size=None, block_size=BLOCK_SIZE, timeout=None, nstreams=1,
+                 segment_size=SEGMENT_SIZE, scheduler=None, priority=BULK, content_encoding=None, segments=False,
+                 stored=None):
+        """
+        :param session: the requests session of the VOSpace connection, provides the credentials.
+        :param path: the local file to send.
+        :type path: str
+        :param size: the size of the file, looked up if not given.
+        :type size: int
+        :param block_size: number of bytes sent per system call.
+        :type block_size: int
+        :param timeout: socket timeout, in seconds, of a sendfile connection.
+        :param nstreams: number of segments sent at the same time, files larger than segment_size are sent as
+        segments when this is more than 1 and segments is set.
+        :type nstreams: int
+        :param segment_size: number of bytes in each segment.
+        :type segment_size: int
+        :param scheduler: the TransferScheduler that limits the bandwidth of the upload, a rate limit also caps
+        block_size so the upload can be preempted between blocks.
+        :param priority: the scheduler priority of the upload.
+        :param content_encoding: compress single PUTs with this encoding ('gzip' or 'zstd') on the wire, if the
+        endpoint accepts it.
+        :param segments: send large files as segments, for a service known to assemble Content-Range PUTs.
+        :type segments: bool
+        :param stored: a function returning the (length, MD5) of the file the service holds, to check a segmented
+        upload after its first segment and once it is complete.
+        """
+        self.session = session
+        self.path = path
+        if size is None:
+            size = os.stat(path).st_size
+        self.size = size
+        self.scheduler = scheduler
+        self.priority = priority
+        if scheduler is not None:
+            block_size = scheduler.slice_size(UPLOAD, block_size)
+        self.block_size = block_size
+        self.timeout = timeout
+        self.nstreams = max(1, int(nstreams))
+        self.segment_size = segment_size
+        self.segments = segments
+        self.stored = stored
+        self.content_encoding = compression.check(content_encoding)
+        # the encoding the last PUT was sent with, None if it was sent as is
+        self.sent_encoding = None
+        self.md5 = None
+        self.stats = None
+
+    def _throttle(self, nbytes):
+        if self.scheduler is not None:
+            self.scheduler.acquire(nbytes, UPLOAD, self.priority)
+
+    def method(self, url):
+        """The method put will use to send the file to url."""
+        if self.segments and self.nstreams > 1 and self.size > self.segment_size:
+            return SEGMENTS
+        return self._single_method(url)
+
+    def _single_method(self, url):
+        """The method used to send the file in a single PUT."""
+        if self.size == 0:
+            return STREAM
+        parts = urlparse(url)
+        if (parts.scheme == 'http' and hasattr(os, 'sendfile') and parts.netloc not in SESSION_HOSTS and
+                not self._proxied(url)):
+            return SENDFILE
+        return MMAP
+
+    def _proxied(self, url):
+        proxies = dict(getattr(self.session, 'proxies', None) or {})
+        if getattr(self.session, 'trust_env', True):
+            proxies.update(requests.utils.get_environ_proxies(url))
+        return len(proxies) > 0
+
+    def put(self, url):
+        """Send the file to url.
+
+        :param url: the endpoint URL to PUT to.
+        :return: the TransferStats of the upload, the MD5 of what was sent is left in self.md5
+        """
+        method = self.method(url)
+        start = time.time()
+        self.sent_encoding = None
+        if (self.content_encoding is not None and method in (SENDFILE, MMAP) and
+                compression.SUPPORT.accepts(url)):
+            try:
+                method = self._put_encoded(url)
+            except OSError as ex:
+                if ex.errno != errno.EOPNOTSUPP:
+                    raise
+                logger.debug("{0}, sending {1} as is".format(ex, self.path))
+        if method == SEGMENTS:
+            try:
+                self._put_segments(url)
+            except OSError as ex:
+                if ex.errno != errno.EOPNOTSUPP:
+                    raise
+                logger.debug("{0}, reverting to a single PUT".format(ex))
+                method = self._single_method(url)
+        if method == SENDFILE:
+            method = self._put_sendfile(url)
+        elif method == MMAP:
+            method = self._put_mmap(url)
+        elif method == STREAM:
+            self._put_stream(url)
+        self.stats = TransferStats(method, self.size, time.time() - start, self.block_size)
+        logger.info("PUT {0}: {1}".format(url, self.stats))
+        return self.stats
+
+    def _put_encoded(self, url):
+        """PUT the file compressed with the content encoding, raise EOPNOTSUPP if the endpoint refuses it."""
+        with open(self.path, 'rb') as fin:
+            mapping = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapping)
+            try:
+                md5 = hashlib.md5()
+                # the file is hashed as read, the bandwidth is spent on the compressed bytes
+                body = StreamBody(compression.compress_chunks(MmapBody(view, md5, self.block_size),
+                                                              self.content_encoding),
+                                  throttle=self._throttle)
+                response = self.session.put(url, data=iter(body),
+                                            headers={'Content-Encoding': self.content_encoding})
+                if response.status_code in compression.ENCODING_NOT_SUPPORTED:
+                    compression.SUPPORT.refuse(url)
+                    raise OSError(errno.EOPNOTSUPP, "{0} refused {1} content".format(url, self.content_encoding))
+                response.raise_for_status()
+            finally:
+                view.release()
+                _close(mapping)
+        self.md5 = md5.hexdigest()
+        self.sent_encoding = self.content_encoding
+        logger.debug("Sent {0} bytes of {1} as {2} {3} bytes".format(self.size, self.path, body.nbytes,
+                                                                    self.content_encoding))
+        return self.content_encoding
+
+    def _put_segments(self, url):
+        segments = byte_ranges(self.size, self.segment_size)
+        with open(self.path, 'rb') as fin:
+            mapping = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapping)
+            # the segments are hashed as they are sent rather than read again afterwards
+            md5 = SegmentMD5()
+            try:
+                # the first segment tells us if the service can assemble the others.
+                self._put_segment(url, view, segments[0], probe=True, md5=md5)
+                if self.stored is not None and self.stored() == (segments[0][1] + 1, md5.hexdigest()):
+                    raise OSError(errno.EOPNOTSUPP, "{0} stored the first segment as the file".format(url))
+                pool = ThreadPool(min(self.nstreams, max(1, len(segments) - 1)))
+                try:
+                    pool.map(lambda segment: self._put_segment(url, view, segment, md5=md5), segments[1:],
+                             chunksize=1)
+                finally:
+                    pool.close()
+                    pool.join()
+                self.md5 = md5.hexdigest()
+                if self.stored is not None and self.stored() != (self.size, self.md5):
+                    raise OSError(errno.EOPNOTSUPP, "{0} did not assemble the segments into the file".format(url))
+            finally:
+                md5.clear()
+                view.release()
+                _close(mapping)
+
+    def _put_segment(self, url, view, segment, probe=False, md5=None):
+        """PUT bytes first to last of the file, retrying up to SEGMENT_RETRIES times, hashing them into md5."""
+        first, last = segment
+        headers = {'Content-Range': 'bytes {0}-{1}/{2}'.format(first, last, self.size)}
+        error = None
+        for attempt in range(SEGMENT_RETRIES):
+            try:
+                response = self.session.put(url, headers=headers,
+                                            data=MmapBody(view[first:last + 1], md5 and md5.at(first),
+                                                          block_size=self.block_size, throttle=self._throttle))
+            except IOError as ex:
+                logger.debug("Failed to PUT bytes {0}-{1} to {2}: {3}".format(first, last, url, ex))
+                error = ex
+                continue
+            if probe and (response.status_code in SEGMENTS_NOT_SUPPORTED or
+                          (response.status_code in SEGMENT_ACCEPTED and 'Range' not in response.headers)):
+                raise OSError(errno.EOPNOTSUPP, "{0} does not assemble segmented uploads".format(url))
+            if response.status_code in SEGMENT_ACCEPTED:
+                return last - first + 1
+            logger.debug("PUT of bytes {0}-{1} to {2} returned {3}".format(first, last, url, response.status_code))
+            error = OSError(errno.EIO, "PUT of bytes {0}-{1} to {2} failed: {3} {4}".format(
+                first, last, url, response.status_code, response.reason))
+        raise error
+
+    def _put_stream(self, url):
+        with open(self.path, 'rb') as fin:
+            reader = md5_cache.MD5Reader(fin, self.size)
+            self.session.put(url, data=reader).raise_for_status()
+        self.md5 = reader.hexdigest()
+
+    def _put_mmap(self, url):
+        with open(self.path, 'rb') as fin:
+            mapping = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                try:
+                    view = memoryview(mapping)
+                except TypeError:
+                    # this python can not take a view of a mapping, send the file the slow way.
+                    logger.debug("No memoryview of mmap, streaming {0}".format(self.path))
+                    self._put_stream(url)
+                    return STREAM
+                try:
+                    md5 = hashlib.md5()
+                    self.session.put(url, data=MmapBody(view, md5, self.block_size, self._throttle)).raise_for_status()
+                    self.md5 = md5.hexdigest()
+                finally:
+                    view.release()
+            finally:
+                _close(mapping)
+        return MMAP
+
+    def _put_sendfile(self, url):
+        """PUT the file with os.sendfile on a plain HTTP connection of its own.
+
+        The connection bypasses the requests session: the headers, cookies and credentials the session would send
+        are used, but not its redirects, retries or connection pools (certificates and verification do not apply
+        to plain HTTP).  So a redirect or an authentication challenge, or a connection that fails, is left to a PUT
+        through the session, and a host that redirected or challenged is sent files through the session from then
+        on.
+
+        :return: the method the file was sent with.
+        """
+        try:
+            status, reason, body = self._sendfile(url)
+        except (IOError, OSError, http_client.HTTPException) as ex:
+            logger.debug("sendfile to {0} failed, sending {1} through the session: {2}".format(url, self.path, ex))
+            return self._put_mmap(url)
+        if status in SESSION_STATUS:
+            logger.debug("sendfile to {0} returned {1}, sending through the session".format(url, status))
+            SESSION_HOSTS.add(urlparse(url).netloc)
+            return self._put_mmap(url)
+        if status >= 400:
+            raise OSError(errno.EIO, "PUT to {0} failed: {1} {2} {3}".format(url, status, reason, body))
+        return SENDFILE
+
+    def _sendfile(self, url):
+        """Send the file to url with os.sendfile, return the status, reason and body of the response."""
+        parts = urlparse(url)
+        selector = parts.path + (parts.query and '?' + parts.query or '')
+        # let the session supply the headers, cookies and credentials it would have sent.
+        prepared = self.session.prepare_request(requests.Request('PUT', url))
+        prepared.headers['Content-Length'] = str(self.size)
+        connection = http_client.HTTPConnection(parts.hostname, parts.port, timeout=self.timeout)
+        try:
+            connection.putrequest('PUT', selector, skip_accept_encoding=True)
+            for key, value in prepared.headers.items():
+                connection.putheader(key, value)
+            connection.endheaders()
+            md5 = hashlib.md5()
+            with open(self.path, 'rb') as fin:
+                mapping = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(mapping)
+                try:
+                    offset = 0
+                    while offset < self.size:
+                        count = min(self.block_size, self.size - offset)
+                        self._throttle(count)
+                        # hash from the mapping, the page cache then serves the sendfile.
+                        md5.update(view[offset:offset + count])
+                        end = offset + count
+                        while offset < end:
+                            sent = _sendfile(connection.sock, fin, offset, end - offset)
+                            if sent == 0:
+                                raise OSError(errno.EIO, "Connection to {0} closed after {1} of {2} bytes".format(
+                                    parts.netloc, offset, self.size))
+                            offset += sent
+                finally:
+                    view.release()
+                    _close(mapping)
+            response = connection.getresponse()
+            body = response.read()
+            self.md5 = md5.hexdigest()
+        finally:
+            connection.close()
+        return response.status, response.reason, body
@@ -0,0 +1,7 @@
+version = '3.0.0b1'
+githash = ''
+major=3
+minor=0
+bugfix=0
+release=False
+debug=False
@@ -7,14 +7,12 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import calendar
 import copy
 import errno
 import fnmatch
 import hashlib
-try:
-    from cStringIO import StringIO
-except ImportError:
-    from io import StringIO
+import io
 import requests
 from requests.exceptions import HTTPError
 import html2text
@@ -25,17 +23,33 @@ import re
 import stat
 import string
 import sys
+import threading
 import time
 import urllib
-from six.moves.urllib.parse import urlparse
+import weakref
+from six.moves.urllib.parse import urlparse, urlencode
 import six
 from xml.etree import ElementTree
 from copy import deepcopy
+from multiprocessing.pool import ThreadPool
 from .NodeCache import NodeCache
 from .version import version
 from cadcutils import net, exceptions, util
+from cadcutils.net.ws import RetrySession
 from .setup_package import _CONFIG_PATH
 from . import md5_cache
+from . import chunking
+from . import compression
+from . import cutout_cache
+from . import download
+from . import health
+from . import jobs
+from . import listing
+from . import pool
+from . import reader
+from . import scheduler
+from . import transfer_cache
+from . import upload
 
 try:
     from urllib import splittag
@@ -52,10 +66,18 @@ if sys.version_info[1] > 6:
 # ch.setLevel(logging.DEBUG)
 # logger.addHandler(ch)
 
-BUFSIZE = 8388608  # Size of read/write buffer
+BUFSIZE = chunking.MAX_CHUNK  # Size of read/write buffer, the largest chunk adaptive reads grow to
 MAX_RETRY_DELAY = 128  # maximum delay between retries
 DEFAULT_RETRY_DELAY = 30  # start delay between retries when Try_After not sent by server.
 MAX_RETRY_TIME = 900  # maximum time for retries before giving up...
+RANGE_GET_THRESHOLD = 2 ** 28  # files larger than this may be fetched as parallel byte ranges
+RACE_ENDPOINTS = 2  # number of endpoint URLs raced against each other by a copy
+NEGOTIATION_THREADS = 8  # transfers negotiated at once by get_node_urls
+CUTOUT_THREADS = 8  # cutouts fetched at once by get_cutouts
+LISTING_PAGE = 500  # a listing with more children than this may continue on a next page
+COPY_CHUNK = 512 * 1024  # size of the first chunks read by a copy, adapted as the data arrives
+# errors of a server side copy that a streamed copy would run into as well
+SERVER_COPY_FATAL = (errno.ENOENT, errno.EACCES, errno.EPERM, errno.EEXIST)
 
 VOSPACE_ARCHIVE = os.getenv("VOSPACE_ARCHIVE", "vospace")
 HEADER_DELEG_TOKEN = 'X-CADC-DelegationToken'
@@ -78,22 +100,164 @@ CADC_VO_VIEWS = {'data': '{}#data'.format(VO_CADC_VIEW_URI),
 # md5sum of a size zero file
 ZERO_MD5 = 'd41d8cd98f00b204e9800998ecf8427e'
 vos_config = util.Config(_CONFIG_PATH)
+scheduler.SCHEDULER.set_rates(*scheduler.config_rates(vos_config))
 
 #requests.packages.urllib3.disable_warnings()
 logging.getLogger("requests").setLevel(logging.ERROR)
 
 
+VOSPACE_TIMES = 4096  # VOSpace dates kept converted by convert_vospace_time_to_seconds
+_vospace_times = {}
+
+
 def convert_vospace_time_to_seconds(str_date):
     """A convenience method that takes a string from a vospace time field and converts it to seconds since epoch.
 
+    VOSpace dates are UT, YYYY-MM-DDTHH:MM:SS.sss, the fields are sliced out and turned into seconds with
+    calendar.timegm rather than parsed with strptime and corrected from local time.  The children of a container
+    are mostly written at the same few times, the last dates converted are remembered.
+
     :param str_date: string to parse into a VOSpace time
     :type str_date: str
-    :return: A datetime object for the provided string date
-    :rtype: datetime
+    :return: The seconds since epoch of the provided string date, fractions of a second dropped
+    :rtype: float
     """
     right = str_date.rfind(":") + 3
-    mtime = time.mktime(time.strptime(str_date[0:right], '%Y-%m-%dT%H:%M:%S'))
-    return mtime - time.mktime(time.gmtime()) + time.mktime(time.localtime())
+    date = str_date[0:right]
+    seconds = _vospace_times.get(date)
+    if seconds is not None:
+        return seconds
+    if len(date) == 19 and date[4] == '-' and date[7] == '-' and date[10] == 'T' and date[13] == ':' and \
+            date[16] == ':':
+        fields = (int(date[0:4]), int(date[5:7]), int(date[8:10]), int(date[11:13]), int(date[14:16]),
+                  int(date[17:19]))
+    else:
+        fields = time.strptime(date, '%Y-%m-%dT%H:%M:%S')[0:6]
+    seconds = float(calendar.timegm(fields))
+    if len(_vospace_times) >= VOSPACE_TIMES:
+        _vospace_times.clear()
+    _vospace_times[date] = seconds
+    return seconds
+
+
+def permissions(node_type, props):
+    """The ls like permissions of a node, or a DirEntry, such as drw-r-----
+
+    :param node_type: the type of the node, vos:DataNode, vos:ContainerNode or vos:LinkNode.
+    :param props: the properties of the node, by name.
+    :type props: dict
+    """
+    perm = []
+    for i in range(10):
+        perm.append('-')
+    perm[1] = 'r'
+    perm[2] = 'w'
+    if node_type == "vos:ContainerNode":
+        perm[0] = 'd'
+    if node_type == "vos:LinkNode":
+        perm[0] = 'l'
+    if props.get('ispublic', "false") == "true":
+        perm[-3] = 'r'
+        perm[-2] = '-'
+    if props.get('groupwrite', 'NONE') != 'NONE':
+        perm[5] = 'w'
+    if props.get('groupread', 'NONE') != 'NONE':
+        perm[4] = 'r'
+    return ''.join(perm)
+
+
+def get_info(node_type, props, target=None, perm=None):
+    """Organize some information about a node, or a DirEntry, and return as dictionary
+
+    :param node_type: the type of the node, vos:DataNode, vos:ContainerNode or vos:LinkNode.
+    :param props: the properties of the node, by name.
+    :type props: dict
+    :param target: the target of a LinkNode.
+    :param perm: the permissions of the node if already known, see permissions.
+    """
+    date = convert_vospace_time_to_seconds(props['date'])
+    creator = (re.search('CN=([^,]*)',
+                         props.get('creator', 'CN=unknown_000,'))
+               .groups()[0].replace(' ', '_')).lower()
+    return {"permissions": perm or permissions(node_type, props),
+            "creator": creator,
+            "readGroup": props.get('groupread', 'NONE'),
+            "writeGroup": props.get('groupwrite', 'NONE'),
+            "isLocked": props.get(VO_PROPERTY_URI_ISLOCKED, "false"),
+            "size": float(props.get('length', 0)),
+            "date": date,
+            "target": target}
+
+
+def get_attr(node_type, props, child_count=0, attr=None):
+    """Work out the stat attributes of a node, or a DirEntry, taking those given in attr as they are.
+
+    :param node_type: the type of the node, vos:DataNode, vos:ContainerNode or vos:LinkNode.
+    :param props: the properties of the node, by name.
+    :type props: dict
+    :param child_count: the number of children of a ContainerNode.
+    :param attr: attributes to use rather than work out.
+    :type attr: dict
+    """
+    if not attr:
+        attr = {}
+    node_attr = {}
+
+    # Only one date provided by VOSpace, so use this as all possible dates.
+
+    access_time = time.time()
+    if not props.get('date', None):
+        modified_time = access_time
+    else:
+        # mktime is expecting a localtime but we're sending a UT date, so
+        # some correction will be needed
+        modified_time = convert_vospace_time_to_seconds(props.get('date'))
+
+    node_attr['st_ctime'] = attr.get('st_ctime', modified_time)
+    node_attr['st_mtime'] = attr.get('st_mtime', modified_time)
+    node_attr['st_atime'] = access_time
+
+    # set the MODE by or'ing together all flags from stat
+    st_mode = 0
+    st_nlink = 1
+    if node_type == 'vos:ContainerNode':
+        st_mode |= stat.S_IFDIR
+        st_nlink = child_count + 2
+    elif node_type == 'vos:LinkNode':
+        st_mode |= stat.S_IFLNK
+    else:
+        st_mode |= stat.S_IFREG
+    node_attr['st_nlink'] = st_nlink
+
+    # Set the OWNER permissions: all vospace Nodes have read/write/execute by owner
+    st_mode |= stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR
+
+    # Set the GROUP permissions
+    if props.get('groupwrite', "NONE") != "NONE":
+        st_mode |= stat.S_IWGRP
+    if props.get('groupread', "NONE") != "NONE":
+        st_mode |= stat.S_IRGRP
+        st_mode |= stat.S_IXGRP
+
+    # Set the OTHER permissions
+    if props.get('ispublic', 'false') == 'true':
+        # If you can read the file then you can execute too.
+        # Public does NOT mean writeable.  EVER
+        st_mode |= stat.S_IROTH | stat.S_IXOTH
+
+    node_attr['st_mode'] = attr.get('st_mode', st_mode)
+
+    # We set the owner and group bits to be those of the currently running process.
+    # This is a hack since we don't have an easy way to figure these out.
+    # TODO Come up with a better approach to uid setting
+    node_attr['st_uid'] = attr.get('st_uid', os.getuid())
+    node_attr['st_gid'] = attr.get('st_uid', os.getgid())
+
+    st_size = int(props.get('length', 0))
+    node_attr['st_size'] = st_size > 0 and st_size or 0
+
+    node_attr['st_blocks'] = node_attr['st_size'] // 512
+    return node_attr
 
 
 class URLParser(object):
@@ -126,7 +290,7 @@ class Connection(object):
     """Class to hold and act on the X509 certificate"""
 
     def __init__(self, vospace_certfile=None, vospace_token=None, http_debug=False,
-                 resource_id=vos_config.get('vos', 'resourceID')):
+                 resource_id=vos_config.get('vos', 'resourceID'), pool_size=None, session_strategy=None):
         """Setup the Certificate for later usage
 
         vospace_certfile -- where to store the certificate, if None then
@@ -134,6 +298,10 @@ class Connection(object):
         vospace_token -- token string (alternative to vospace_certfile)
         http_debug -- set True to generate debug statements (Deprecated)
         resource_id -- The resource ID of the vospace service. Defaults to CADC vos.
+        pool_size -- connections kept open per host, at least the number of threads transferring at once.
+                     Defaults to pool_size of the [transfer] configuration.
+        session_strategy -- pool.SHARED for one session shared by the threads, pool.THREAD for a session
+                     per thread. Defaults to session_strategy of the [transfer] configuration.
 
         If the user supplies an empty vospace_certificate, the connection will be 'anonymous'.
         If no certificate or token are provided, and attempt to find user/password combination
@@ -171,10 +339,94 @@ class Connection(object):
                                           host=os.getenv('VOSPACE_WEBSERVICE', None),
                                           session_headers=session_headers)
         EndPoints.subject = self.subject
+        if pool_size is None:
+            pool_size = vos_config.get('transfer', 'pool_size')
+        self.pool_size = pool_size and int(pool_size) or pool.POOL_SIZE
+        # larger pools for particular hosts, see set_pool_size
+        self.host_pool_sizes = {}
+        if session_strategy is None:
+            session_strategy = vos_config.get('transfer', 'session_strategy') or pool.SHARED
+        if session_strategy not in pool.STRATEGIES:
+            raise ValueError("session_strategy must be one of {0}".format(pool.STRATEGIES))
+        self.session_strategy = session_strategy
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # the sessions handed out, as (weak reference, pid of the process they belong to)
+        self._sessions = []
 
     @property
     def session(self):
-        return self.ws_client._get_session()
+        """The requests session of the calling thread, with its connection pools sized.
+
+        A process forked after the session was used (e.g. by vsync) gets a session of its own, the connections
+        of its parent can not be shared.
+        """
+        if self.session_strategy == pool.THREAD:
+            session = getattr(self._local, 'session', None)
+            if session is None or self._local.pid != os.getpid():
+                session = self._new_session()
+                self._local.session = session
+                self._local.pid = os.getpid()
+            return session
+        with self._lock:
+            if len(self._sessions) > 0 and self._sessions[0][1] != os.getpid():
+                self.ws_client._session = None
+                self._sessions = []
+            session = self.ws_client._get_session()
+            if len(self._sessions) == 0:
+                pool.size_pools(session, self.pool_size, self.host_pool_sizes)
+                self._sessions.append((weakref.ref(session), os.getpid()))
+        return session
+
+    def _new_session(self):
+        """A session of its own for the calling thread, authenticated like the shared one."""
+        shared = self.ws_client._get_session()
+        session = RetrySession(self.ws_client.retry)
+        session.cert = shared.cert
+        session.verify = shared.verify
+        session.auth = shared.auth
+        session.headers.update(shared.headers)
+        pool.size_pools(session, self.pool_size, self.host_pool_sizes)
+        with self._lock:
+            self._sessions = [(ref, pid) for (ref, pid) in self._sessions
+                              if pid == os.getpid() and ref() is not None]
+            self._sessions.append((weakref.ref(session), os.getpid()))
+        return session
+
+    def _live_sessions(self):
+        """The sessions of this process still in use."""
+        sessions = [ref() for (ref, pid) in self._sessions if pid == os.getpid()]
+        return [session for session in sessions if session is not None]
+
+    def set_pool_size(self, size, host=None):
+        """Keep up to size connections open to each host, or to host only.
+
+        Call it before the transfers start with the number of threads that will transfer at once, the
+        connections of a pool too small for them are closed after each request and reopened by the next.
+
+        :param size: the connections kept per host.
+        :type size: int
+        :param host: the name of the host the size is for, None for every host.
+        :type host: str
+        """
+        with self._lock:
+            if host is None:
+                self.pool_size = size
+            else:
+                self.host_pool_sizes[host] = size
+            for session in self._live_sessions():
+                pool.size_pools(session, self.pool_size, self.host_pool_sizes)
+
+    def pool_stats(self):
+        """The requests sent, connections opened and connections reused per host by the live sessions.
+
+        usage:
+            for host, stats in client.conn.pool_stats().items():
+                print(host, stats['reused'], 'of', stats['requests'], 'requests reused a connection')
+        """
+        with self._lock:
+            sessions = self._live_sessions()
+        return pool.pool_stats(sessions)
 
 
     def get_connection(self, url=None):
@@ -223,9 +475,14 @@ class Node(object):
         self.is_public = None
         self.type = None
         self.props = {}
-        self.attr = {}
+        self._attr = {}
+        self._attr_defaults = {}
         self.xattr = {}
         self._node_list = None
+        # the DirEntry of the children read from a listing, until node_list is used
+        self._entries = None
+        # set by Client.get_node once all the children are in node_list
+        self.listed = False
         self._endpoints = None
 
         if not subnodes:
@@ -307,70 +564,27 @@ class Node(object):
     def setattr(self, attr=None):
         """return / augment a dictionary of attributes associated with the Node
 
-        These attributes are determined from the node on VOSpace.
+        These attributes are determined from the node on VOSpace when they are first used, so that the Nodes
+        of a listing, which are mostly only named, do not pay for them.
         :param attr: the  dictionary that holds the attributes
         """
-        if not attr:
-            attr = {}
-        # Get the flags for file mode settings.
-
-        self.attr = {}
-
-        # Only one date provided by VOSpace, so use this as all possible dates.
+        self._attr = None
+        self._attr_defaults = attr or {}
 
-        access_time = time.time()
-        if not self.props.get('date', None):
-            modified_time = access_time
-        else:
-            # mktime is expecting a localtime but we're sending a UT date, so
-            # some correction will be needed
-            modified_time = convert_vospace_time_to_seconds(self.props.get('date'))
-
-        self.attr['st_ctime'] = attr.get('st_ctime', modified_time)
-        self.attr['st_mtime'] = attr.get('st_mtime', modified_time)
-        self.attr['st_atime'] = access_time
-
-        # set the MODE by or'ing together all flags from stat
-        st_mode = 0
-        st_nlink = 1
-        if self.type == 'vos:ContainerNode':
-            st_mode |= stat.S_IFDIR
-            st_nlink = max(2, len(self.get_info_list()) + 2)
-            # if getInfoList length is < 0 we have a problem elsewhere, so above hack solves that problem.
-        elif self.type == 'vos:LinkNode':
-            st_mode |= stat.S_IFLNK
-        else:
-            st_mode |= stat.S_IFREG
-        self.attr['st_nlink'] = st_nlink
-
-        # Set the OWNER permissions: all vospace Nodes have read/write/execute by owner
-        st_mode |= stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR
-
-        # Set the GROUP permissions
-        if self.props.get('groupwrite', "NONE") != "NONE":
-            st_mode |= stat.S_IWGRP
-        if self.props.get('groupread', "NONE") != "NONE":
-            st_mode |= stat.S_IRGRP
-            st_mode |= stat.S_IXGRP
-
-        # Set the OTHER permissions
-        if self.props.get('ispublic', 'false') == 'true':
-            # If you can read the file then you can execute too.
-            # Public does NOT mean writeable.  EVER
-            st_mode |= stat.S_IROTH | stat.S_IXOTH
-
-        self.attr['st_mode'] = attr.get('st_mode', st_mode)
-
-        # We set the owner and group bits to be those of the currently running process.
-        # This is a hack since we don't have an easy way to figure these out.
-        # TODO Come up with a better approach to uid setting
-        self.attr['st_uid'] = attr.get('st_uid', os.getuid())
-        self.attr['st_gid'] = attr.get('st_uid', os.getgid())
+    @property
+    def attr(self):
+        """The stat attributes of the Node, see setattr."""
+        if self._attr is None:
+            self._attr = self._get_attr(self._attr_defaults)
+        return self._attr
 
-        st_size = int(self.props.get('length', 0))
-        self.attr['st_size'] = st_size > 0 and st_size or 0
+    @attr.setter
+    def attr(self, attr):
+        self._attr = attr
 
-        self.attr['st_blocks'] = self.attr['st_size'] // 512
+    def _get_attr(self, attr):
+        """Work out the attributes of the Node, taking those given in attr as they are."""
+        return get_attr(self.type, self.props, self.isdir() and self.child_count() or 0, attr)
 
     def setxattr(self, attrs=None):
         """Initialize the extended attributes using the Node properties that are not part of the core set.
@@ -637,42 +851,15 @@ class Node(object):
 
     def get_info(self):
         """Organize some information about a node and return as dictionary"""
-        date = convert_vospace_time_to_seconds(self.props['date'])
-        creator = (re.search('CN=([^,]*)',
-                                         self.props.get('creator', 'CN=unknown_000,'))
-                               .groups()[0].replace(' ', '_')).lower()
-        perm = []
-        for i in range(10):
-            perm.append('-')
-        perm[1] = 'r'
-        perm[2] = 'w'
-        if self.type == "vos:ContainerNode":
-            perm[0] = 'd'
-        if self.type == "vos:LinkNode":
-            perm[0] = 'l'
-        if self.props.get('ispublic', "false") == "true":
-            perm[-3] = 'r'
-            perm[-2] = '-'
-        write_group = self.props.get('groupwrite', 'NONE')
-        if write_group != 'NONE':
-            perm[5] = 'w'
-        read_group = self.props.get('groupread', 'NONE')
-        if read_group != 'NONE':
-            perm[4] = 'r'
-        is_locked = self.props.get(VO_PROPERTY_URI_ISLOCKED, "false")
-        return {"permissions": ''.join(perm),
-                "creator": creator,
-                "readGroup": read_group,
-                "writeGroup": write_group,
-                "isLocked": is_locked,
-                "size": float(self.props.get('length', 0)),
-                "date": date,
-                "target": self.target}
+        return get_info(self.type, self.props, self.target)
 
     @property
     def node_list(self):
         """Get a list of all the nodes held to by a ContainerNode return a
            list of Node objects"""
+        if self._node_list is None and self._entries is not None:
+            self._node_list = [entry.node() for entry in self._entries]
+            self._entries = None
         if self._node_list is None:
             self._node_list = []
             for nodesNode in self.node.findall(Node.NODES):
@@ -680,6 +867,14 @@ class Node(object):
                     self.add_child(nodeNode)
         return self._node_list
 
+    def child_count(self):
+        """The number of children of a ContainerNode, counted without making a Node of each."""
+        if self._node_list is not None:
+            return len(self._node_list)
+        if self._entries is not None:
+            return len(self._entries)
+        return sum([len(nodes_node.findall(Node.NODE)) for nodes_node in self.node.findall(Node.NODES)])
+
     def add_child(self, child_element_tree):
         """
         Add a child node to a node list.
@@ -691,6 +886,28 @@ class Node(object):
         self.node_list.append(child_node)
         return child_node
 
+    def add_entries(self, entries):
+        """
+        Add the children read from a listing, their Nodes are made when node_list is first used.
+        :param entries: the children to add.
+        :type entries: [DirEntry]
+        """
+        if self._node_list is not None:
+            self._node_list.extend([entry.node() for entry in entries])
+        elif self._entries is None:
+            self._entries = list(entries)
+        else:
+            self._entries.extend(entries)
+
+    def iter_children(self):
+        """Yield the Node of each child, those not yet made are not kept in node_list."""
+        if self._node_list is None and self._entries is not None:
+            for entry in self._entries:
+                yield entry.node()
+        else:
+            for child in self.node_list:
+                yield child
+
     def clear_properties(self):
         logger.debug("clearing properties")
         properties_node_list = self.node.findall(Node.PROPERTIES)
@@ -709,7 +926,7 @@ class Node(object):
         :return a list of tuples containing the (NodeName, Info) about the node and its childern
         """
         info = {}
-        for node in self.node_list:
+        for node in self.iter_children():
             info[node.name] = node.get_info()
         if self.type == "vos:DataNode":
             info[self.name] = self.get_info()
@@ -746,6 +963,113 @@ class Node(object):
         return prop.text
 
 
+def _intern(value):
+    """value, shared with the equal strings interned before"""
+    return isinstance(value, str) and six.moves.intern(value) or value
+
+
+class _Shared(list):
+    """The properties shared by DirEntry objects, weakly referenced so they go with the last of them."""
+
+    # a tuple can not be weakly referenced
+    __slots__ = ('__weakref__',)
+
+
+class DirEntry(object):
+    """A child of a ContainerNode as listed by Client.scandir.
+
+    A listing of a million children made into Nodes takes gigabytes: each holds its XML tree and dictionaries of
+    properties and attributes.  A DirEntry holds the uri, type, size, MD5, date, permissions and link target of
+    the child in slots, and its other properties, such as the creator and the groups, which are mostly the same
+    for all the children, in a tuple shared by the entries that have the same ones.  Its Node is made on demand.
+    """
+
+    __slots__ = ('uri', 'type', '_length', 'md5', 'date', 'permissions', 'target', '_others')
+
+    # DirEntry._others of the entries alive, by value
+    _shared = weakref.WeakValueDictionary()
+    _shared_limit = 10000  # other properties shared at most, beyond that each entry holds its own
+
+    def __init__(self, element):
+        """
+        :param element: the XML element of the child in the listing of its container.
+        """
+        self.uri = element.get('uri')
+        self.type = _intern(element.get(Node.TYPE))
+        self.target = element.findtext(Node.TARGET)
+        props = {}
+        others = []
+        for properties in element.findall(Node.PROPERTIES):
+            for property_node in properties.findall(Node.PROPERTY):
+                prop_uri = property_node.get('uri')
+                name = Node.get_prop_name(prop_uri)
+                value = Node.get_prop_value(property_node)
+                props[name] = value
+                if name not in ('length', 'MD5', 'date'):
+                    others.append((_intern(name), _intern(prop_uri), _intern(value)))
+        self._length = props.get('length')
+        self.md5 = props.get('MD5')
+        self.date = props.get('date')
+        self.permissions = _intern(permissions(self.type, props))
+        others = tuple(others)
+        if len(DirEntry._shared) < DirEntry._shared_limit:
+            others = DirEntry._shared.setdefault(others, _Shared(others))
+        self._others = others
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def name(self):
+        """The name of the child."""
+        return os.path.basename(self.uri)
+
+    @property
+    def size(self):
+        """The size in bytes of the data of the child."""
+        return int(self._length or 0)
+
+    @property
+    def props(self):
+        """The properties of the child by name, as in Node.props."""
+        props = dict([(name, value) for name, prop_uri, value in self._others])
+        for name, value in (('length', self._length), ('MD5', self.md5), ('date', self.date)):
+            if value is not None:
+                props[name] = value
+        return props
+
+    @property
+    def attr(self):
+        """The stat attributes of the child, as in Node.attr."""
+        return get_attr(self.type, self.props)
+
+    def isdir(self):
+        """Check if the child is a container Node"""
+        return self.type == Node.CONTAINER_NODE
+
+    def islink(self):
+        """Check if the child is a link Node"""
+        return self.type == Node.LINK_NODE
+
+    def get_info(self):
+        """Organize some information about the child and return as dictionary, as Node.get_info does."""
+        return get_info(self.type, self.props, self.target, self.permissions)
+
+    def node(self):
+        """The Node of the child, as it would be in the node_list of its container."""
+        element = ElementTree.Element(Node.NODE, {'uri': self.uri, Node.TYPE: self.type})
+        properties = ElementTree.SubElement(element, Node.PROPERTIES)
+        for name, value in (('length', self._length), ('MD5', self.md5), ('date', self.date)):
+            if value is not None:
+                ElementTree.SubElement(properties, Node.PROPERTY,
+                                       {'uri': "{0}#{1}".format(Node.IVOAURL, name)}).text = value
+        for name, prop_uri, value in self._others:
+            ElementTree.SubElement(properties, Node.PROPERTY, {'uri': prop_uri}).text = value
+        if self.target is not None:
+            ElementTree.SubElement(element, Node.TARGET).text = self.target
+        return Node(element)
+
+
 class VOFile(object):
     """
     A class for managing http connections
@@ -766,7 +1090,7 @@ class VOFile(object):
     retryCodes = (503, 408, 504, 412)
 
     def __init__(self, url_list, connector, method, size=None,
-                 follow_redirect=True, byte_range=None, possible_partial_read=False):
+                 follow_redirect=True, byte_range=None, possible_partial_read=False, selector=None, scheduler=None):
         self.closed = True
         assert isinstance(connector, Connection)
         self.connector = connector
@@ -793,6 +1117,12 @@ class VOFile(object):
             self.URLs = deepcopy(url_list)
         else:
             self.URLs = [url_list]
+        # health.EndpointSelector used to try the most promising URLs first and to record how they perform
+        self.selector = selector
+        if self.selector is not None:
+            self.URLs = self.selector.order(self.URLs)
+        # scheduler.TransferScheduler the reads are accounted to, as interactive transfers
+        self.scheduler = scheduler
         self.urlIndex = 0
         self.followRedirect = follow_redirect
         self._fpos = 0
@@ -954,136 +1284,143 @@ class VOFile(object):
     def read(self, size=None, return_response=False):
         """return size bytes from the connection response
 
+        Busy servers and failing URLs are retried in a loop, moving through the URL list, until the
+        retry limits are reached.
+
         :param size: number of bytes to read from the file.
         """
 
-        if self.resp is None:
-            # this is original retry flag of the session
-            orig_retry_flag = self.connector.session.retry
+        while True:
+            if self.resp is None:
+                # this is original retry flag of the session
+                orig_retry_flag = self.connector.session.retry
+                try:
+                    if (len(self.URLs) > 1) and (self.urlIndex < len(self.URLs) - 1):
+                        # there is more urls to try so don't bother retrying on transient errors
+                        # return instead and try the next url
+                        self.connector.session.retry = False
+                    start = time.time()
+                    self.resp = self.connector.session.send(self.request, stream=True, verify=False)
+                    if self.selector is not None:
+                        self.selector.record_latency(self.url, time.time() - start)
+                except exceptions.HttpException as e:
+                    # this is the path for all status_codes between 400 and 600
+                    self.resp = e.orig_exception.response
+                    if self.selector is not None:
+                        self.selector.record_failure(self.url)
+
+                    # restore the original retry flag of the session
+                    self.connector.session.retry = orig_retry_flag
+
+                    self.checkstatus()
+                    if self.resp.status_code == 416:
+                        return ""
+
+                    if isinstance(e, exceptions.UnauthorizedException) or\
+                       isinstance(e, exceptions.BadRequestException) or\
+                       isinstance(e, exceptions.ForbiddenException):
+                        raise
+
+                    # Note: 404 (File Not Found) might be returned when:
+                    # 1. file deleted or replaced
+                    # 2. file migrated from cache
+                    # 3. hardware failure on storage node
+                    # For 3. it is necessary to try the other URLs in the list
+                    #   otherwise this the failed URL might show up even after the
+                    #   caller tries to re-negotiate the transfer.
+                    # For 1. and 2., calls to the other URLs in the list might or
+                    #   might not succeed.
+                    if self.urlIndex < len(self.URLs) - 1:
+                        # go to the next URL
+                        self.urlIndex += 1
+                        self.open(self.URLs[self.urlIndex], "GET")
+                        self.resp = None
+                        continue
+                    else:
+                        raise
+                finally:
+                    # restore the original retry flag of the session
+                    self.connector.session.retry = orig_retry_flag
+
+            # Get the file size. We use this HEADER-CONTENT-LENGTH as a
+            # fallback to work around a server-side Java bug that limits
+            # 'Content-Length' to a signed 32-bit integer (~2 gig files)
             try:
-                if (len(self.URLs) > 1) and (self.urlIndex < len(self.URLs) - 1):
-                    # there is more urls to try so don't bother retrying on transient errors
-                    # return instead and try the next url
-                    self.connector.session.retry = False
-                self.resp = self.connector.session.send(self.request, stream=True, verify=False)
-            except exceptions.HttpException as e:
-                # this is the path for all status_codes between 400 and 600
-                self.resp = e.orig_exception.response
-
-                # restore the original retry flag of the session
-                self.connector.session.retry = orig_retry_flag
-
-                self.checkstatus()
-                if self.resp.status_code == 416:
-                    return ""
-
-                if isinstance(e, exceptions.UnauthorizedException) or\
-                   isinstance(e, exceptions.BadRequestException) or\
-                   isinstance(e, exceptions.ForbiddenException):
-                    raise
-
-                # Note: 404 (File Not Found) might be returned when:
-                # 1. file deleted or replaced
-                # 2. file migrated from cache
-                # 3. hardware failure on storage node
-                # For 3. it is necessary to try the other URLs in the list
-                #   otherwise this the failed URL might show up even after the
-                #   caller tries to re-negotiate the transfer.
-                # For 1. and 2., calls to the other URLs in the list might or
-                #   might not succeed.
-                if self.urlIndex < len(self.URLs) - 1:
-                    # go to the next URL
-                    self.urlIndex += 1
-                    self.open(self.URLs[self.urlIndex], "GET")
+                self.size = int(self.resp.headers.get("Content-Length",
+                                                      self.resp.headers.get(HEADER_CONTENT_LENGTH, 0)))
+            except Exception:
+                self.size = 0
+
+            if self.resp.status_code == 200:
+                self.md5sum = self.resp.headers.get("Content-MD5", None)
+                self.totalFileSize = self.size
+
+            if self.resp is None:
+                raise OSError(errno.EFAULT, "No response from VOServer")
+
+            # check the most likely response first
+            if self.resp.status_code == 200 or self.resp.status_code == 206:
+                if return_response:
+                    return self.resp
+                # raw.read never returns more than size bytes, no need to copy them into a slice
+                buff = self.resp.raw.read(size)
+                if self.scheduler is not None:
+                    self.scheduler.acquire(len(buff), scheduler.DOWNLOAD, scheduler.INTERACTIVE)
+                return buff
+            elif self.resp.status_code == 303 or self.resp.status_code == 302:
+                url = self.resp.headers.get('Location', None)
+                logger.debug("Got redirect URL: {0}".format(url))
+                self.url = url
+                if not url:
+                    raise OSError(errno.ENOENT,
+                                  "Got 303 on {0} but no Location value in header? [{1}]".format(self.url,
+                                                                                                 self.resp.content),
+                                  self.url)
+                if self.followRedirect:
+                    # We open this new URL without the byte range and partial read as we are following a service
+                    # redirect and that service redirect is to the object that satisfies the original request.
+                    # TODO seperate out making the transfer reqest and reading the response content.
+                    self.open(url, "GET")
                     self.resp = None
-                    return self.read(size)
+                    # logger.debug("Following redirected URL:  %s" % (URL))
+                    continue
                 else:
-                    raise
-            finally:
-                # restore the original retry flag of the session
-                self.connector.session.retry = orig_retry_flag
-
-
-
-        # Get the file size. We use this HEADER-CONTENT-LENGTH as a
-        # fallback to work around a server-side Java bug that limits
-        # 'Content-Length' to a signed 32-bit integer (~2 gig files)
-        try:
-            self.size = int(self.resp.headers.get("Content-Length", self.resp.headers.get(HEADER_CONTENT_LENGTH, 0)))
-        except Exception:
-            self.size = 0
+                    # logger.debug("Got url:%s from redirect but not following" %
+                    # (self.url))
+                    return self.url
 
-        if self.resp.status_code == 200:
-            self.md5sum = self.resp.headers.get("Content-MD5", None)
-            self.totalFileSize = self.size
-
-        if self.resp is None:
-            raise OSError(errno.EFAULT, "No response from VOServer")
-
-        # check the most likely response first
-        if self.resp.status_code == 200 or self.resp.status_code == 206:
-            if return_response:
-                return self.resp
-            else:
-                buff = self.resp.raw.read(size)
-                size = size is not None and size < len(buff) and size or len(buff)
-                # logger.debug("Sending back {0} bytes".format(size))
-                return buff[:size]
-        elif self.resp.status_code == 303 or self.resp.status_code == 302:
-            url = self.resp.headers.get('Location', None)
-            logger.debug("Got redirect URL: {0}".format(url))
-            self.url = url
-            if not url:
-                raise OSError(errno.ENOENT,
-                              "Got 303 on {0} but no Location value in header? [{1}]".format(self.url,
-                                                                                             self.resp.content),
-                              self.url)
-            if self.followRedirect:
-                # We open this new URL without the byte range and partial read as we are following a service
-                # redirect and that service redirect is to the object that satisfies the original request.
-                # TODO seperate out making the transfer reqest and reading the response content.
-                self.open(url, "GET")
-                # logger.debug("Following redirected URL:  %s" % (URL))
-                return self.read(size)
+            # start from top of URLs with a delay
+            self.urlIndex = 0
+            logger.error("Servers busy {0} for {1}".format(self.resp.status_code, self.URLs))
+            msg = self.resp.text
+            if msg is not None:
+                msg = html2text.html2text(msg, self.url).strip()
             else:
-                # logger.debug("Got url:%s from redirect but not following" %
-                # (self.url))
-                return self.url
-
-
-        # start from top of URLs with a delay
-        self.urlIndex = 0
-        logger.error("Servers busy {0} for {1}".format(self.resp.status_code, self.URLs))
-        msg = self.resp.text
-        if msg is not None:
-            msg = html2text.html2text(msg, self.url).strip()
-        else:
-            msg = "No Message Sent"
-        logger.error("Message from VOSpace {0}: {1}".format(self.url, msg))
-        try:
-            # see if there is a Retry-After in the head...
-            ras = int(self.resp.headers.get("Retry-After", 5))
-        except ValueError:
-            ras = self.currentRetryDelay
-            if (self.currentRetryDelay * 2) < MAX_RETRY_DELAY:
-                self.currentRetryDelay *= 2
+                msg = "No Message Sent"
+            logger.error("Message from VOSpace {0}: {1}".format(self.url, msg))
+            try:
+                # see if there is a Retry-After in the head...
+                ras = int(self.resp.headers.get("Retry-After", 5))
+            except ValueError:
+                ras = self.currentRetryDelay
+                if (self.currentRetryDelay * 2) < MAX_RETRY_DELAY:
+                    self.currentRetryDelay *= 2
+                else:
+                    self.currentRetryDelay = MAX_RETRY_DELAY
+
+            if ((self.retries < self.maxRetries) and
+                    (self.totalRetryDelay < self.maxRetryTime)):
+                logger.error("Retrying in {0} seconds".format(ras))
+                self.totalRetryDelay += ras
+                self.retries += 1
+                time.sleep(int(ras))
+                self.open(self.URLs[self.urlIndex], "GET")
+                self.resp = None
             else:
-                self.currentRetryDelay = MAX_RETRY_DELAY
-
-        if ((self.retries < self.maxRetries) and
-                (self.totalRetryDelay < self.maxRetryTime)):
-            logger.error("Retrying in {0} seconds".format(ras))
-            self.totalRetryDelay += ras
-            self.retries += 1
-            time.sleep(int(ras))
-            self.open(self.URLs[self.urlIndex], "GET")
-            self.resp = None
-            return self.read(size)
-        else:
-            raise OSError(self.resp.status_code,
-                          "failed to connect to server after multiple attempts {0} {1}".format(self.resp.reason,
-                                                                                               self.resp.status_code),
-                          self.url)
+                raise OSError(self.resp.status_code,
+                              "failed to connect to server after multiple attempts {0} {1}".format(
+                                  self.resp.reason, self.resp.status_code),
+                              self.url)
 
     @staticmethod
     def write(buf):
@@ -1116,6 +1453,8 @@ class EndPoints(object):
         self.service = \
                 net.BaseWsClient(self.resource_id, EndPoints.subject, 'vos/' + version,
                                  host=self.VOSPACE_WEBSERVICE)
+        # resume the TLS sessions of the Connection rather than make handshakes of its own
+        pool.size_pools(self.service._get_session())
 
     @property
     def properties(self):
@@ -1214,6 +1553,36 @@ class Client(object):
         self.transfer_shortcut = transfer_shortcut
         self.secure_get = secure_get
         self._endpoints = {}
+        # latency, throughput and error history of the storage hosts, shared by all clients
+        self.endpoint_selector = health.SELECTOR
+        # polls the UWS jobs of moves, recursive updates and negotiations, shared by all clients
+        self.job_monitor = jobs.MONITOR
+        # the bandwidth limits shared by all clients
+        self.scheduler = scheduler.SCHEDULER
+        # TransferStats of the last file copied
+        self.transfer_stats = None
+        # recently negotiated data URLs, reused until they expire or fail
+        ttl = vos_config.get('transfer', 'url_cache_ttl')
+        size = vos_config.get('transfer', 'url_cache_size')
+        self.transfer_cache = transfer_cache.TransferCache(
+            ttl=ttl is None and transfer_cache.DEFAULT_TTL or float(ttl),
+            size=size is None and transfer_cache.DEFAULT_SIZE or int(size))
+        # the encoding copies compress their data with on the wire, unless told otherwise
+        try:
+            self.content_encoding = compression.check(vos_config.get('transfer', 'content_encoding'))
+        except OSError as ex:
+            logger.warning("Ignoring content_encoding of {0}: {1}".format(_CONFIG_PATH, ex))
+            self.content_encoding = None
+        # large files sent as segments, to a service known to assemble them
+        self.segmented_uploads = str(vos_config.get('transfer', 'segmented_uploads')).lower() in ('true', 'yes', '1')
+        # cutouts already computed by the service, reused while their file is unchanged
+        cache_dir = vos_config.get('transfer', 'cutout_cache_dir')
+        cache_size = vos_config.get('transfer', 'cutout_cache_size')
+        max_size = cutout_cache.DEFAULT_SIZE
+        if cache_size is not None:
+            max_size = int(float(cache_size) * cutout_cache.MB)
+        self.cutout_cache = cutout_cache.CutoutCache(
+            cache_dir=cache_dir and os.path.expanduser(cache_dir) or cutout_cache.DEFAULT_DIR, max_size=max_size)
 
         return
 
@@ -1286,7 +1655,7 @@ class Client(object):
         if isinstance(pattern, str) and not isinstance(dirname, str):
             dirname = str(dirname, sys.getfilesystemencoding() or sys.getdefaultencoding())
         try:
-            names = self.listdir(dirname, force=True)
+            names = [entry.name for entry in self.scandir(dirname)]
         except os.error:
             return []
         if not pattern.startswith('.'):
@@ -1344,20 +1713,46 @@ class Client(object):
         return cls.magic_check.search(s) is not None
 
     # @logExceptions()
-    def copy(self, source, destination, send_md5=False):
+    def copy(self, source, destination, send_md5=False, nstreams=1, resume=False, priority=scheduler.BULK,
+             content_encoding=None, compressed=None):
         """copy from source to destination.
 
-        One of source or destination must be a vospace location and the other must be a local location.
+        One of source or destination must be a vospace location, if both are the data is copied inside VOSpace.
 
-        :param source: The source file to send to VOSpace or the VOSpace node to retrieve
-        :type source: str
+        :param source: The source file to send to VOSpace or the VOSpace node to retrieve, or a file-like object
+        or iterator of bytes to send to VOSpace with put_stream.
+        :type source: str, file, iterator
         :param destination: The VOSpace location to put the file to or the local destination.
         :type destination: str
         :param send_md5: Should copy send back the md5 of the destination file or just the size?
         :type send_md5: bool
-
-        """
-        # TODO: handle vospace to vospace copies.
+        :param nstreams: Number of byte ranges to download, or segments to upload, at once. When nstreams > 1
+        downloads larger than RANGE_GET_THRESHOLD are split into ranges spread across the endpoint URLs and uploads
+        larger than upload.SEGMENT_SIZE are sent as segments, if segmented_uploads is set in the [transfer]
+        configuration and the service can assemble them.
+        :type nstreams: int
+        :param resume: Keep a journal of the bytes downloaded so a failed or interrupted download only fetches the
+        missing byte ranges when it is retried.
+        :type resume: bool
+        :param priority: scheduler.BULK, or scheduler.INTERACTIVE for a copy somebody is waiting on, which is
+        given the bandwidth first when the transfers of the process are rate limited.
+        :type priority: str
+        :param content_encoding: compress the data on the wire with 'gzip' or 'zstd' where the endpoint allows
+        it, the data is stored and written as is.  Defaults to content_encoding of the [transfer] configuration,
+        'identity' turns it off.
+        :type content_encoding: str, None
+        :param compressed: the VOSpace node holds the data compressed with 'gzip' or 'zstd': uploads compress
+        the local file, downloads write it decompressed.  MD5s are those of the compressed data.
+        :type compressed: str, None
+
+        """
+        if not isinstance(source, six.string_types):
+            return self.put_stream(source, destination, send_md5=send_md5, priority=priority,
+                                   content_encoding=content_encoding, compressed=compressed)
+        content_encoding = compression.check(content_encoding is None and self.content_encoding or content_encoding)
+        compressed = compression.check(compressed)
+        if source[0:4] == "vos:" and destination[0:4] == "vos:":
+            return self._vospace_copy(source, destination, send_md5=send_md5, priority=priority)
 
         success = False
         destination_size = None
@@ -1366,84 +1761,148 @@ class Client(object):
         get_node_url_retried = False
 
         if source[0:4] == "vos:":
-            check_md5 = False
-            match = re.search("([^\[\]]*)(\[.*\])$", source)
-            ra_dec_match = re.search("([^\(\)]*)"
-                                     "(?P<cutout>\("
-                                     "(?P<ra>[\-\+]?\d*(\.\d*)?),"
-                                     "(?P<dec>[\-\+]?\d*(\.\d*)?),"
-                                     "(?P<rad>\d*(\.\d*)?)\))$",
-                                     source)
-
-            if match is not None:
-                view = 'cutout'
-                source = match.group(1)
-                cutout = match.group(2)
-            elif ra_dec_match is not None:
-                view = 'cutout'
-                source = ra_dec_match.group(1)
-                cutout = "CIRCLE ICRS {} {} {}".format(ra_dec_match.group('ra'),
-                                                  ra_dec_match.group('dec'),
-                                                  ra_dec_match.group('rad'))
-            else:
-                view = 'data'
-                cutout = None
-                check_md5 = True
-                source_md5 = self.get_node(source).props.get('MD5', ZERO_MD5)
-            get_urls = self.get_node_url(source, method='GET', cutout=cutout, view=view)
+            source, view, cutout = self._split_cutout(source)
+            check_md5 = view == 'data'
+            if check_md5:
+                source_node = self.get_node(source)
+                source_md5 = source_node.props.get('MD5', ZERO_MD5)
+            cache_key = None
+            if view == 'cutout' and compressed is None:
+                cache_key = self._cutout_cache_key(source, cutout)
+                if cache_key is not None:
+                    destination_size = self.cutout_cache.get(cache_key, destination)
+                    if destination_size is not None:
+                        logger.info("GET {0}{1}: {2} bytes from the cutout cache".format(source, cutout,
+                                                                                          destination_size))
+                        return destination_size
+            accept = content_encoding is not None and {'Accept-Encoding': content_encoding} or {}
+            # URLs negotiated earlier (e.g. by get_node_urls) may be stale, renegotiate if they all fail.
+            reused = self.transfer_cache.get(self.transfer_cache.key(self.fix_uri(source), 'GET', view,
+                                                                      cutout)) is not None
+            get_urls = self.endpoint_selector.order(self.get_node_url(source, method='GET', cutout=cutout, view=view))
+            if check_md5 and compressed is None and (resume or nstreams > 1):
+                source_size = int(source_node.props.get('length', 0))
+                if resume or source_size >= RANGE_GET_THRESHOLD:
+                    try:
+                        destination_md5 = self._range_get(get_urls, destination, source_size, source_md5,
+                                                          nstreams=nstreams, resume=resume, priority=priority)
+                        destination_size = os.stat(destination).st_size
+                        success = True
+                    except (IOError, OSError) as ex:
+                        logging.debug("Ranged GET of {0} failed: {1}".format(source, ex))
+                        self.invalidate_node_url(source)
+                        if resume and getattr(ex, 'errno', None) != errno.EOPNOTSUPP:
+                            # keep the partial file and journal for the next attempt
+                            raise OSError(errno.EIO, "Interrupted copying {0} -> {1}, retry to resume: {2}".format(
+                                source, destination, ex))
+                        logging.debug("Reverting to a single stream GET")
             while not success:
                 # If there are no urls available, drop through to full negotiation if that wasn't already tried
                 if len(get_urls) == 0:
-                    if self.transfer_shortcut and not get_node_url_retried:
+                    if (self.transfer_shortcut or reused) and not get_node_url_retried:
                         get_urls = self.get_node_url(source, method='GET', cutout=cutout, view=view,
                                                      full_negotiation=True)
-                        # remove the first one as we already tried that one.
-                        get_urls.pop(0)
+                        if not reused:
+                            # remove the first one as we already tried that one.
+                            get_urls.pop(0)
+                        get_urls = self.endpoint_selector.order(get_urls)
                         get_node_url_retried = True
                     else:
                         break
-                get_url = get_urls.pop(0)
+                # race the most promising endpoints, the others go back in the list in case the winner fails.
+                racers = get_urls[:RACE_ENDPOINTS]
+                del get_urls[:RACE_ENDPOINTS]
+                get_url = None
                 try:
-                    response = self.conn.session.get(get_url, timeout=(2, 5), stream=True)
-                    source_md5 = response.headers.get('Content-MD5', source_md5)
-                    response.raise_for_status()
+                    get_url, response = self.endpoint_selector.race(self.conn.session, racers, headers=accept)
+                    get_urls[0:0] = [url for url in racers if url != get_url]
+                    # hash the bytes as they arrive rather than reading the file back afterwards.
+                    md5 = hashlib.md5()
+                    sizer = chunking.ChunkSizer(COPY_CHUNK, maximum=BUFSIZE)
+                    encoding = response.headers.get('Content-Encoding')
+                    if encoding in compression.available():
+                        chunks = compression.decompress_chunks(chunking.iter_content(response, sizer, decode=False),
+                                                               encoding)
+                    else:
+                        chunks = chunking.iter_content(response, sizer)
+                    if encoding is None:
+                        # the Content-MD5 of an encoded response is that of the encoded bytes
+                        source_md5 = response.headers.get('Content-MD5', source_md5)
+                    # the MD5 is that of the data as stored, a compressed variant is decompressed after hashing
+                    decompressor = compressed is not None and compression.Decompressor(compressed) or None
+                    start = time.time()
                     with open(destination, 'wb') as fout:
-                        for chunk in response.iter_content(chunk_size=512 * 1024):
-                            if chunk:
-                                fout.write(chunk)
-                                fout.flush()
+                        for chunk in chunks:
+                            self.scheduler.acquire(len(chunk), scheduler.DOWNLOAD, priority)
+                            md5.update(chunk)
+                            if decompressor is not None:
+                                chunk = decompressor.decompress(chunk)
+                            fout.write(chunk)
+                            fout.flush()
+                        if decompressor is not None:
+                            fout.write(decompressor.flush())
                     destination_size = os.stat(destination).st_size
+                    elapsed = time.time() - start
+                    self.endpoint_selector.record_transfer(get_url, destination_size, elapsed)
+                    self.transfer_stats = upload.TransferStats(upload.STREAM, destination_size, elapsed, sizer.size)
+                    logger.info("GET {0}: {1}".format(get_url, self.transfer_stats))
                     if check_md5:
-                        destination_md5 = md5_cache.MD5_Cache.computeMD5(destination)
+                        destination_md5 = md5.hexdigest()
                         logger.debug("{0} {1}".format(source_md5, destination_md5))
                         assert destination_md5 == source_md5
                     success = True
                 except Exception as ex:
-                    logging.debug("Failed to GET {0}".format(get_url))
+                    logging.debug("Failed to GET {0}".format(get_url or racers))
                     logging.debug("Got error {0}".format(ex))
+                    if get_url is not None:
+                        self.endpoint_selector.record_failure(get_url)
+                    self.invalidate_node_url(source)
                     continue
+            if success and cache_key is not None:
+                self.cutout_cache.put(cache_key, destination)
         else:
-            source_md5 = md5_cache.MD5_Cache.computeMD5(source)
+            if compressed is not None:
+                with open(source, 'rb') as fin:
+                    return self.put_stream(fin, destination, send_md5=send_md5, priority=priority,
+                                           content_encoding=content_encoding, compressed=compressed)
+            def stored():
+                props = self.get_node(destination, limit=0, force=True).props
+                return int(props.get('length', 0)), props.get('MD5', ZERO_MD5)
+
+            uploader = upload.FileUpload(self.conn.session, source, nstreams=nstreams, scheduler=self.scheduler,
+                                         priority=priority, content_encoding=content_encoding,
+                                         segments=self.segmented_uploads, stored=stored)
+            reused = self.transfer_cache.get(self.transfer_cache.key(self.fix_uri(destination), 'PUT')) is not None
             put_urls = self.get_node_url(destination, 'PUT')
             while not success:
                 if len(put_urls) == 0:
-                    if self.transfer_shortcut and not get_node_url_retried:
+                    if (self.transfer_shortcut or reused) and not get_node_url_retried:
                         put_urls = self.get_node_url(destination, method='PUT', full_negotiation=True)
-                        # remove the first one as we already tried that one.
-                        put_urls.pop(0)
+                        if not reused:
+                            # remove the first one as we already tried that one.
+                            put_urls.pop(0)
                         get_node_url_retried = True
                     else:
                         break
                 put_url = put_urls.pop(0)
                 try:
-                    with open(source, 'rb') as fin:
-                        self.conn.session.put(put_url, data=fin)
+                    # the MD5 is computed while the file is sent.
+                    self.transfer_stats = uploader.put(put_url)
+                    source_md5 = uploader.md5
                     node = self.get_node(destination, limit=0, force=True)
                     destination_md5 = node.props.get('MD5', ZERO_MD5)
+                    if destination_md5 != source_md5 and uploader.sent_encoding is not None:
+                        # the endpoint stored the encoded bytes, send them again as they are
+                        compression.SUPPORT.refuse(put_url)
+                        self.transfer_stats = uploader.put(put_url)
+                        source_md5 = uploader.md5
+                        node = self.get_node(destination, limit=0, force=True)
+                        destination_md5 = node.props.get('MD5', ZERO_MD5)
                     assert destination_md5 == source_md5
                 except Exception as ex:
                     logging.debug("FAILED to PUT to {0}".format(put_url))
                     logging.debug("Got error: {0}".format(ex))
+                    self.invalidate_node_url(destination)
                     continue
                 success = True
                 break
@@ -1453,6 +1912,346 @@ class Client(object):
 
         return send_md5 and destination_md5 or destination_size
 
+    def put_stream(self, source, destination, send_md5=False, priority=scheduler.BULK, content_encoding=None,
+                   compressed=None):
+        """Upload the bytes read from a file-like object, or produced by an iterator, to a VOSpace DataNode.
+
+        The data is sent with chunked transfer encoding as it is read, so it never has to be written to a local
+        file first, and hashed on the way.  Once sent, the MD5 the node reports is checked against it.  A stream
+        can only be read once: the next URL is tried only if the PUT failed before any data was sent, and a
+        seekable source is sent again uncompressed if the endpoint stored the compressed bytes.
+
+        usage:
+            with open('/tmp/catalogue.csv', 'rb') as fin:
+                client.put_stream(fin, 'vos:dir/catalogue.csv')
+            client.put_stream((row.encode('utf-8') for row in rows), 'vos:dir/rows.txt')
+
+        :param source: an object with a read method returning bytes, or an iterator of bytes.
+        :param destination: the VOSpace DataNode to write.
+        :type destination: str
+        :param send_md5: return the MD5 of the node rather than the number of bytes sent.
+        :type send_md5: bool
+        :param priority: the scheduler priority of the upload.
+        :param content_encoding: compress the data on the wire, see copy.
+        :param compressed: store the data compressed with this encoding, see copy.
+        :return: the MD5 of the destination if send_md5 else the number of bytes stored
+        """
+        destination = self.fix_uri(destination)
+        content_encoding = compression.check(content_encoding is None and self.content_encoding or content_encoding)
+        sizer = None
+        rewind = None
+        if hasattr(source, 'read'):
+            sizer = chunking.ChunkSizer(COPY_CHUNK, maximum=BUFSIZE)
+            if hasattr(source, 'seekable') and source.seekable():
+                rewind = source.tell()
+
+        def stored_body():
+            chunks = sizer is not None and chunking.iter_file(source, sizer) or iter(source)
+            if compression.check(compressed) is not None:
+                chunks = compression.compress_chunks(chunks, compressed)
+            # the MD5 is that of the bytes the node stores
+            return upload.StreamBody(chunks, md5=hashlib.md5())
+
+        stored = stored_body()
+        put_urls = list(self.get_node_url(destination, method='PUT'))
+        while len(put_urls) > 0:
+            put_url = put_urls.pop(0)
+            encoding = compression.SUPPORT.accepts(put_url) and content_encoding or None
+            body = upload.StreamBody(encoding is not None and compression.compress_chunks(stored, encoding) or stored,
+                                     throttle=lambda nbytes: self.scheduler.acquire(nbytes, scheduler.UPLOAD, priority))
+            headers = encoding is not None and {'Content-Encoding': encoding} or {}
+            start = time.time()
+            try:
+                with self.nodeCache.volatile(destination):
+                    # a generator is sent with chunked transfer encoding
+                    response = self.conn.session.put(put_url, data=iter(body), headers=headers)
+                    if encoding is not None and response.status_code in compression.ENCODING_NOT_SUPPORTED:
+                        compression.SUPPORT.refuse(put_url)
+                    response.raise_for_status()
+            except Exception as ex:
+                self.invalidate_node_url(destination)
+                if stored.nbytes > 0:
+                    raise OSError(errno.EIO, "PUT to {0} failed after {1} bytes of the stream: {2}".format(
+                        put_url, stored.nbytes, ex))
+                logger.debug("FAILED to PUT to {0}: {1}".format(put_url, ex))
+                continue
+            self.transfer_stats = upload.TransferStats(encoding or upload.CHUNKED, stored.nbytes, time.time() - start,
+                                                       sizer is not None and sizer.size or None)
+            logger.info("PUT {0}: {1}".format(put_url, self.transfer_stats))
+            destination_md5 = self.get_node(destination, limit=0, force=True).props.get('MD5', ZERO_MD5)
+            if destination_md5 != stored.md5.hexdigest():
+                if encoding is not None:
+                    # the endpoint stored the encoded bytes, send them again as they are
+                    compression.SUPPORT.refuse(put_url)
+                    if rewind is not None:
+                        source.seek(rewind)
+                        stored = stored_body()
+                        put_urls.insert(0, put_url)
+                        continue
+                raise OSError(errno.EIO, "MD5 mismatch uploading to {0}: sent {1}, node has {2}".format(
+                    destination, stored.md5.hexdigest(), destination_md5))
+            return send_md5 and destination_md5 or stored.nbytes
+        raise OSError(errno.EFAULT, "Failed uploading to {0}".format(destination))
+
+    @staticmethod
+    def _split_cutout(source):
+        """Split a [ext][x1:x2,y1:y2] or (ra,dec,rad) cutout off the end of a VOSpace source.
+
+        :return: (source, view, cutout) with view 'cutout', or 'data' and a cutout of None.
+        """
+        match = re.search("([^\[\]]*)(\[.*\])$", source)
+        ra_dec_match = re.search("([^\(\)]*)"
+                                 "(?P<cutout>\("
+                                 "(?P<ra>[\-\+]?\d*(\.\d*)?),"
+                                 "(?P<dec>[\-\+]?\d*(\.\d*)?),"
+                                 "(?P<rad>\d*(\.\d*)?)\))$",
+                                 source)
+        if match is not None:
+            return match.group(1), 'cutout', match.group(2)
+        if ra_dec_match is not None:
+            cutout = "CIRCLE ICRS {} {} {}".format(ra_dec_match.group('ra'),
+                                              ra_dec_match.group('dec'),
+                                              ra_dec_match.group('rad'))
+            return ra_dec_match.group(1), 'cutout', cutout
+        return source, 'data', None
+
+    def _vospace_copy(self, source, destination, send_md5=False, priority=scheduler.BULK):
+        """Copy a VOSpace node, or a cutout of it, to another VOSpace location.
+
+        The service is first asked to copy the data itself with a transfer that keeps the source bytes.  If it
+        can not, the data is streamed from a GET of the source straight into a PUT to the destination.
+
+        :return: the MD5 of the destination if send_md5 else its size
+        """
+        source, view, cutout = self._split_cutout(source)
+        source = self.fix_uri(source)
+        destination = self.fix_uri(destination)
+        if view == 'data':
+            start = time.time()
+            try:
+                with self.nodeCache.volatile(destination):
+                    self.transfer_cache.invalidate(destination)
+                    if not self.transfer(source, destination, view='copy'):
+                        raise OSError(errno.EIO, "Server side copy of {0} to {1} failed".format(source, destination))
+            except (OSError, exceptions.HttpException) as ex:
+                if (getattr(ex, 'errno', None) in SERVER_COPY_FATAL or
+                        isinstance(ex, (exceptions.NotFoundException, exceptions.UnauthorizedException,
+                                        exceptions.ForbiddenException))):
+                    raise
+                logger.debug("Server side copy of {0} not possible ({1}), streaming it".format(source, ex))
+            else:
+                node = self.get_node(destination, limit=0, force=True)
+                destination_size = int(node.props.get('length', 0))
+                self.transfer_stats = upload.TransferStats(upload.SERVER_COPY, destination_size,
+                                                           time.time() - start)
+                logger.info("COPY {0} -> {1}: {2}".format(source, destination, self.transfer_stats))
+                return send_md5 and node.props.get('MD5', ZERO_MD5) or destination_size
+        return self._pipe_copy(source, destination, view, cutout, send_md5=send_md5, priority=priority)
+
+    def _pipe_copy(self, source, destination, view='data', cutout=None, send_md5=False, priority=scheduler.BULK):
+        """Stream a GET of source into a PUT to destination, without a local copy, and check the MD5s.
+
+        Each attempt pairs the next GET URL with the next PUT URL, until every URL of both has been tried.
+        """
+        source_md5 = None
+        size = None
+        if view == 'data':
+            source_node = self.get_node(source)
+            source_md5 = source_node.props.get('MD5')
+            size = int(source_node.props.get('length', 0))
+        get_urls = self.endpoint_selector.order(self.get_node_url(source, method='GET', view=view, cutout=cutout))
+        put_urls = self.get_node_url(destination, method='PUT')
+        if not get_urls or not put_urls:
+            raise OSError(errno.EREMOTE, "No URLs to copy {0} -> {1}".format(source, destination))
+
+        def throttle(nbytes):
+            self.scheduler.acquire(nbytes, scheduler.DOWNLOAD, priority)
+            self.scheduler.acquire(nbytes, scheduler.UPLOAD, priority)
+
+        for attempt in range(max(len(get_urls), len(put_urls))):
+            get_url = get_urls[attempt % len(get_urls)]
+            put_url = put_urls[attempt % len(put_urls)]
+            try:
+                start = time.time()
+                response = self.conn.session.get(get_url, stream=True, timeout=self.endpoint_selector.timeout(get_url))
+                response.raise_for_status()
+                self.endpoint_selector.record_latency(get_url, time.time() - start)
+                md5 = hashlib.md5()
+                sizer = chunking.ChunkSizer(COPY_CHUNK, maximum=BUFSIZE)
+                body = upload.StreamBody(chunking.iter_content(response, sizer), size, md5, throttle)
+                with self.nodeCache.volatile(destination):
+                    self.conn.session.put(put_url, data=size is None and iter(body) or body).raise_for_status()
+                elapsed = time.time() - start
+                self.endpoint_selector.record_transfer(get_url, body.nbytes, elapsed)
+                self.transfer_stats = upload.TransferStats(upload.PIPE, body.nbytes, elapsed, sizer.size)
+                logger.info("GET {0} | PUT {1}: {2}".format(get_url, put_url, self.transfer_stats))
+                destination_md5 = self.get_node(destination, limit=0, force=True).props.get('MD5', ZERO_MD5)
+                if destination_md5 != md5.hexdigest() or (source_md5 is not None and source_md5 != destination_md5):
+                    raise OSError(errno.EIO, "MD5 mismatch copying {0} -> {1}: {2} {3} {4}".format(
+                        source, destination, source_md5, md5.hexdigest(), destination_md5))
+                return send_md5 and destination_md5 or body.nbytes
+            except Exception as ex:
+                logger.debug("Failed to copy {0} -> {1}: {2}".format(get_url, put_url, ex))
+                self.endpoint_selector.record_failure(get_url)
+                self.invalidate_node_url(source)
+                self.invalidate_node_url(destination)
+        raise OSError(errno.EFAULT, "Failed copying {0} -> {1}".format(source, destination))
+
+    def get_cutouts(self, cutouts, nthreads=CUTOUT_THREADS, priority=scheduler.BULK):
+        """Fetch many cutouts of a few VOSpace files, each to its own local file.
+
+        Pixel cutouts are requested straight from the data URLs of their node with a cutout parameter, so a
+        node is negotiated once (the URLs are kept in the transfer cache) whatever the number of its cutouts.
+        (ra,dec,rad) cutouts, and pixel cutouts the data URLs would not serve, are negotiated one by one.  The
+        GETs run on a pool of nthreads workers sharing the connections of the session.  Cutouts found in the
+        cutout cache are not requested at all.
+
+        usage:
+            results = client.get_cutouts([('vos:dir/image.fits[1][100:200,100:200]', 'c1.fits'),
+                                          ('vos:dir/image.fits(10.5,-20.1,0.01)', 'c2.fits')])
+
+        :param cutouts: (source, destination) pairs, each source a VOSpace file with a [ext][x1:x2,y1:y2] or
+        (ra,dec,rad) cutout.
+        :param nthreads: maximum number of cutouts fetched at once.
+        :type nthreads: int
+        :param priority: the scheduler priority of the downloads.
+        :return: dictionary of the size written to each destination, or of the exception its cutout raised.
+        :rtype: dict
+        """
+        wanted = []
+        for source, destination in cutouts:
+            uri, view, cutout = self._split_cutout(source)
+            if view != 'cutout':
+                raise OSError(errno.EINVAL, "No cutout in {0}".format(source))
+            wanted.append((self.fix_uri(uri), cutout, destination))
+        if len(wanted) == 0:
+            return {}
+        # the MD5s the cached cutouts are checked against, looked up once per node
+        md5s = {}
+        if self.cutout_cache.enabled:
+            for uri in set([uri for uri, cutout, destination in wanted]):
+                md5s[uri] = self._cutout_md5(uri)
+        nodes = set([uri for uri, cutout, destination in wanted if cutout.startswith('[')])
+        data_urls = self.get_node_urls(nodes, method='GET', view='data', nthreads=nthreads)
+
+        def fetch(item):
+            uri, cutout, destination = item
+            try:
+                cache_key = md5s.get(uri) and self.cutout_cache.key(uri, md5s[uri], cutout) or None
+                if cache_key is not None:
+                    size = self.cutout_cache.get(cache_key, destination)
+                    if size is not None:
+                        return destination, size
+                urls = cutout.startswith('[') and data_urls.get(uri) or None
+                size = self._get_cutout(uri, cutout, destination, urls, priority)
+                if cache_key is not None:
+                    self.cutout_cache.put(cache_key, destination)
+                return destination, size
+            except Exception as ex:
+                logger.debug("Failed to get {0}{1}: {2}".format(uri, cutout, ex))
+                return destination, ex
+
+        pool = ThreadPool(max(1, min(nthreads, len(wanted))))
+        try:
+            return dict(pool.map(fetch, wanted, chunksize=1))
+        finally:
+            pool.close()
+            pool.join()
+
+    def _cutout_md5(self, uri):
+        """The MD5 of the node cutouts of uri are cached for, None if they can not be cached."""
+        try:
+            return self.get_node(uri, limit=0).props.get('MD5')
+        except Exception as ex:
+            logger.debug("Not caching cutouts of {0}: {1}".format(uri, ex))
+            return None
+
+    def _cutout_cache_key(self, uri, cutout):
+        """The cutout cache key of a cutout of uri, None if the cache is disabled or can not hold it."""
+        if not self.cutout_cache.enabled:
+            return None
+        uri = self.fix_uri(uri)
+        md5 = self._cutout_md5(uri)
+        return md5 is not None and self.cutout_cache.key(uri, md5, cutout) or None
+
+    @staticmethod
+    def _cutout_url(url, cutout):
+        """The URL of a cutout of the data at url."""
+        return "{0}{1}{2}".format(url, '?' in url and '&' or '?', urlencode({'cutout': cutout}))
+
+    def _get_cutout(self, uri, cutout, destination, data_urls=None, priority=scheduler.BULK):
+        """Write a cutout of uri to destination, from data_urls if they serve it or else a negotiation of its own.
+
+        :return: the number of bytes written.
+        """
+        if isinstance(data_urls, list) and len(data_urls) > 0:
+            urls = [self._cutout_url(url, cutout) for url in self.endpoint_selector.order(data_urls)]
+            try:
+                return self._fetch(urls, destination, priority)
+            except (IOError, OSError) as ex:
+                logger.debug("Data URLs of {0} do not serve {1} ({2}), negotiating it".format(uri, cutout, ex))
+        urls = self.get_node_url(uri, method='GET', view='cutout', cutout=cutout)
+        try:
+            return self._fetch(self.endpoint_selector.order(urls), destination, priority)
+        except (IOError, OSError):
+            self.transfer_cache.invalidate(uri)
+            raise
+
+    def _fetch(self, urls, destination, priority=scheduler.BULK):
+        """GET the first of urls that answers into destination.
+
+        :return: the number of bytes written.
+        """
+        for url in urls:
+            start = time.time()
+            try:
+                response = self.conn.session.get(url, stream=True, timeout=self.endpoint_selector.timeout(url))
+                response.raise_for_status()
+                self.endpoint_selector.record_latency(url, time.time() - start)
+                sizer = chunking.ChunkSizer(COPY_CHUNK, maximum=BUFSIZE)
+                nbytes = 0
+                with open(destination, 'wb') as fout:
+                    for chunk in chunking.iter_content(response, sizer):
+                        self.scheduler.acquire(len(chunk), scheduler.DOWNLOAD, priority)
+                        fout.write(chunk)
+                        nbytes += len(chunk)
+                self.endpoint_selector.record_transfer(url, nbytes, time.time() - start)
+                logger.info("GET {0}: {1} bytes".format(url, nbytes))
+                return nbytes
+            except (IOError, OSError, exceptions.HttpException) as ex:
+                logger.debug("Failed to get {0}: {1}".format(url, ex))
+                self.endpoint_selector.record_failure(url)
+        raise OSError(errno.EIO, "Failed to get {0}".format(destination))
+
+    def _range_get(self, get_urls, destination, size, md5, nstreams=1, resume=False, priority=scheduler.BULK):
+        """Download a DataNode to destination as byte ranges and check the result against the node MD5.
+
+        :param get_urls: the endpoint URLs of the node data.
+        :param destination: the local file to write.
+        :param size: the size of the node.
+        :param md5: the MD5 of the node.
+        :param nstreams: number of ranges to fetch at the same time.
+        :param resume: use a TransferJournal so only missing ranges are fetched.
+        :param priority: the scheduler priority of the download.
+        :return: the MD5 of the downloaded file
+        """
+        journal = resume and download.TransferJournal(destination, md5, size) or None
+        ranges = download.RangeDownload(self.conn.session, get_urls, destination, size,
+                                        nstreams=nstreams, timeout=self.endpoint_selector.timeout, journal=journal,
+                                        scheduler=self.scheduler, priority=priority)
+        start = time.time()
+        ranges.run()
+        self.transfer_stats = upload.TransferStats(download.RANGES, size, time.time() - start, ranges.sizer.size)
+        logger.info("GET {0}: {1}".format(destination, self.transfer_stats))
+        destination_md5 = md5_cache.MD5_Cache.computeMD5(destination)
+        logger.debug("{0} {1}".format(md5, destination_md5))
+        if journal is not None:
+            # Either complete or corrupt: in both cases the next attempt must not trust the journal.
+            journal.remove()
+        if destination_md5 != md5:
+            raise OSError(errno.EIO, "MD5 mismatch on {0}: {1} != {2}".format(destination, destination_md5, md5))
+        return destination_md5
+
     def fix_uri(self, uri):
         """given a uri check if the authority part is there and if it isn't then add the VOSpace authority
 
@@ -1505,6 +2304,9 @@ class Client(object):
     def get_node(self, uri, limit=0, force=False):
         """connect to VOSpace and download the definition of VOSpace node
 
+        The children listed are held, and cached, as DirEntry objects, their Nodes are made when node_list is
+        first used.  Client.scandir lists a directory holding no more than a page of it.
+
         :param uri:   -- a voSpace node in the format vos:/VOSpaceName/nodeName
         :type uri: str
         :param limit: -- load children nodes in batches of limit
@@ -1520,6 +2322,12 @@ class Client(object):
         node = None
         if not force and uri in self.nodeCache:
             node = self.nodeCache[uri]
+            if isinstance(node, DirEntry):
+                # the entry of a listing, its Node is made when it is first wanted
+                node = node.node()
+                self.nodeCache[uri] = node
+        # the children listed, cached as entries rather than Nodes
+        entries = []
         if node is None:
             logger.debug("Getting node {0} from ws".format(uri))
             with self.nodeCache.watch(uri) as watch:
@@ -1527,12 +2335,15 @@ class Client(object):
                 # using the uri directly, but if this a URL then the metadata
                 # comes from the HTTP header.
                 if uri.startswith('vos:') or uri.startswith('ad:'):
-                    vo_fobj = self.open(uri, os.O_RDONLY, limit=limit)
-                    vo_xml_string = vo_fobj.read().decode('UTF-8')
-                    xml_file = StringIO(vo_xml_string)
-                    xml_file.seek(0)
-                    dom = ElementTree.parse(xml_file)
-                    node = Node(dom.getroot())
+                    # parsed as it is read rather than decoded and parsed as a whole
+                    elements = listing.iter_elements(self.open(uri, os.O_RDONLY, limit=limit))
+                    node = Node(next(elements))
+                    entries = [DirEntry(element) for element in elements]
+                    node.add_entries(entries)
+                    # the attributes count the children
+                    node.setattr()
+                    # a limited listing may be short of some of them
+                    node.listed = limit is None
                 elif uri.startswith('http'):
                     header = self.open(None, url=uri, mode=os.O_RDONLY, head=True)
                     header.read()
@@ -1555,20 +2366,23 @@ class Client(object):
                 # CAN SET LIMIT=0 IN THE CALL Also, if the number of nodes
                 # on the firt call was less than 500, we likely got them
                 # all during the init
-                if limit != 0 and node.isdir() and len(node.node_list) > 500:
+                if limit != 0 and node.isdir() and len(entries) > LISTING_PAGE:
                     next_uri = None
-                    while next_uri != node.node_list[-1].uri:
-                        next_uri = node.node_list[-1].uri
-                        xml_file = StringIO(self.open(uri, os.O_RDONLY, next_uri=next_uri,
-                                                      limit=limit).read().decode('UTF-8'))
-                        xml_file.seek(0)
-                        next_page = Node(ElementTree.parse(xml_file).getroot())
-                        if len(next_page.node_list) > 0 and next_uri == next_page.node_list[0].uri:
-                            next_page.node_list.pop(0)
-                        node.node_list.extend(next_page.node_list)
-        for childNode in node.node_list:
-            with self.nodeCache.watch(childNode.uri) as childWatch:
-                childWatch.insert(childNode)
+                    while next_uri != entries[-1].uri:
+                        next_uri = entries[-1].uri
+                        elements = listing.iter_elements(self.open(uri, os.O_RDONLY, next_uri=next_uri,
+                                                                   limit=limit))
+                        next(elements)
+                        next_page = [DirEntry(element) for element in elements]
+                        if len(next_page) > 0 and next_uri == next_page[0].uri:
+                            next_page.pop(0)
+                        entries.extend(next_page)
+                        node.add_entries(next_page)
+                    node.setattr()
+                    node.listed = True
+        for entry in entries:
+            with self.nodeCache.watch(entry.uri) as childWatch:
+                childWatch.insert(entry)
         return node
 
     def get_node_url(self, uri, method='GET', view=None, limit=None, next_uri=None, cutout=None, full_negotiation=None):
@@ -1592,6 +2406,71 @@ class Client(object):
         """
         uri = self.fix_uri(uri)
 
+        if (method == 'GET' and view in ['data', 'cutout']) or method == 'PUT':
+            # data URLs come from a transfer negotiation, reuse a recent one unless a full negotiation is forced.
+            key = self.transfer_cache.key(uri, method, view, cutout)
+            if not full_negotiation:
+                urls = self.transfer_cache.get(key)
+                if urls is not None:
+                    logger.debug("Reusing URLs negotiated for {0}".format(key))
+                    return urls
+            urls = self._get_node_url(uri, method=method, view=view, limit=limit, next_uri=next_uri,
+                                      cutout=cutout, full_negotiation=full_negotiation)
+            if isinstance(urls, list) and len(urls) > 0:
+                self.transfer_cache.put(key, urls)
+            return urls
+        return self._get_node_url(uri, method=method, view=view, limit=limit, next_uri=next_uri,
+                                  cutout=cutout, full_negotiation=full_negotiation)
+
+    def get_node_urls(self, uris, method='GET', view=None, cutout=None, nthreads=NEGOTIATION_THREADS):
+        """Negotiate the data URLs of many nodes ahead of copying them.
+
+        A VOSpace transfer document names a single target, so the transfers can not be negotiated in one call.
+        Instead the negotiations run concurrently on a pool of nthreads workers.  The URLs are kept in the
+        transfer cache, so a copy of one of the nodes made before they expire uses them without another round
+        trip to the transfer service.
+
+        :param uris: the VOSpace nodes that will be transferred.
+        :type uris: [str]
+        :param method: 'GET' to read the nodes or 'PUT' to write them.
+        :param view: the view of the nodes to GET, usually 'data'.
+        :param cutout: the cutout of the nodes to GET.
+        :param nthreads: maximum number of negotiations running at once.
+        :type nthreads: int
+        :return: dictionary of the URLs negotiated for each uri, or of the exception its negotiation raised.
+        :rtype: dict
+        """
+        if method == 'GET' and view is None:
+            view = 'data'
+        uris = list(uris)
+        if len(uris) == 0:
+            return {}
+
+        def negotiate(uri):
+            try:
+                return uri, self.get_node_url(uri, method=method, view=view, cutout=cutout)
+            except Exception as ex:
+                logger.debug("Failed to negotiate {0} of {1}: {2}".format(method, uri, ex))
+                return uri, ex
+
+        pool = ThreadPool(max(1, min(nthreads, len(uris))))
+        try:
+            return dict(pool.map(negotiate, uris, chunksize=1))
+        finally:
+            pool.close()
+            pool.join()
+
+    def invalidate_node_url(self, uri):
+        """Forget the data URLs negotiated for uri, the next transfer negotiates new ones.
+
+        :param uri: the VOSpace node whose transfer failed.
+        :type uri: str
+        """
+        self.transfer_cache.invalidate(self.fix_uri(uri))
+
+    def _get_node_url(self, uri, method='GET', view=None, limit=None, next_uri=None, cutout=None,
+                      full_negotiation=None):
+        """Negotiate the URL of uri, see get_node_url."""
         if view in ['data', 'cutout'] and method == 'GET':
             node = self.get_node(uri, limit=0)
             if node.islink():
@@ -1736,20 +2615,42 @@ class Client(object):
         logger.debug("Got linkNode URL: {0}".format(url))
         self.conn.session.put(url, data=data, headers={'size': str(size)})
 
-    def move(self, src_uri, destination_uri):
+    def move(self, src_uri, destination_uri, wait=True):
         """Move src_uri to destination_uri.  If destination_uri is a containerNode then move src_uri into destination_uri
 
         :param src_uri: the VOSpace node to be moved.
         :type src_uri: str
         :param destination_uri: the VOSpace location to move to.
         :type destination_uri: str
+        :param wait: wait for the move job to finish, otherwise return a JobFuture of its outcome straight away
+        so that several moves can run at once.
+        :type wait: bool
         :return did the move succeed?
         :rtype bool
         """
         src_uri = self.fix_uri(src_uri)
         destination_uri = self.fix_uri(destination_uri)
-        with self.nodeCache.volatile(src_uri), self.nodeCache.volatile(destination_uri):
-            return self.transfer(src_uri, destination_uri, view='move')
+        self.transfer_cache.invalidate(src_uri)
+        self.transfer_cache.invalidate(destination_uri)
+        if wait:
+            with self.nodeCache.volatile(src_uri), self.nodeCache.volatile(destination_uri):
+                return self.transfer(src_uri, destination_uri, view='move')
+        # the nodes stay volatile until the job is over
+        volatiles = [self.nodeCache.volatile(src_uri), self.nodeCache.volatile(destination_uri)]
+
+        def release(future):
+            for volatile in volatiles:
+                volatile.__exit__(None, None, None)
+
+        for volatile in volatiles:
+            volatile.__enter__()
+        try:
+            future = self.transfer(src_uri, destination_uri, view='move', wait=False)
+        except Exception:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return future
 
     def _get(self, uri, view="defaultview", cutout=None):
         with self.nodeCache.volatile(uri):
@@ -1759,12 +2660,13 @@ class Client(object):
         with self.nodeCache.volatile(uri):
             return self.transfer(uri, "pushToVoSpace", view="defaultview")
 
-    def transfer(self, uri, direction, view=None, cutout=None):
+    def transfer(self, uri, direction, view=None, cutout=None, wait=True):
         """Build the transfer XML document
         :param direction: is this a pushToVoSpace or a pullFromVoSpace ?
         :param uri: the uri to transfer from or to VOSpace.
         :param view: which view of the node (data/default/cutout/etc.) is being transferred
         :param cutout: a special parameter added to the 'cutout' view request. e.g. '[0][1:10,1:10]'
+        :param wait: for a move or a copy (view='copy', direction the destination uri), wait for the job rather than return a JobFuture of its outcome.
         """
         endpoints = self.get_endpoints(uri)
         protocol = {"pullFromVoSpace": "{0}get".format(self.protocol),
@@ -1777,6 +2679,8 @@ class Client(object):
 
         if view == 'move':
             ElementTree.SubElement(transfer_xml, "vos:keepBytes").text = "false"
+        elif view == 'copy':
+            ElementTree.SubElement(transfer_xml, "vos:keepBytes").text = "true"
         else:
             if view == 'defaultview':
                 ElementTree.SubElement(transfer_xml, "vos:view").attrib[
@@ -1811,8 +2715,12 @@ class Client(object):
 
         logging.debug("Got back from transfer URL: %s" % transfer_url)
 
-        # For a move this is the end of the transaction.
-        if view == 'move':
+        # For a move or a copy this is the end of the transaction.
+        if view in ('move', 'copy'):
+            if not wait:
+                job_url = self._job_url(transfer_url)
+                return self.job_monitor.watch(self.conn.session, job_url,
+                                              lambda phase: not self._transfer_outcome(job_url, uri, phase))
             return not self.get_transfer_error(transfer_url, uri)
 
         # for get or put we need the protocol value
@@ -1843,6 +2751,39 @@ class Client(object):
         :param url: The URL of the transfer request that had the error.
         :param uri: The uri that we were trying to transfer (get or put).
         """
+        return self._wait_job(self.watch_transfer(url, uri))
+
+    def watch_transfer(self, url, uri):
+        """Start following the job of a transfer request without waiting for it.
+
+        :param url: The URL of the transfer request.
+        :param uri: The uri that we were trying to transfer (get or put).
+        :return: a JobFuture whose result is what get_transfer_error returns.
+        :rtype: vos.jobs.JobFuture
+        """
+        job_url = self._job_url(url)
+        return self.job_monitor.watch(self.conn.session, job_url,
+                                      lambda phase: self._transfer_outcome(job_url, uri, phase))
+
+    @staticmethod
+    def _job_url(url):
+        return str.replace(url, "/results/transferDetails", "")
+
+    def _wait_job(self, future):
+        """Wait for the outcome of a job, aborting the job on a Ctrl-C."""
+        try:
+            return future.result()
+        except KeyboardInterrupt:
+            # abort the job when receiving a Ctrl-C/Interrupt from the client
+            logging.error("Received keyboard interrupt")
+            self.conn.session.post(future.job_url + "/phase",
+                                   allow_redirects=False,
+                                   data="PHASE=ABORT",
+                                   headers={"Content-type": 'text/text'})
+            raise KeyboardInterrupt
+
+    def _transfer_outcome(self, job_url, uri, phase):
+        """Turn the final phase of a transfer job into False, a link target to follow, or an OSError."""
         error_codes = {'NodeNotFound': errno.ENOENT,
                        'RequestEntityTooLarge': errno.E2BIG,
                        'PermissionDenied': errno.EACCES,
@@ -1855,53 +2796,12 @@ class Client(object):
                        'TransferFailed': errno.EIO,
                        'DuplicateNode.': errno.EEXIST,
                        'NodeLocked': errno.EPERM}
-        job_url = str.replace(url, "/results/transferDetails", "")
-
-        try:
-            phase_url = job_url + "/phase"
-            sleep_time = 1
-            roller = ('\\', '-', '/', '|', '\\', '-', '/', '|')
-            phase = VOFile(phase_url, self.conn, method="GET",
-                           follow_redirect=False).read().decode('utf-8')
-            # do not remove the line below. It is used for testing
-            logging.debug("Job URL: " + job_url + "/phase")
-            while phase in ['PENDING', 'QUEUED', 'EXECUTING', 'UNKNOWN']:
-                # poll the job. Sleeping time in between polls is doubling
-                # each time until it gets to 32sec
-                total_time_slept = 0
-                if sleep_time <= 32:
-                    sleep_time *= 2
-                slept = 0
-                if logger.getEffectiveLevel() == logging.INFO:
-                    while slept < sleep_time:
-                        sys.stdout.write("\r%s %s" % (phase,
-                                                      roller[total_time_slept % len(roller)]))
-                        sys.stdout.flush()
-                        slept += 1
-                        total_time_slept += 1
-                        time.sleep(1)
-                    sys.stdout.write("\r                    \n")
-                else:
-                    time.sleep(sleep_time)
-                phase = self.conn.session.get(phase_url, allow_redirects=False).text
-                logging.debug("Async transfer Phase for url %s: %s " % (url, phase))
-        except KeyboardInterrupt:
-            # abort the job when receiving a Ctrl-C/Interrupt from the client
-            logging.error("Received keyboard interrupt")
-            self.conn.session.post(job_url + "/phase",
-                                   allow_redirects=False,
-                                   data="PHASE=ABORT",
-                                   headers={"Content-type": 'text/text'})
-            raise KeyboardInterrupt
-        status = VOFile(phase_url, self.conn, method="GET",
-                        follow_redirect=False).read().decode('UTF-8')
-
-        logger.debug("Phase:  {0}".format(status))
-        if status in ['COMPLETED']:
+        logger.debug("Phase:  {0}".format(phase))
+        if phase in ['COMPLETED']:
             return False
-        if status in ['HELD', 'SUSPENDED', 'ABORTED']:
+        if phase in ['HELD', 'SUSPENDED', 'ABORTED']:
             # re-queue the job and continue to monitor for completion.
-            raise OSError("UWS status: {0}".format(status), errno.EFAULT)
+            raise OSError("UWS status: {0}".format(phase), errno.EFAULT)
         error_url = job_url + "/error"
         error_message = self.conn.session.get(error_url).text
         logger.debug("Got transfer error {0} on URI {1}".format(error_message, uri))
@@ -2006,7 +2906,47 @@ class Client(object):
                 raise OSError(errno.EREMOTE)
 
         return VOFile(url, self.conn, method=method, size=size, byte_range=byte_range,
-                      possible_partial_read=possible_partial_read)
+                      possible_partial_read=possible_partial_read, selector=self.endpoint_selector,
+                      scheduler=self.scheduler)
+
+    def open_reader(self, uri, view='data', cutout=None, end=None, buffer_size=reader.BUFFER_SIZE,
+                    readahead=reader.READAHEAD):
+        """Open the data of a node as a seekable, buffered binary file.
+
+        Unlike the VOFile returned by open, the file reconnects with a Range after a seek, reads ahead in the
+        background and resumes a broken read from the next URL of the transfer.
+
+        usage:
+            with client.open_reader('vos:dir/image.fits') as fin:
+                fin.seek(2880)
+                block = fin.read(2880)
+
+        :param uri: the VOSpace DataNode to read.
+        :type uri: str
+        :param view: 'data' or 'cutout'.
+        :param cutout: the cutout to read, for view='cutout'.
+        :param end: stop reading at this offset.
+        :type end: int, None
+        :param buffer_size: size of the buffer of the returned reader, 0 for an unbuffered DataReader.
+        :param readahead: bytes read in the background ahead of the caller, 0 to disable.
+        :rtype: io.BufferedReader
+        """
+        uri = self.fix_uri(uri)
+        urls = self.get_node_url(uri, method='GET', view=view, cutout=cutout)
+        if not urls:
+            raise OSError(errno.EREMOTE, "No URL to read {0} from".format(uri))
+        if not isinstance(urls, list):
+            urls = [urls]
+
+        def renegotiate():
+            return self.get_node_url(uri, method='GET', view=view, cutout=cutout, full_negotiation=True)
+
+        raw = reader.DataReader(self.conn.session, urls, renegotiate=renegotiate,
+                                selector=self.endpoint_selector, scheduler=self.scheduler,
+                                readahead=readahead, end=end)
+        if buffer_size == 0:
+            return raw
+        return io.BufferedReader(raw, buffer_size)
 
     def add_props(self, node):
         """Given a node structure do a POST of the XML to the VOSpace to
@@ -2047,7 +2987,7 @@ class Client(object):
                 data=data, headers={'size': str(size)}).content)
         #return Node(root)
 
-    def update(self, node, recursive=False):
+    def update(self, node, recursive=False, wait=True):
         """Updates the node properties on the server. For non-recursive
            updates, node's properties are updated on the server. For
            recursive updates, node should only contain the properties to
@@ -2055,6 +2995,8 @@ class Client(object):
 
            :param node: the node to update.
            :param recursive: should this update be applied to all children? (True/False)
+           :param wait: wait for a recursive update job to finish, otherwise return a JobFuture of
+           its outcome straight away. (True/False)
            """
         # Let's do this update using the async transfer method
         url = self.get_node_url(node.uri)
@@ -2081,12 +3023,20 @@ class Client(object):
                                    allow_redirects=False,
                                    data="PHASE=RUN",
                                    headers={'Content-type': "text/text"})
+            if not wait:
+                job_url = self._job_url(transfer_url)
+                return self.job_monitor.watch(self.conn.session, job_url,
+                                              lambda phase: self._transfer_outcome(job_url, node.uri, phase) or 0)
             self.get_transfer_error(transfer_url, node.uri)
         else:
             resp = self.conn.session.post(url,
                                           data=str(node),
                                           allow_redirects=False)
             logger.debug("update response: {0}".format(resp.content))
+            if not wait:
+                future = jobs.JobFuture(url)
+                future.set_result(0)
+                return future
         return 0
 
     def mkdir(self, uri):
@@ -2114,6 +3064,7 @@ class Client(object):
         """
         uri = self.fix_uri(uri)
         logger.debug("delete {0}".format(uri))
+        self.transfer_cache.invalidate(uri)
         with self.nodeCache.volatile(uri):
             url = self.get_node_url(uri, method='GET')
             response = self.conn.session.delete(url)
@@ -2126,17 +3077,23 @@ class Client(object):
         info_list = {}
         uri = self.fix_uri(uri)
         logger.debug(str(uri))
-        node = self.get_node(uri, limit=None)
+        elements = self._listing(uri)
+        node = Node(next(elements))
         logger.debug(str(node))
         while node.type == "vos:LinkNode":
             uri = node.target
+            # the listing of the link is done with, its response goes back to the pool
+            elements.close()
             try:
-                node = self.get_node(uri, limit=None)
+                elements = self._listing(uri)
+                node = Node(next(elements))
             except Exception as e:
                 logger.error(str(e))
+                elements = iter([])
                 break
-        for thisNode in node.node_list:
-            info_list[thisNode.name] = thisNode.get_info()
+        for element in elements:
+            entry = DirEntry(element)
+            info_list[entry.name] = entry.get_info()
         if node.type in ["vos:DataNode", "vos:LinkNode"]:
             info_list[node.name] = node.get_info()
         return info_list.items()
@@ -2151,17 +3108,129 @@ class Client(object):
         :param uri: The ContainerNode to get a listing of.
         :rtype [str]
         """
-        # logger.debug("getting a listing of %s " % (uri))
-        names = []
         logger.debug(str(uri))
-        node = self.get_node(uri, limit=None, force=force)
-        while node.type == "vos:LinkNode":
-            uri = node.target
-            # logger.debug(uri)
-            node = self.get_node(uri, limit=None, force=force)
-        for thisNode in node.node_list:
-            names.append(thisNode.name)
-        return names
+        return [child.name for child in self.iterdir(uri, force=force)]
+
+    def iterdir(self, uri, page_size=None, force=False):
+        """Yield the children of a ContainerNode page by page, as they are read from the listing.
+
+        Unlike get_node(uri, limit=None) the listing is never held as a whole: each child is parsed, put in
+        the node cache and handed over as it arrives, so the first ones can be used after one round trip
+        while the rest of a large directory is still being read.  Follows LinkNodes to their destination
+        location, the children of anything else than a ContainerNode are none.
+
+        usage:
+            for child in client.iterdir('vos:dir', page_size=1000):
+                print(child.name, child.props.get('length'))
+
+        :param uri: The ContainerNode to list.
+        :param page_size: the children to ask for per request, None for as many as the service returns.
+        :type page_size: int
+        :param force: don't use a cached listing, retrieve it from the service.
+        :rtype: iterator of Node
+        """
+        uri = self.fix_uri(uri)
+        cached = self.nodeCache[uri]
+        if not force and isinstance(cached, Node) and cached.listed and not cached.islink():
+            for child in cached.iter_children():
+                yield child
+            return
+        elements = self._children(uri, page_size)
+        next(elements)
+        for element in elements:
+            child = Node(element)
+            with self.nodeCache.watch(child.uri) as watch:
+                watch.insert(child)
+            yield child
+
+    def scandir(self, uri, page_size=None):
+        """Yield a DirEntry for each child of a ContainerNode, as they are read from the listing.
+
+        A DirEntry holds the type, size, MD5, date, permissions and target of the child, it is much cheaper to
+        make and to keep than a Node and is not cached: listing a directory this way takes memory for a page of
+        the listing only.  Follows LinkNodes to their destination location.
+
+        usage:
+            for entry in client.scandir('vos:dir'):
+                if not entry.isdir():
+                    print(entry.name, entry.size, entry.md5)
+
+        :param uri: The ContainerNode to list.
+        :param page_size: the children to ask for per request, None for as many as the service returns.
+        :type page_size: int
+        :raises OSError: ENOTDIR if uri is not a ContainerNode.
+        :rtype: iterator of DirEntry
+        """
+        elements = self._children(self.fix_uri(uri), page_size)
+        node = next(elements)
+        if not node.isdir():
+            raise OSError(errno.ENOTDIR, "Not a directory: {0}".format(uri))
+        for element in elements:
+            yield DirEntry(element)
+
+    def get_attr(self, uri, force=False):
+        """The stat attributes of a Node, see Node.attr.
+
+        They are worked out from the DirEntry of the node when it is cached, rather than from its Node.
+
+        :param uri: the node to get the attributes of.
+        :param force: don't use a cached entry or Node, retrieve the node from the service.
+        :rtype: dict
+        """
+        cached = self.nodeCache[self.fix_uri(uri)]
+        if not force and isinstance(cached, DirEntry):
+            return cached.attr
+        return self.get_node(uri, limit=0, force=force).attr
+
+    def _children(self, uri, page_size=None):
+        """Yield the Node uri resolves to, following LinkNodes, then the elements of its children."""
+        elements = self._listing(uri, page_size)
+        node = Node(next(elements))
+        while node.islink() and node.target is not None and node.target[0:4] == "vos:":
+            elements.close()
+            elements = self._listing(node.target, page_size)
+            node = Node(next(elements))
+        yield node
+        for element in elements:
+            yield element
+
+    def _listing(self, uri, page_size=None):
+        """Yield the element of node uri, then those of its children as they are parsed, page after page.
+
+        :param uri: the node to list.
+        :param page_size: the children to ask for per request, None for as many as the service returns.
+        """
+        next_uri = None
+        while True:
+            limit = page_size
+            if page_size is not None and next_uri is not None:
+                # a page starts with the last child of the previous one
+                limit = page_size + 1
+            vo_fobj = self.open(uri, os.O_RDONLY, limit=limit, next_uri=next_uri)
+            try:
+                elements = listing.iter_elements(vo_fobj)
+                root = next(elements)
+                if next_uri is None:
+                    yield root
+                count = 0
+                last_uri = next_uri
+                for element in elements:
+                    child_uri = element.get('uri')
+                    if child_uri == next_uri:
+                        continue
+                    count += 1
+                    last_uri = child_uri
+                    yield element
+            finally:
+                if vo_fobj.resp is not None:
+                    vo_fobj.resp.close()
+            if page_size is None:
+                more = count > 0 and (next_uri is not None or count > LISTING_PAGE)
+            else:
+                more = count == page_size
+            if not more:
+                return
+            next_uri = last_uri
 
     def _node_type(self, uri):
         """